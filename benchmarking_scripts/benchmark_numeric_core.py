@@ -0,0 +1,90 @@
+"""
+Time unit-carrying gwpy/astropy operations against the plain numpy
+versions that simulation and recovery now use internally.
+
+python benchmarking_scripts/benchmark_numeric_core.py [duration] [nstations]
+"""
+from __future__ import division
+import sys
+import time
+import numpy as np
+import astropy.units as u
+from seispy.trace import Trace
+from seispy.station import SeismometerArray, homestake
+from seispy.station.stationdata import _fast_trace, _add_values
+from seispy.utils import csd_matrix
+
+duration = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+nstations = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+Fs = 100
+nrepeat = 3
+chans = ['HHE', 'HHN', 'HHZ']
+
+
+def timeit(func):
+    best = np.inf
+    for ii in range(nrepeat):
+        t0 = time.time()
+        func()
+        best = min(best, time.time() - t0)
+    return best
+
+
+def report(label, old, new):
+    print '%-40s %8.4f s %8.4f s %6.1fx' % (label, old, new, old / new)
+
+np.random.seed(0)
+Nsamps = int(duration * Fs)
+amps = [np.random.randn(Nsamps) for ii in range(3 * nstations)]
+final_times = np.arange(0, duration, 1 / Fs)
+print '%d stations, %d s at %d Hz' % (nstations, duration, Fs)
+print '%-40s %10s %10s %7s' % ('', 'units', 'numpy', 'speedup')
+
+# building traces for simulated data
+old = timeit(lambda: [0.5 * Trace(amp, sample_rate=Fs, times=final_times,
+                                  unit=u.m) for amp in amps])
+new = timeit(lambda: [_fast_trace(0.5 * amp, Fs, [0, 0, 0]) for amp in amps])
+report('simulated traces', old, new)
+
+# summing injections into an array
+trs = [Trace(amp, sample_rate=Fs, unit=u.m) for amp in amps]
+others = [Trace(amp, sample_rate=Fs, unit=u.m) for amp in amps]
+
+
+def quantity_add():
+    for tr, other in zip(trs, others):
+        tr += other
+
+
+def value_add():
+    for tr, other in zip(trs, others):
+        _add_values(tr, other)
+old = timeit(quantity_add)
+new = timeit(value_add)
+report('adding arrays', old, new)
+
+# cross spectra between every channel at 1 Hz
+data = np.vstack(amps)
+ts = [Trace(amp, sample_rate=Fs, unit=u.m) for amp in amps[:6]]
+
+
+def gwpy_csds():
+    for tr1 in ts:
+        for tr2 in ts:
+            tr1.csd(tr2, fftlength=2, overlap=1)[2].value
+
+
+def numpy_csds():
+    csd_matrix(data[:6], Fs, 2, overlap=1)[0][2]
+old = timeit(gwpy_csds)
+new = timeit(numpy_csds)
+report('csds between 6 channels', old, new)
+
+# whole simulation
+stations = homestake()
+stations = dict((key, stations[key]) for key in stations.keys()[:nstations])
+arr = SeismometerArray.initialize_all_good(stations, duration,
+                                           chans_type='fast_chans')
+t0 = time.time()
+arr.add_p_wave(1e-6, np.pi / 3, np.pi / 2, 1, duration)
+print 'p-wave injection into whole array: %.4f s' % (time.time() - t0)
@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 from seispy.station.stationdata import SeismometerArray
 from seispy.station import StationArray, spiral, homestake
 from seispy.seispy_io import read_config, print_params
+from seispy.utils.orfcache import ORFCache
 import astropy.units as u
 import os
 import numpy as np
@@ -92,6 +93,12 @@ def main(params):
     thetas = np.arange(thetamesh, 180+thetamesh, thetamesh) * np.pi / 180
     phis = np.arange(phimesh, 360+phimesh, phimesh) * np.pi / 180
 
+    # share orfs between runs with the same configuration
+    if params['Recovery'].get('orf_cache_dir'):
+        orf_cache = ORFCache(cache_dir=params['Recovery']['orf_cache_dir'])
+    else:
+        orf_cache = None
+
     # do recovery
     maps, phis, thetas =\
             data.recovery_matrices(
@@ -106,7 +113,8 @@ def main(params):
                 iter_lim=2000,
                 nproc=int(params['Recovery']['nproc']),
                 alpha=float(params['Recovery']['alpha']),
-                epsilon=float(params['Recovery']['epsilon']))
+                epsilon=float(params['Recovery']['epsilon']),
+                orf_cache=orf_cache)
 
     recovered_parameters = {}
     for rec in maps.keys():
@@ -19,11 +19,24 @@ class RecoveryMapAxes(AitoffAxes):
         super(RecoveryMapAxes, self).__init__(*args, **kwargs)
 
     def add_map(self, rec_map):
+        if getattr(rec_map, 'grid', None) is not None:
+            return self.add_pixel_map(rec_map)
         dtheta = rec_map.thetas[1] - rec_map.thetas[0]
         dphi = rec_map.phis[1] - rec_map.phis[0]
-        self.pcolormesh(rec_map.phis - np.pi - dphi/2, np.pi / 2 - rec_map.thetas + dtheta/2, rec_map.data.T,
+        return self.pcolormesh(rec_map.phis - np.pi - dphi/2, np.pi / 2 - rec_map.thetas + dtheta/2, rec_map.data.T,
         cmap='viridis')
 
+    def add_pixel_map(self, rec_map):
+        """
+        draw a map on a general sky grid (e.g. equal-area pixels),
+        one marker per pixel
+        """
+        # scale markers to pixel size
+        size = 8 * np.pi / rec_map.grid.npix * (180 / np.pi)**2
+        return self.scatter(rec_map.phis - np.pi, np.pi / 2 - rec_map.thetas,
+                c=rec_map.data.flatten(), s=size, marker='s',
+                edgecolors='none', cmap='viridis')
+
 register_projection(RecoveryMapAxes)
 
 class RecoveryMapPlot(Plot):
@@ -33,8 +46,6 @@ class RecoveryMapPlot(Plot):
     _DefaultAxesClass = RecoveryMapAxes
     def __init__(self, recovery_map, **kwargs):
         super(RecoveryMapPlot, self).__init__(**kwargs)
-        dtheta = recovery_map.thetas[1] - recovery_map.thetas[0]
-        dphi = recovery_map.phis[1] - recovery_map.phis[0]
         try:
             conf = kwargs.pop('conf')
         except KeyError:
@@ -51,6 +62,13 @@ class RecoveryMapPlot(Plot):
         ax.tick_params(axis='x',colors='white')
         cbar = self.add_colorbar(label=r'amplitude [$\textrm{m}^2$]')
         cbar.ax.tick_params(labelsize=10)
+        if getattr(recovery_map, 'grid', None) is not None:
+            ax.tricontour(recovery_map.phis - np.pi,
+                          np.pi / 2 - recovery_map.thetas, conf_map,
+                          colors='k', linewidth=4, levels=[0])
+            return
+        dtheta = recovery_map.thetas[1] - recovery_map.thetas[0]
+        dphi = recovery_map.phis[1] - recovery_map.phis[0]
         ax.contour(recovery_map.phis - np.pi - dphi/2, np.pi / 2 - recovery_map.thetas + dtheta / 2,
                    conf_map.T, colors='k', linewidth=4, levels=[0])
 
@@ -7,14 +7,30 @@ import matplotlib.pyplot as plt
 
 class RecoveryMap(object):
     """
-    recovery map"""
-    def __init__(self, data, thetas, phis, maptype):
+    recovery map
+
+    Maps on a theta/phi mesh have shape (n_phi, n_theta). Maps on
+    any other :class:`seispy.utils.skygrid.SkyGrid` (e.g. an
+    equal-area grid) have one value per pixel, and `thetas` and
+    `phis` are the angles of each pixel.
+    """
+    def __init__(self, data, thetas, phis, maptype, grid=None):
         super(RecoveryMap, self).__init__()
+        if grid is not None and grid.is_mesh:
+            grid = None
         self.data = data
         self.thetas = thetas
         self.phis = phis
         self.maptype = maptype
-        if self.maptype=='r':
+        self.grid = grid
+        if self.maptype=='r' and grid is not None:
+            # only pixels on the equator are recovered
+            idx = np.where(grid.thetas==np.pi / 2.)[0]
+            self.data = self.data.flatten()[idx]
+            self.grid = grid.subset(idx)
+            self.thetas = self.grid.thetas
+            self.phis = self.grid.phis
+        elif self.maptype=='r':
             idx = np.where(thetas==np.pi / 2.)
             self.data = self.data[:,idx[0]]
             self.thetas=np.asarray([np.pi / 2.])
@@ -23,6 +39,8 @@ class RecoveryMap(object):
         """
         get confidence contour
         """
+        if self.grid is not None:
+            return self._get_pixel_contour(conf)
         map_shape=self.data.shape
         flat_map = self.data.flatten().squeeze()
         flat_map[flat_map < 0] = 0
@@ -44,6 +62,26 @@ class RecoveryMap(object):
         max_theta = np.max(THETAS[map_conf.T>0])
         return map_conf, [min_phi, phi_rec[0], max_phi],[min_theta, theta_rec, max_theta]
 
+    def _get_pixel_contour(self, conf):
+        """
+        confidence region for maps on a general sky grid
+        """
+        flat_map = self.data.flatten().squeeze()
+        flat_map[flat_map < 0] = 0
+        args = np.argsort(flat_map)[::-1]
+        cdf = flat_map[args].cumsum()
+        cdf = cdf/cdf[-1]
+        conf_args = args[cdf<conf]
+        map_conf = np.zeros(cdf.size)
+        map_conf[conf_args]=1
+        phi_rec = self.phis[flat_map == np.max(flat_map)]
+        theta_rec = self.thetas[flat_map == np.max(flat_map)]
+        min_phi = np.min(self.phis[map_conf>0])
+        max_phi = np.max(self.phis[map_conf>0])
+        min_theta = np.min(self.thetas[map_conf>0])
+        max_theta = np.max(self.thetas[map_conf>0])
+        return map_conf, [min_phi, phi_rec[0], max_phi],[min_theta, theta_rec, max_theta]
+
     def power_in_conf(self, conf):
         """
         get power in confidence region
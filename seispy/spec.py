@@ -2,7 +2,12 @@ from gwpy.frequencyseries import FrequencySeries
 import numpy as np
 
 
-class Spec(Spectrum):
+class Spec(FrequencySeries):
+    """
+    class for (one-sided) spectra of seismic data, inherited
+    from gwpy FrequencySeries
+    """
+
     def whiten(self, width=1):
         """
         whitens spectrum by getting a smoothed version of the
@@ -39,16 +44,16 @@ class Spec(Spectrum):
             Smoothed time series trace.
         """
 
-        S = np.abs(self)
+        S = np.abs(self.value)
 
         # turn width into # of samples
-        width = width * (1 / S.df.value)
+        width = int(width * (1 / self.df.value))
 
         # get window
         window = np.ones((2 * width))
 
         # do convolution
         S = np.convolve(S, window / (2 * width), 'same')
-        S = Spec(S)
-        S.__dict__ = self.copy_metadata()
+        S = Spec(S, f0=self.f0, df=self.df, name=self.name,
+                 epoch=self.epoch)
         return S
@@ -1,2 +1,4 @@
 from .station import *
 from .stationdata import *
+from .accumulator import *
+from .multichannel import *
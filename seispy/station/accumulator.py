@@ -0,0 +1,121 @@
+from __future__ import division
+from collections import OrderedDict
+import numpy as np
+from ..utils import (design_matrix, pair_csds, lsqr_info, solve_lsqr,
+        recovery_bins)
+from .stationdata import _recovery_maps
+
+
+class RecoveryAccumulator(object):
+    """
+    Incremental sky-map recovery over successive stretches of data.
+
+    The design matrix only depends on geometry, so it (and
+    :math:`\Re(G^\dagger G)`) is built once. Each chunk of data passed
+    to :meth:`update` adds its cross-spectra at the recovery frequency
+    to running per-pair averages, weighted by the number of FFT segments
+    in the chunk, and then the chunk can be thrown away. A map for
+    everything seen so far is available at any point from
+    :meth:`recovery_maps`.
+
+    Segments that would straddle two chunks are not used, so
+    chunks should be much longer than `fftlength`.
+
+    >>> acc = RecoveryAccumulator('p', station_locs, 1, [5700])
+    >>> for st in range(start, end, 3600):
+    ...     acc.update(SeismometerArray.fetch_data(st, st + 3600, ...))
+    >>> maps, phis, thetas = acc.recovery_maps()
+    """
+    def __init__(self, rec_str, station_locs, recovery_freq, v_list,
+            autocorrelations=True, epsilon=0.1, alpha=1000, channels=None,
+            phis=None, thetas=None, fftlength=2, overlap=1, grid=None):
+        super(RecoveryAccumulator, self).__init__()
+        if channels is None:
+            channels = ['HHE','HHN','HHZ']
+        if thetas is None:
+            thetas = np.arange(3,180,6) * np.pi / 180
+        if phis is None:
+            phis = np.arange(3,360,6) * np.pi / 180
+        if grid is not None:
+            thetas, phis = grid.map_axes()
+        self.rec_str = rec_str
+        self.recovery_freq = recovery_freq
+        self.channels = channels
+        self.thetas = thetas
+        self.phis = phis
+        self.grid = grid
+        self.fftlength = fftlength
+        self.overlap = overlap
+        self.G, self.pairs, self.shapes = design_matrix(rec_str,
+                OrderedDict(station_locs), recovery_freq, v_list,
+                channels=channels, thetas=thetas, phis=phis, epsilon=epsilon,
+                alpha=alpha, autocorrelations=autocorrelations, grid=grid)
+        self.GG = np.real(np.dot(np.conj(self.G).T, self.G))
+        self.nsegs = 0
+        self._Ysum = np.zeros(len(self.pairs), dtype=complex)
+        # convergence information from the last solve
+        self.info = None
+
+    @property
+    def Y(self):
+        """
+        running average of the cross-spectra, one per pair
+        """
+        if self.nsegs == 0:
+            raise ValueError('No data has been added yet')
+        return self._Ysum / self.nsegs
+
+    @property
+    def GY(self):
+        """
+        :math:`\Re(G^\dagger Y)` for the data seen so far
+        """
+        return np.real(np.dot(np.conj(self.G).T, self.Y))
+
+    def update(self, data):
+        """
+        add a chunk of data to the running averages
+
+        Parameters
+        ----------
+        data : :class:`seispy.station.stationdata.SeismometerArray`
+            data for every station in `station_locs`
+        """
+        csdm = data.csd_matrix(channels=self.channels,
+                fftlength=self.fftlength, overlap=self.overlap,
+                frequencies=recovery_bins(self.recovery_freq, self.fftlength))
+        Y = pair_csds(csdm, self.pairs, self.recovery_freq)
+        self._Ysum += Y * csdm.nsegs
+        self.nsegs += csdm.nsegs
+
+    def recovery_maps(self, iter_lim=1000, atol=1e-6, btol=1e-6,
+            warm_start=True):
+        """
+        recover maps from everything added so far. Convergence
+        information ends up in `info`.
+
+        Parameters
+        ----------
+        warm_start : `bool`, optional, default=True
+            start from the solution of the last call, which is
+            usually close to the new one
+
+        Returns
+        -------
+        maps : `dict`
+            :class:`seispy.recoverymap.RecoveryMap` for each
+            polarization, keyed by 'p', 's1', 's2', 'r'
+        phis : `numpy.ndarray`
+            phi values
+        thetas : `numpy.ndarray`
+            theta values
+        """
+        x0 = None
+        if warm_start and self.info is not None:
+            x0 = self.info['x']
+        S = solve_lsqr(self.GG, self.GY, iter_lim=iter_lim, atol=atol,
+                btol=btol, x0=x0)
+        self.info = lsqr_info(S)
+        maps = _recovery_maps(S[0], self.rec_str, self.shapes, self.thetas,
+                self.phis, grid=self.grid)
+        return maps, self.phis, self.thetas
@@ -0,0 +1,213 @@
+from __future__ import division
+from collections import OrderedDict
+import numpy as np
+import astropy.units as u
+from scipy.signal import zpk2sos, sosfiltfilt
+from gwpy.signal import filter_design
+from ..trace import Trace
+from ..utils.spectral import CSDMatrix
+
+__all__ = ['ChannelArray']
+
+
+class ChannelArray(object):
+    """
+    Several channels with the same sample rate stored as one
+    contiguous [channel, sample] array.
+
+    A :class:`seispy.station.stationdata.Seismometer` keeps a
+    separate :class:`seispy.trace.Trace` (with its own metadata and
+    units) for every channel. Packing channels into one array means
+    filtering, injections and spectral estimates are done for every
+    channel in one vectorized call. Individual channels come back
+    out as `Trace` objects on demand.
+
+    >>> arr = ChannelArray.from_traces(seismometer)
+    >>> arr.inject(direction[:, None] * signal)
+    >>> arr = arr.bandpass(0.1, 10)
+    >>> seismometer.update(arr.to_traces())
+
+    Parameters
+    ----------
+    value : `numpy.ndarray`
+        [channel, sample] array of data
+    channels : `list`
+        channel names, one for each row of `value`
+    sample_rate : `float`
+        sample rate in Hz
+    t0 : `float`, optional, default=0
+        time of first sample
+    unit : `astropy.units.Unit`, optional
+        unit of data
+    names : `list`, optional
+        name of each channel's `Trace`
+    location : `numpy.ndarray`, optional
+        location of seismometer
+    """
+    def __init__(self, value, channels, sample_rate, t0=0, unit=None,
+            names=None, location=None):
+        super(ChannelArray, self).__init__()
+        value = np.atleast_2d(np.asarray(value, dtype=float))
+        channels = list(channels)
+        if value.shape[0] != len(channels):
+            raise ValueError('Need one channel name for each row of value')
+        self.value = np.ascontiguousarray(value)
+        self.channels = channels
+        self.sample_rate = float(sample_rate)
+        self.t0 = t0
+        self.unit = unit
+        if names is None:
+            names = [None] * len(channels)
+        self.names = list(names)
+        self.location = location
+        self._index = dict((chan, ii) for ii, chan in enumerate(channels))
+
+    @classmethod
+    def from_traces(cls, traces, channels=None):
+        """
+        pack traces into one array
+
+        Parameters
+        ----------
+        traces : `dict`
+            :class:`seispy.trace.Trace` for each channel, e.g. a
+            :class:`seispy.station.stationdata.Seismometer`
+        channels : `list`, optional
+            channels to use. Defaults to HHE, HHN, HHZ.
+
+        Returns
+        -------
+        arr : :class:`seispy.station.multichannel.ChannelArray`
+            array of channels
+        """
+        if channels is None:
+            channels = ['HHE', 'HHN', 'HHZ']
+        trs = [traces[chan] for chan in channels]
+        sample_rates = set([tr.sample_rate.value for tr in trs])
+        sizes = set([tr.size for tr in trs])
+        if len(sample_rates) > 1 or len(sizes) > 1:
+            raise ValueError('All channels must have the same sample rate '
+                             'and duration to be put in one array')
+        return cls(np.vstack([tr.value for tr in trs]), channels,
+                   sample_rates.pop(), t0=trs[0].t0.value, unit=trs[0].unit,
+                   names=[tr.name for tr in trs],
+                   location=getattr(trs[0], 'location', None))
+
+    def index(self, chan):
+        """
+        row of channel `chan`
+        """
+        try:
+            return self._index[chan]
+        except KeyError:
+            raise KeyError('%s is not in this array' % str(chan))
+
+    def __getitem__(self, chan):
+        """
+        :class:`seispy.trace.Trace` for one channel. Data are
+        copied so that the trace doesn't share memory with the array.
+        """
+        ii = self.index(chan)
+        tr = Trace(self.value[ii].copy(), sample_rate=self.sample_rate * u.Hz,
+                   t0=self.t0, unit=self.unit, name=self.names[ii])
+        if self.location is not None:
+            tr.location = self.location
+        return tr
+
+    def __len__(self):
+        return len(self.channels)
+
+    def to_traces(self):
+        """
+        unpack into traces
+
+        Returns
+        -------
+        traces : `collections.OrderedDict`
+            :class:`seispy.trace.Trace` for each channel
+        """
+        return OrderedDict((chan, self[chan]) for chan in self.channels)
+
+    def copy(self, value=None):
+        """
+        copy of this array, optionally with new data
+        """
+        if value is None:
+            value = self.value.copy()
+        return ChannelArray(value, self.channels, self.sample_rate,
+                            t0=self.t0, unit=self.unit, names=self.names,
+                            location=self.location)
+
+    def inject(self, data, channels=None):
+        """
+        add data to channels in place
+
+        Parameters
+        ----------
+        data : `numpy.ndarray`
+            data to add. Broadcast against the [channel, sample]
+            array of the channels being injected into, so a
+            single time series is added to every channel.
+        channels : `list`, optional
+            channels to inject into. Defaults to all of them.
+        """
+        if channels is None:
+            self.value += data
+        else:
+            idxs = [self.index(chan) for chan in channels]
+            self.value[idxs] += data
+
+    def bandpass(self, flow, fhigh, gpass=2, gstop=30, fstop=None,
+            type='iir'):
+        """
+        bandpass every channel at once. Uses the same
+        (zero-phase) filter as :meth:`seispy.trace.Trace.bandpass`.
+
+        Parameters
+        ----------
+        flow : `float`
+            lower corner frequency of pass band
+        fhigh : `float`
+            upper corner frequency of pass band
+
+        Returns
+        -------
+        arr : :class:`seispy.station.multichannel.ChannelArray`
+            bandpassed channels
+        """
+        filt = filter_design.bandpass(flow, fhigh, self.sample_rate,
+                                      fstop=fstop, gpass=gpass, gstop=gstop,
+                                      analog=False, type=type)
+        form, filt = filter_design.parse_filter(filt,
+                                                sample_rate=self.sample_rate)
+        if form != 'zpk':
+            raise ValueError('Only zpk filters are supported')
+        sos = zpk2sos(*filt)
+        # no padding, like gwpy
+        return self.copy(sosfiltfilt(sos, self.value, axis=-1, padlen=0))
+
+    def csd_matrix(self, fftlength=2, overlap=1, window='hann',
+            average=True):
+        """
+        cross spectral density matrix between every pair of channels
+
+        Parameters
+        ----------
+        fftlength : `float`, optional, default=2
+            length of segments in seconds
+        overlap : `float`, optional, default=1
+            overlap between segments in seconds
+        window : `str`, optional, default='hann'
+            window to apply to each segment
+        average : `bool`, optional, default=True
+            average over segments
+
+        Returns
+        -------
+        csdm : :class:`seispy.utils.spectral.CSDMatrix`
+            CSD matrix indexed by channel name
+        """
+        return CSDMatrix.from_arrays(self.value, self.channels,
+                                     self.sample_rate, fftlength,
+                                     overlap=overlap, window=window,
+                                     average=average)
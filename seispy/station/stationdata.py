@@ -4,12 +4,13 @@ from collections import OrderedDict
 from ..utils import *
 import astropy.units as u
 from ..noise import gaussian
-from ..trace import Trace, fetch
+from ..trace import Trace, fetch, fetch_channels, iter_fetch, FrameCatalog
 from ..recoverymap import RecoveryMap
 import numpy as np
 from scipy.sparse.linalg import lsqr
 from gwpy.frequencyseries import FrequencySeries
 from .station import homestake
+from .multichannel import ChannelArray
 
 class Seismometer(OrderedDict):
     """
@@ -17,7 +18,7 @@ class Seismometer(OrderedDict):
     """
     @classmethod
     def fetch_data(cls, station_name, st, et, framedir='./', chans_type='useful',
-        location=[0,0,0]):
+        location=[0,0,0], catalog=None):
         """
         fetch data for this seismometer
 
@@ -28,16 +29,25 @@ class Seismometer(OrderedDict):
         et : `int`
             end time
         framedir : TODO, optional
+        catalog : :class:`seispy.trace.catalog.FrameCatalog`, optional
+            catalog of frames in `framedir`. One is made for this call
+            if not given, so frame directories are listed once for
+            all channels.
 
         Returns
         -------
         TODO
 
         """
-        seismometer = cls()
+        if catalog is None:
+            catalog = FrameCatalog(framedir)
         chans = get_homestake_channels(chans_type)
+        # every channel is read from each frame in one go
+        traces = fetch_channels(st, et, [station_name+':'+chan for chan in
+                chans], catalog=catalog)
+        seismometer = cls()
         for chan in chans:
-            seismometer[chan] = fetch(st, et, station_name+':'+chan, framedir=framedir)
+            seismometer[chan] = traces[station_name+':'+chan]
         return seismometer
 
     @classmethod
@@ -101,11 +111,60 @@ class Seismometer(OrderedDict):
                 seismometer[chan].location = location
         return seismometer
 
+    def to_channel_arrays(self):
+        """
+        pack channels into one
+        :class:`seispy.station.multichannel.ChannelArray` per sample
+        rate
+
+        Returns
+        -------
+        arrays : `collections.OrderedDict`
+            channel arrays keyed by sample rate in Hz
+        """
+        groups = OrderedDict()
+        for chan in self.keys():
+            key = (self[chan].sample_rate.value, self[chan].size)
+            groups.setdefault(key, []).append(chan)
+        arrays = OrderedDict()
+        for (sample_rate, size), chans in groups.items():
+            if sample_rate in arrays:
+                raise ValueError('Channels with sample rate %s Hz have '
+                                 'different durations' % str(sample_rate))
+            arrays[sample_rate] = ChannelArray.from_traces(self, chans)
+        return arrays
+
+    @classmethod
+    def from_channel_arrays(cls, arrays):
+        """
+        unpack channel arrays into a seismometer
+
+        Parameters
+        ----------
+        arrays : `list`
+            list (or dict) of
+            :class:`seispy.station.multichannel.ChannelArray`
+
+        Returns
+        -------
+        seismometer : :class:`seispy.station.stationdata.Seismometer`
+            seismometer with a :class:`seispy.trace.Trace` for each
+            channel
+        """
+        if isinstance(arrays, dict):
+            arrays = arrays.values()
+        seismometer = cls()
+        for arr in arrays:
+            seismometer.update(arr.to_traces())
+        return seismometer
+
 class SeismometerArray(OrderedDict):
     """
     Data object for storing data for a station"""
     @classmethod
-    def fetch_data(cls, st, et, framedir='./', chans_type='useful'):
+    def fetch_data(cls, st, et, framedir='./', chans_type='useful',
+            catalog=None, stations=None, nproc=1, pool='thread',
+            skip_failures=False, full_output=None):
         """TODO: Docstring for fetch_data.
 
         Parameters
@@ -117,17 +176,121 @@ class SeismometerArray(OrderedDict):
         framedir : `string`, optional
             top level frame directory
         chans_type : `type of chans to load`, optional
+        catalog : :class:`seispy.trace.catalog.FrameCatalog`, optional
+            catalog of frames in `framedir`, shared by every
+            station. One is made for this call if not given.
+        stations : `list`, optional
+            stations to load. Defaults to all homestake stations.
+        nproc : `int`, optional, default=1
+            number of frames to read at once (each for every
+            station and channel), see :func:`seispy.trace.fetch_channels`
+        pool : `str`, optional, default='thread'
+            'thread' or 'process' pool to read frames with
+        skip_failures : `bool`, optional, default=False
+            warn about frames that can't be read and leave zeros in
+            their place rather than stopping. Zeros go straight into
+            any CSDs or maps made from the data, so check `failures`.
+        full_output : `bool`, optional
+            also return frames that couldn't be read. Defaults to
+            `skip_failures`, so skipped frames are always reported.
 
         Returns
         -------
         seismometer_array : :class:`seispy.station.stationdata.SeismometerArray`
             seismometer array
+        failures : `list`
+            only if `full_output` is True. ``(path, error)`` for each
+            frame that couldn't be read
+        """
+        if full_output is None:
+            full_output = skip_failures
+        if stations is None:
+            stations = homestake().keys()
+        if catalog is None:
+            catalog = FrameCatalog(framedir)
+        chans = get_homestake_channels(chans_type)
+        # each frame is decoded once for every station and channel
+        traces, failures = fetch_channels(st, et, [station+':'+chan for
+                station in stations for chan in chans], catalog=catalog,
+                nproc=nproc, pool=pool, skip_failures=skip_failures,
+                full_output=True)
+        arr = cls._from_traces(traces, stations, chans)
+        if full_output:
+            return arr, failures
+        return arr
+
+    @classmethod
+    def iter_fetch(cls, st, et, stride, framedir='./', chans_type='useful',
+            catalog=None, stations=None, prefetch=1, skip_failures=False,
+            full_output=None, **kwargs):
+        """
+        iterate over `stride` second chunks of data for the whole
+        array. The next chunk is read in the background while the
+        current one is being analyzed
+        (see :func:`seispy.trace.iter_fetch`).
+
+        >>> for arr in SeismometerArray.iter_fetch(st, et, 3600):
+        ...     acc.update(arr)
+
+        Parameters
+        ----------
+        st : `int`
+            start time
+        et : `int`
+            end time
+        stride : `int`
+            seconds of data per chunk
+        framedir : `string`, optional
+            top level frame directory
+        chans_type : `type of chans to load`, optional
+        catalog : :class:`seispy.trace.catalog.FrameCatalog`, optional
+            catalog of frames in `framedir`
+        stations : `list`, optional
+            stations to load. Defaults to all homestake stations.
+        prefetch : `int`, optional, default=1
+            number of chunks to read ahead
+        skip_failures : `bool`, optional, default=False
+            warn about frames that can't be read and leave zeros in
+            their place rather than stopping
+        full_output : `bool`, optional
+            also yield frames that couldn't be read with each chunk.
+            Defaults to `skip_failures`.
+        **kwargs
+            passed on to :func:`seispy.trace.fetch_channels` (e.g.
+            `nproc`, `pool`)
+
+        Returns
+        -------
+        arrays : `generator`
+            :class:`seispy.station.stationdata.SeismometerArray` for
+            each chunk, in order, or ``(array, failures)`` if
+            `full_output` is True
+        """
+        if full_output is None:
+            full_output = skip_failures
+        if stations is None:
+            stations = homestake().keys()
+        chans = get_homestake_channels(chans_type)
+        for traces, failures in iter_fetch([station+':'+chan for station in
+                stations for chan in chans], st, et, stride,
+                framedir=framedir, catalog=catalog, prefetch=prefetch,
+                skip_failures=skip_failures, full_output=True, **kwargs):
+            arr = cls._from_traces(traces, stations, chans)
+            if full_output:
+                yield arr, failures
+            else:
+                yield arr
+
+    @classmethod
+    def _from_traces(cls, traces, stations, chans):
         """
-        arr = cls.initialize_all_good(homestake(), et-st,
-                chans_type=chans_type, start_time=st)
-        for station in arr.keys():
-            arr[station] = Seismometer.fetch_data(station, st, et,
-                    framedir=framedir, chans_type=chans_type)
+        build array from traces keyed by 'station:channel'
+        """
+        arr = cls()
+        for station in stations:
+            arr[station] = Seismometer()
+            for chan in chans:
+                arr[station][chan] = traces[station+':'+chan]
         return arr
 
     @classmethod
@@ -155,22 +318,20 @@ class SeismometerArray(OrderedDict):
         stheta = np.sin(theta)
         src_dir = np.array([cphi*stheta, sphi*stheta, ctheta])
         # get time delays
-        taus = np.array([-np.dot(src_dir, stations[key])/c for key in
-            stations.keys()])
+        taus = -calc_travel_time(src_dir, np.array([stations[key] for key in
+            stations.keys()], dtype=float), c)
         tau_round = np.round(taus*Fs)/Fs
         ts = min(-tau_round)
         te = max(-tau_round)
         times = np.arange(0, np.abs(ts) + duration + te, 1/Fs)
-        Nsamps = duration * Fs
+        Nsamps = int(duration * Fs)
         # shift backward in time
         times += ts
         data = SeismometerArray()
-        ct = 0
-        final_times = np.arange(0, duration, 1/Fs)
-        for key in stations.keys():
+        for ct, key in enumerate(stations.keys()):
             data[key]={}
             station = stations[key]
-            delay = -np.dot(src_dir, station)/c
+            delay = taus[ct]
             delaySamps = int(ts*Fs+np.round(delay*Fs))
             signal = np.zeros(times.size)
             if frequency == 0:
@@ -181,14 +342,9 @@ class SeismometerArray(OrderedDict):
                 signal = amplitude * np.sin(2*np.pi*frequency*times + phase)
             # impose time delay
             amp = np.roll(signal,delaySamps)[:Nsamps]
-            data[key]['HHE'] = Trace(src_dir[0]*amp, sample_rate=Fs,
-                    times=final_times, unit=u.m)
-            data[key]['HHN'] = Trace(src_dir[1]*amp, sample_rate=Fs,
-                    times=final_times,unit=u.m)
-            data[key]['HHZ'] = Trace(src_dir[2]*amp, sample_rate=Fs,
-                    times=final_times,unit=u.m)
-            for key2 in data[key].keys():
-                data[key][key2].location = station
+            data[key]['HHE'] = _fast_trace(src_dir[0]*amp, Fs, station)
+            data[key]['HHN'] = _fast_trace(src_dir[1]*amp, Fs, station)
+            data[key]['HHZ'] = _fast_trace(src_dir[2]*amp, Fs, station)
         return data
 
     @classmethod
@@ -241,22 +397,20 @@ class SeismometerArray(OrderedDict):
         dx, dy, dz = get_polarization_coeffs(phi, theta, psi)
 
         # get time delays
-        taus = np.array([-np.dot(src_dir, stations[key])/c for key in
-            stations.keys()])
+        taus = -calc_travel_time(src_dir, np.array([stations[key] for key in
+            stations.keys()], dtype=float), c)
         tau_round = np.round(taus*Fs)/Fs
         ts = min(-tau_round)
         te = max(-tau_round)
-        Nsamps = duration * Fs
-        final_times = np.arange(0, duration, 1/Fs)
+        Nsamps = int(duration * Fs)
         times = np.arange(0, np.abs(ts) + duration + te, 1/Fs)
         # shift backward in time
         times += ts
         data = SeismometerArray()
-        ct = 0
-        for key in stations.keys():
+        for ct, key in enumerate(stations.keys()):
             data[key]={}
             station = stations[key]
-            delay = -np.dot(src_dir, station)/c
+            delay = taus[ct]
             delaySamps = int(ts*Fs+np.round(delay*Fs))
             signal = np.zeros(times.size)
             if frequency == 0:
@@ -265,14 +419,9 @@ class SeismometerArray(OrderedDict):
                 signal = amplitude * np.sin(2*np.pi*frequency*times + phase)
             # impose time delay
             amp = np.roll(signal,delaySamps)[:Nsamps]
-            data[key]['HHE'] = Trace(dx*amp, sample_rate=Fs, times=final_times,
-                    unit=u.m, name=key)
-            data[key]['HHN'] = Trace(dy*amp, sample_rate=Fs, times=final_times,
-                    unit=u.m, name=key)
-            data[key]['HHZ'] = Trace(dz*amp, sample_rate=Fs, times=final_times,
-                    unit=u.m, name=key)
-            for key2 in data[key].keys():
-                data[key][key2].location = station
+            data[key]['HHE'] = _fast_trace(dx*amp, Fs, station, name=key)
+            data[key]['HHN'] = _fast_trace(dy*amp, Fs, station, name=key)
+            data[key]['HHZ'] = _fast_trace(dz*amp, Fs, station, name=key)
         return data
 
     @classmethod
@@ -299,22 +448,20 @@ class SeismometerArray(OrderedDict):
         stheta = np.sin(theta)
         src_dir = np.array([cphi*stheta, sphi*stheta, ctheta])
         # get time delays
-        taus = np.array([-np.dot(src_dir, stations[key])/c for key in
-            stations.keys()])
+        taus = -calc_travel_time(src_dir, np.array([stations[key] for key in
+            stations.keys()], dtype=float), c)
         tau_round = np.round(taus*Fs)/Fs
         ts = min(-tau_round)
         te = max(-tau_round)
         times = np.arange(0, np.abs(ts) + duration + te, 1/Fs)
-        Nsamps = duration * Fs
+        Nsamps = int(duration * Fs)
         # shift backward in time
         times += ts
         data = SeismometerArray()
-        ct = 0
-        final_times = np.arange(0, duration, 1/Fs)
-        for key in stations.keys():
+        for ct, key in enumerate(stations.keys()):
             data[key]={}
             station = stations[key]
-            delay = -np.dot(src_dir, station)/c
+            delay = taus[ct]
             delaySamps = int(ts*Fs+np.round(delay*Fs))
             signal = np.zeros(times.size)
             if frequency == 0:
@@ -328,14 +475,9 @@ class SeismometerArray(OrderedDict):
             amp = np.roll(signal,delaySamps)[:Nsamps]* np.exp(-station[2]/alpha)
             amp2 = np.roll(signal_phaseoff, delaySamps)[:Nsamps]*\
                 np.exp(station[2]/alpha)
-            data[key]['HHE'] = cphi * Trace(amp, sample_rate=Fs,
-                    times=final_times, unit=u.m)
-            data[key]['HHN'] = sphi * Trace(amp, sample_rate=Fs,
-                    times=final_times,unit=u.m)
-            data[key]['HHZ'] = epsilon * Trace(amp2, sample_rate=Fs,
-                    times=final_times,unit=u.m)
-            for key2 in data[key].keys():
-                data[key][key2].location = station
+            data[key]['HHE'] = _fast_trace(cphi*amp, Fs, station)
+            data[key]['HHN'] = _fast_trace(sphi*amp, Fs, station)
+            data[key]['HHZ'] = _fast_trace(epsilon*amp2, Fs, station)
         return data
 
     def add_p_wave(self, amplitude, phi, theta, frequency,
@@ -465,9 +607,62 @@ class SeismometerArray(OrderedDict):
         for sensor in self.keys():
             # only care about HHE, HHZ, HHN for this
             # since we're simulating stuff
-            self[sensor]['HHE'] += other[sensor]['HHE']
-            self[sensor]['HHN'] += other[sensor]['HHN']
-            self[sensor]['HHZ'] += other[sensor]['HHZ']
+            for chan in ['HHE', 'HHN', 'HHZ']:
+                _add_values(self[sensor][chan], other[sensor][chan])
+
+    def csd_matrix(self, channels=None, fftlength=2, overlap=1,
+            window='hann', average=True, frequencies=None, stft_cache=None):
+        """
+        Cross spectral density matrix between every station/channel
+        combination. Each channel is FFT'd once per segment.
+
+        Parameters
+        ----------
+        channels : `list`, optional
+            list of channels to use. Defaults to HHE, HHN, HHZ
+        fftlength : `float`, optional, default=2
+            length of segments in seconds
+        overlap : `float`, optional, default=1
+            overlap between segments in seconds
+        window : `str`, optional, default='hann'
+            window to apply to each segment
+        average : `bool`, optional, default=True
+            average over segments. If False, keep the full
+            [segment, frequency, channel, channel] tensor.
+        frequencies : `list`, optional
+            only calculate CSDs at these FFT bins, which is much
+            cheaper than a full FFT when only a few are needed.
+            Defaults to all frequencies.
+        stft_cache : :class:`seispy.utils.stftcache.STFTCache`, optional
+            cache to get each channel's FFTs from (and put them in),
+            so that they are only taken once across repeated calls
+
+        Returns
+        -------
+        csdm : :class:`seispy.utils.spectral.CSDMatrix`
+            CSD matrix, indexed by ``(station, channel)`` tuples
+        """
+        if channels is None:
+            channels = ['HHE','HHN','HHZ']
+        keys = [(station, chan) for station in self.keys() for chan in
+                channels]
+        sample_rates = set([self[st][ch].sample_rate.value for st, ch in keys])
+        sizes = set([self[st][ch].size for st, ch in keys])
+        if len(sample_rates) > 1 or len(sizes) > 1:
+            raise ValueError('All channels must have the same sample rate '
+                             'and duration to calculate CSD matrix')
+        if stft_cache is not None:
+            stfts = [stft_cache(self[st][ch], fftlength, overlap=overlap,
+                                window=window, frequencies=frequencies)
+                     for st, ch in keys]
+            ffts = np.array([stft[0] for stft in stfts])
+            freqs, scale = stfts[0][1], stfts[0][2]
+            csd, nsegs = csd_from_ffts(ffts, scale, average=average)
+            return CSDMatrix(csd, freqs, keys, nsegs=nsegs)
+        data = np.vstack([self[st][ch].value for st, ch in keys])
+        return CSDMatrix.from_arrays(data, keys, sample_rates.pop(),
+                fftlength, overlap=overlap, window=window, average=average,
+                frequencies=frequencies)
 
     def p_wave_recovery_matrices(self, station_locs, recovery_freq, vp=5700, autocorrelations=True,
             channels=None, phis=None, thetas=None, fftlength=2, overlap=1,
@@ -497,6 +692,8 @@ class SeismometerArray(OrderedDict):
         stations = self.keys()
         if channels is None:
             channels = ['HHE','HHN','HHZ']
+        csdm = self.csd_matrix(channels=channels, fftlength=fftlength,
+                overlap=overlap, frequencies=[recovery_freq])
         First = True
         for ii,station1 in enumerate(stations):
             for jj,station2 in enumerate(stations):
@@ -511,12 +708,9 @@ class SeismometerArray(OrderedDict):
                         elif autocorrelations is False and ll==kk and jj==ii:
                             continue
                         else:
-                            P12 =\
-                            self[station1][channels[kk]].csd_spectrogram(self[station2][channels[ll]],
-                                    stride=fftlength,
-                                    window='hann',overlap=overlap, nproc=nproc)
-                            cp = (P12).mean(0)
-                            idx = np.where(cp.frequencies.value==recovery_freq)
+                            cp = csdm.csd((station1, channels[kk]),
+                                    (station2, channels[ll]))
+                            idx = np.where(csdm.frequencies==recovery_freq)
                             p12 = cp[idx]
                             #print np.sqrt(np.abs(p12) * 1/3600 * u.Hz)
                             gamma, phis, thetas =\
@@ -532,7 +726,7 @@ class SeismometerArray(OrderedDict):
                             else:
                                 GG += np.dot(np.conj(gamma), np.transpose(gamma))
                                 GY += np.conj(gamma)*p12
-        S = lsqr(np.real(GG), np.real(GY.value), iter_lim=iter_lim, atol=atol,
+        S = lsqr(np.real(GG), np.real(GY), iter_lim=iter_lim, atol=atol,
                 btol=btol)
         print 'Stopped at iteration number ' + str(S[2])
         if S[1]==1:
@@ -540,7 +734,7 @@ class SeismometerArray(OrderedDict):
         if S[1]==2:
             print "We found an approximate solution"
         print 'Converged to a relative residual of '+str(S[3] /
-                np.sqrt((np.abs(GY.value)**2).sum()))
+                np.sqrt((np.abs(GY)**2).sum()))
         final_map_p = np.copy(S[0].reshape(gamma_shape))
         return final_map_p, phis, thetas
 
@@ -573,6 +767,8 @@ class SeismometerArray(OrderedDict):
         stations = self.keys()
         if channels is None:
             channels = ['HHE','HHN','HHZ']
+        csdm = self.csd_matrix(channels=channels, fftlength=fftlength,
+                overlap=overlap, frequencies=[recovery_freq])
         First = True
         for ii,station1 in enumerate(stations):
             for jj,station2 in enumerate(stations):
@@ -585,12 +781,9 @@ class SeismometerArray(OrderedDict):
                             # don't double count channels
                             continue
                         else:
-                            P12 =\
-                            self[station1][channels[kk]].csd_spectrogram(self[station2][channels[ll]],
-                                    stride=fftlength,
-                                    window='hann',overlap=overlap, nproc=nproc)
-                            cp = (P12).mean(0)
-                            idx = np.where(cp.frequencies.value==recovery_freq)
+                            cp = csdm.csd((station1, channels[kk]),
+                                    (station2, channels[ll]))
+                            idx = np.where(csdm.frequencies==recovery_freq)
                             p12 = cp[idx]
                             gamma, phis, thetas =\
                                 orf_r_directional(set_channel_vector(channels[kk]),
@@ -606,7 +799,7 @@ class SeismometerArray(OrderedDict):
                             else:
                                 GG += np.dot(np.conj(gamma), np.transpose(gamma))
                                 GY += np.conj(gamma)*p12
-        S = lsqr(np.real(GG), np.real(GY.value), iter_lim=iter_lim, atol=atol,
+        S = lsqr(np.real(GG), np.real(GY), iter_lim=iter_lim, atol=atol,
                 btol=btol)
         print 'Stopped at iteration number ' + str(S[2])
         if S[1]==1:
@@ -614,7 +807,7 @@ class SeismometerArray(OrderedDict):
         if S[1]==2:
             print "We found an approximate solution"
         print 'Converged to a relative residual of '+str(S[3] /
-                np.sqrt((np.abs(GY.value)**2).sum()))
+                np.sqrt((np.abs(GY)**2).sum()))
         final_map_p = np.copy(S[0].reshape(gamma_shape))
         return final_map_p, phis, thetas
 
@@ -653,6 +846,8 @@ class SeismometerArray(OrderedDict):
         stations = self.keys()
         if channels is None:
             channels = ['HHE','HHN','HHZ']
+        csdm = self.csd_matrix(channels=channels, fftlength=fftlength,
+                overlap=overlap, frequencies=[recovery_freq])
         First = True
         for ii,station1 in enumerate(stations):
             for jj,station2 in enumerate(stations):
@@ -665,12 +860,9 @@ class SeismometerArray(OrderedDict):
                             # don't double count channels
                             continue
                         else:
-                            P12 =\
-                            self[ii][channels[kk]].csd_spectrogram(self[jj][channels[ll]],
-                                    stride=fftlength,
-                                    window='hann',overlap=overlap, nproc=nproc)
-                            cp = (P12).mean(0)
-                            idx = np.where(cp.frequencies.value==recovery_freq)
+                            cp = csdm.csd((station1, channels[kk]),
+                                    (station2, channels[ll]))
+                            idx = np.where(csdm.frequencies==recovery_freq)
                             p12 = cp[idx]
                             gamma1, gamma2, phis, thetas =\
                                 orf_s_directional(set_channel_vector(channels[kk]),
@@ -696,7 +888,7 @@ class SeismometerArray(OrderedDict):
                             else:
                                 GG += np.dot(np.conj(gamma), np.transpose(gamma))
                                 GY += np.conj(gamma)*p12
-        S = lsqr(np.real(GG), np.real(GY.value), iter_lim=iter_lim, atol=atol,
+        S = lsqr(np.real(GG), np.real(GY), iter_lim=iter_lim, atol=atol,
                 btol=btol)
         print 'Stopped at iteration number ' + str(S[2])
         if S[1]==1:
@@ -704,7 +896,7 @@ class SeismometerArray(OrderedDict):
         if S[1]==2:
             print "We found an approximate solution"
         print 'Converged to a relative residual of '+str(S[3] /
-                np.sqrt((np.abs(GY.value)**2).sum()))
+                np.sqrt((np.abs(GY)**2).sum()))
         final_map = np.copy(S[0].reshape(gamma.shape))
         final_map_pol1 = final_map[:gamma1.size]
         final_map_pol2 = final_map[gamma1.size:(gamma1.size+gamma2.size)]
@@ -748,6 +940,8 @@ class SeismometerArray(OrderedDict):
         stations = self.keys()
         if channels is None:
             channels = ['HHE','HHN','HHZ']
+        csdm = self.csd_matrix(channels=channels, fftlength=fftlength,
+                overlap=overlap, frequencies=[recovery_freq])
         First = True
         for ii,station1 in enumerate(stations):
             for jj,station2 in enumerate(stations):
@@ -760,12 +954,9 @@ class SeismometerArray(OrderedDict):
                             # don't double count channels
                             continue
                         else:
-                            P12 =\
-                            self[ii][channels[kk]].csd_spectrogram(self[jj][channels[ll]],
-                                    stride=fftlength,
-                                    window='hann',overlap=overlap, nproc=nproc)
-                            cp = (P12).mean(0)
-                            idx = np.where(cp.frequencies.value==recovery_freq)
+                            cp = csdm.csd((station1, channels[kk]),
+                                    (station2, channels[ll]))
+                            idx = np.where(csdm.frequencies==recovery_freq)
                             p12 = cp[idx]
                             gamma1, gamma2, phis, thetas =\
                                 orf_s_directional(set_channel_vector(channels[kk]),
@@ -784,7 +975,7 @@ class SeismometerArray(OrderedDict):
                             else:
                                 GG += np.dot(np.conj(gamma), np.transpose(gamma))
                                 GY += np.conj(gamma)*p12
-        S = lsqr(np.real(GG), np.real(GY.value), iter_lim=iter_lim, atol=atol,
+        S = lsqr(np.real(GG), np.real(GY), iter_lim=iter_lim, atol=atol,
                 btol=btol)
         print 'Stopped at iteration number ' + str(S[2])
         if S[1]==1:
@@ -792,7 +983,7 @@ class SeismometerArray(OrderedDict):
         if S[1]==2:
             print "We found an approximate solution"
         print 'Converged to a relative residual of '+str(S[3] /
-                np.sqrt((np.abs(GY.value)**2).sum()))
+                np.sqrt((np.abs(GY)**2).sum()))
         final_map = np.copy(S[0].reshape(gamma.shape))
         final_map_pol1 = final_map[:gamma1.size]
         final_map_pol2 = final_map[gamma1.size:]
@@ -801,10 +992,21 @@ class SeismometerArray(OrderedDict):
     def recovery_matrices(self, rec_str, station_locs, recovery_freq,
             v_list, autocorrelations=True, epsilon=0.1, alpha=1000,
             channels=None, phis=None, thetas=None, fftlength=2, overlap=1,
-            nproc=1,iter_lim=1000, atol=1e-6, btol=1e-6):
+            nproc=1,iter_lim=1000, atol=1e-6, btol=1e-6, orf_cache=None,
+            solver='lsqr', operator=None, grid=None, x0=None,
+            full_output=False, stft_cache=None):
         """
         Recover everything or anything
 
+        The dense normal equations are badly conditioned when there are
+        fewer pair measurements than pixels, and `lsqr` amplifies small
+        differences in its inputs. The different ways of getting to a
+        map (batched or cached orfs, `stft_cache`, the 'matrix-free'
+        solver, :class:`seispy.station.accumulator.RecoveryAccumulator`)
+        add things up in different orders, so their maps agree on
+        where the peaks are but only to within a few percent in
+        amplitude, not to rounding.
+
         Parameters
         ----------
         recovery_freq : `float`
@@ -813,109 +1015,284 @@ class SeismometerArray(OrderedDict):
             Would you like to use autocorrelations in recovery?
         channels : `list`
             list of channels of data to use
+        nproc : `int`, optional, default=1
+            number of processes to accumulate the normal equations
+            over (see :func:`seispy.utils.solvers.normal_equations`).
+            Only used by the 'lsqr' solver without an `orf_cache`.
+            Results don't depend on `nproc`.
+        orf_cache : :class:`seispy.utils.orfcache.ORFCache`, optional
+            cache to pull overlap reduction functions from pair by
+            pair. If not given, the whole design matrix is built at
+            once from batched orfs
+            (see :func:`seispy.utils.solvers.design_matrix`).
+        solver : `str`, optional, default='lsqr'
+            'lsqr' builds :math:`\gamma^\dagger \gamma` as a dense
+            matrix and solves it with `lsqr`. 'matrix-free' solves the
+            same system, applying :math:`\gamma^\dagger \gamma` as
+            products with the stacked orfs
+            (see :func:`seispy.utils.solvers.solve_matrix_free`),
+            which needs O(pairs x M) memory instead of O(M^2).
+        operator : :class:`seispy.utils.solvers.RecoveryOperator`, optional
+            pre-factored recovery operator for this configuration (see
+            :meth:`recovery_operator`). If given, orfs are not
+            computed and the map is one matrix-vector product away
+            from the CSDs. A `ValueError` is raised if it was built
+            for a different `rec_str`, `recovery_freq`, `v_list` or
+            sky grid.
+
+        grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+            sky grid to recover on, e.g.
+            :class:`seispy.utils.skygrid.EqualAreaGrid`. Overrides
+            `thetas` and `phis`.
+        x0 : `numpy.ndarray`, optional
+            initial guess for the solver, e.g. ``info['x']`` from
+            recovery of a neighbouring segment or frequency (see
+            :func:`recovery_sequence`). Defaults to zeros.
+        full_output : `bool`, optional, default=False
+            also return convergence information
+        stft_cache : :class:`seispy.utils.stftcache.STFTCache`, optional
+            cache for the FFTs of each channel, so recovering the
+            same data again on another grid or with other velocities
+            doesn't redo them
 
         Returns
         -------
-        GG : `numpy.ndarray`
-            :math:`\gamma^T * \gamma`
-        GY : `numpy.ndarray`
-            :math:`\gamma \hat Y`
-        gamma_shape : `tuple`
-            final shape to use to reshape matrices
-            after solutions
-        gamma1_shape : `tuple`
-            final shape to use to reshape matrices
-            after solutions
-        gamma2_shape : `tuple`
-            final shape to use to reshape matrices
-            after solutions
+        maps : `dict`
+            :class:`seispy.recoverymap.RecoveryMap` for each
+            polarization, keyed by 'p', 's1', 's2', 'r'
+        phis : `numpy.ndarray`
+            phi values (of each pixel, for grids other than a mesh)
+        thetas : `numpy.ndarray`
+            theta values (of each pixel, for grids other than a mesh)
+        info : `dict`
+            only if `full_output` is True. Flattened solution ('x')
+            and convergence information ('istop', 'itn', 'r1norm',
+            ...) from :func:`seispy.utils.solvers.lsqr_info`. With an
+            `operator` there are no iterations, and instead it has
+            the rank ('rank'), singular value cutoff ('rcond') and
+            residual norm ('rnorm') from
+            :meth:`seispy.utils.solvers.RecoveryOperator.info`.
         """
         stations = self.keys()
         if channels is None:
             channels = ['HHE','HHN','HHZ']
-        First = True
-        for ii,station1 in enumerate(stations):
-            for jj,station2 in enumerate(stations):
-                for kk,chan1 in enumerate(channels):
-                    for ll,chan2 in enumerate(channels):
-                        if jj<ii:
-                            # we don't double count stations
-                            continue
-                        if ll < kk:
-                            # don't double count channels
-                            continue
-                        else:
-                            P12 =\
-                            self[station1][channels[kk]].csd_spectrogram(self[station2][channels[ll]],
-                                    stride=fftlength,
-                                    window='hann',overlap=overlap, nproc=nproc)
-                            cp = (P12).mean(0)
-                            idx =\
-                                np.where(cp.frequencies.value==float(recovery_freq))
-                            p12 = cp[idx[0]-1:idx[0]+2].sum()
-                            g = []
-                            shapes = []
-                            for rec, v in zip(rec_str, v_list):
-                                if rec is 's':
-                                    g1, g2, g1_s, g2_s = orf_picker(rec, set_channel_vector(channels[kk]),
-                                        set_channel_vector(channels[ll]),station_locs[station1],
-                                        station_locs[station2], v,
-                                        float(recovery_freq), thetas=thetas, phis=phis,
-                                                 epsilon=epsilon, alpha=alpha)
-                                    shapes.append(g1_s)
-                                    shapes.append(g2_s)
-                                    if len(g) > 0:
-                                        g = np.vstack((g, g1, g2))
-                                    else:
-                                        g = np.vstack((g1, g2))
-                                else:
-                                    g1, g_s = orf_picker(rec, set_channel_vector(channels[kk]),
-                                        set_channel_vector(channels[ll]),station_locs[station1],
-                                        station_locs[station2],
-                                        v,float(recovery_freq), thetas=thetas, phis=phis,
-                                        epsilon=epsilon, alpha=alpha)
-                                    try:
-                                        g = np.vstack((g, g1))
-                                    except ValueError:
-                                        g = g1
-                                    shapes.append(g_s)
-                            if First:
-                                GG = np.dot(np.conj(g), np.transpose(g))
-                                GY = np.conj(g)*p12
-                                First = 0
-                            else:
-                                GG += np.dot(np.conj(g), np.transpose(g))
-                                GY += np.conj(g)*p12
-        S = lsqr(np.real(GG), np.real(GY.value), iter_lim=iter_lim, atol=atol,
-                btol=btol)
-        maps = {}
-        idx_low = 0
+        if solver not in ['lsqr', 'matrix-free']:
+            raise ValueError('solver must be \'lsqr\' or \'matrix-free\'')
+        # we only need a few bins around the recovery frequency
+        csdm = self.csd_matrix(channels=channels, fftlength=fftlength,
+                overlap=overlap,
+                frequencies=recovery_bins(recovery_freq, fftlength),
+                stft_cache=stft_cache)
         if thetas is None:
             thetas = np.arange(3,180,6) * np.pi / 180
         if phis is None:
             phis = np.arange(3,360,6) * np.pi / 180
-        for ii, rec in enumerate(rec_str):
-            if rec is 's':
-                length = shapes[ii][0] * shapes[ii][1]
-                maps['s1'] =\
-                        RecoveryMap(S[0].reshape(g.shape)[idx_low:idx_low+length].reshape(shapes[ii]),
-                                thetas, phis, 's1')
-                idx_low += length
-                maps['s2'] =\
-                        RecoveryMap(S[0].reshape(g.shape)[idx_low:idx_low+length].reshape(shapes[ii]),
-                                thetas, phis, 's2')
+        if grid is not None:
+            thetas, phis = grid.map_axes()
+        if operator is not None:
+            # geometry is already factored, we only need the data
+            operator.check(rec_str, recovery_freq, v_list, thetas, phis)
+            Y = pair_csds(csdm, operator.pairs, recovery_freq)
+            x = operator.solve(Y)
+            maps = _recovery_maps(x, rec_str, operator.shapes, thetas, phis,
+                    grid=grid)
+            if full_output:
+                return maps, phis, thetas, operator.info(Y, x=x)
+            return maps, phis, thetas
+        locs = OrderedDict((station, station_locs[station]) for station in
+                stations)
+        if solver == 'lsqr' and orf_cache is None:
+            # partial sums over shards of station pairs,
+            # spread over `nproc` processes
+            GG, GY, shapes = normal_equations(rec_str, locs, recovery_freq,
+                    v_list, csdm, channels=channels, thetas=thetas,
+                    phis=phis, epsilon=epsilon, alpha=alpha,
+                    autocorrelations=autocorrelations, nproc=nproc, grid=grid)
+            S = solve_lsqr(GG, GY, iter_lim=iter_lim, atol=atol, btol=btol,
+                    x0=x0)
+        else:
+            if orf_cache is None:
+                G, pairs, shapes = design_matrix(rec_str, locs,
+                        recovery_freq, v_list, channels=channels,
+                        thetas=thetas, phis=phis, epsilon=epsilon,
+                        alpha=alpha, autocorrelations=autocorrelations,
+                        grid=grid)
+            else:
+                pairs = recovery_pairs(stations, channels,
+                        autocorrelations=autocorrelations)
+                G = []
+                for station1, station2, chan1, chan2 in pairs:
+                    g, shapes = pair_orfs(rec_str, v_list, chan1, chan2,
+                            station_locs[station1], station_locs[station2],
+                            recovery_freq, thetas=thetas, phis=phis,
+                            epsilon=epsilon, alpha=alpha,
+                            orf_cache=orf_cache, grid=grid)
+                    G.append(g[:, 0])
+                G = np.array(G)
+            Y = pair_csds(csdm, pairs, recovery_freq)
+            if solver == 'matrix-free':
+                S = solve_matrix_free(G, Y, iter_lim=iter_lim, atol=atol,
+                        btol=btol, x0=x0)
             else:
-                length = shapes[ii][0] * shapes[ii][1]
-                maps[rec] =\
-                    RecoveryMap(S[0].reshape(g.shape)[idx_low:idx_low+length].reshape(shapes[ii]),
-                            thetas, phis, rec)
-                idx_low += length
-
-        #print 'Stopped at iteration number ' + str(S[2])
-        #if S[1]==1:
-        #    print "We've found an exact solution"
-        #if S[1]==2:
-        #    print "We found an approximate solution"
-        #print 'Converged to a relative residual of '+str(S[3] /
-        #        np.sqrt((np.abs(GY.value)**2).sum()))
+                GG = np.dot(np.conj(G).T, G)
+                GY = np.dot(np.conj(G).T, Y)
+                S = solve_lsqr(np.real(GG), np.real(GY), iter_lim=iter_lim,
+                        atol=atol, btol=btol, x0=x0)
+        maps = _recovery_maps(S[0], rec_str, shapes, thetas, phis, grid=grid)
+        if full_output:
+            return maps, phis, thetas, lsqr_info(S)
         return maps, phis, thetas
+
+    def recovery_operator(self, rec_str, station_locs, recovery_freq, v_list,
+            autocorrelations=True, epsilon=0.1, alpha=1000, channels=None,
+            phis=None, thetas=None, orf_cache=None, rcond=1e-2, grid=None):
+        """
+        Factor the recovery problem for this array once so that
+        maps for many stretches of data can be recovered cheaply
+        with ``recovery_matrices(..., operator=op)``.
+
+        Parameters
+        ----------
+        rec_str : `str`
+            wave types to recover, e.g. 'ps'
+        station_locs : `dict`
+            station locations
+        recovery_freq : `float`
+            frequency of recovery
+        v_list : `list`
+            velocity for each wave type
+        rcond : `float`, optional, default=1e-2
+            relative cutoff for small singular values. Truncation
+            regularizes differently from `lsqr`: peaks agree, but map
+            amplitudes can differ from the `lsqr` ones by up to about
+            a factor of two (see
+            :class:`seispy.utils.solvers.RecoveryOperator`).
+        grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+            sky grid to recover on. Pass the same grid to
+            `recovery_matrices` along with the operator.
+
+        Returns
+        -------
+        op : :class:`seispy.utils.solvers.RecoveryOperator`
+            factored recovery operator. Save it with ``op.save(fname)``
+            and reload it with ``RecoveryOperator.load(fname)``.
+        """
+        locs = OrderedDict((station, station_locs[station]) for station in
+                self.keys())
+        return RecoveryOperator.from_geometry(rec_str, locs, recovery_freq,
+                v_list, channels=channels, thetas=thetas, phis=phis,
+                epsilon=epsilon, alpha=alpha,
+                autocorrelations=autocorrelations, orf_cache=orf_cache,
+                rcond=rcond, grid=grid)
+
+
+def recovery_sequence(arrays, rec_str, station_locs, recovery_freqs, v_list,
+        warm_start=True, **kwargs):
+    """
+    Recover maps for a sequence of time segments and/or frequencies.
+    Neighbouring segments and frequency bins give similar maps, so
+    each solve starts from the previous solution, which cuts down
+    the number of `lsqr` iterations.
+
+    Parameters
+    ----------
+    arrays : :class:`SeismometerArray` or `list`
+        data for each segment. A single array is used for every
+        frequency.
+    rec_str : `str`
+        wave types to recover, e.g. 'ps'
+    station_locs : `dict`
+        station locations
+    recovery_freqs : `float` or `list`
+        frequency of recovery for each segment. A single frequency
+        is used for every segment.
+    v_list : `list`
+        velocity for each wave type
+    warm_start : `bool`, optional, default=True
+        start each solve from the previous solution
+    **kwargs
+        passed on to :meth:`SeismometerArray.recovery_matrices`.
+        `x0` here sets the initial guess for the first solve.
+
+    Returns
+    -------
+    maps : `list`
+        dict of :class:`seispy.recoverymap.RecoveryMap` for each
+        segment/frequency
+    phis : `numpy.ndarray`
+        phi values
+    thetas : `numpy.ndarray`
+        theta values
+    infos : `list`
+        convergence information for each solve (see
+        :func:`seispy.utils.solvers.lsqr_info`)
+    """
+    if isinstance(arrays, SeismometerArray):
+        arrays = [arrays]
+    if np.isscalar(recovery_freqs):
+        recovery_freqs = [recovery_freqs]
+    arrays = list(arrays)
+    recovery_freqs = list(recovery_freqs)
+    if len(arrays) == 1:
+        arrays = arrays * len(recovery_freqs)
+    elif len(recovery_freqs) == 1:
+        recovery_freqs = recovery_freqs * len(arrays)
+    elif len(arrays) != len(recovery_freqs):
+        raise ValueError('Need one frequency per array, or a single '
+                         'array or frequency')
+    x0 = kwargs.pop('x0', None)
+    kwargs.pop('full_output', None)
+    all_maps = []
+    infos = []
+    for data, recovery_freq in zip(arrays, recovery_freqs):
+        maps, phis, thetas, info = data.recovery_matrices(rec_str,
+                station_locs, recovery_freq, v_list, x0=x0,
+                full_output=True, **kwargs)
+        if warm_start:
+            x0 = info['x']
+        all_maps.append(maps)
+        infos.append(info)
+    return all_maps, phis, thetas, infos
+
+
+def _fast_trace(value, sample_rate, location, name=None, unit=u.m):
+    """
+    wrap a plain array of simulated data as a
+    :class:`seispy.trace.Trace` starting at t=0. Simulations are done
+    on numpy arrays and units and metadata are only attached here.
+    """
+    tr = Trace(value, sample_rate=sample_rate, t0=0, unit=unit, name=name)
+    tr.location = location
+    return tr
+
+
+def _add_values(tr, other):
+    """
+    add `other` to `tr` in place on the underlying arrays, skipping
+    astropy's unit checks on every sample. Units are converted once
+    if they differ.
+    """
+    other_value = other.value
+    if other.unit != tr.unit:
+        other_value = other.to(tr.unit).value
+    tr.value[:] += other_value
+
+
+def _recovery_maps(x, rec_str, shapes, thetas, phis, grid=None):
+    """
+    split solution vector into a map for each polarization
+    """
+    names = []
+    for rec in rec_str:
+        if rec == 's':
+            names.extend(['s1', 's2'])
+        else:
+            names.append(rec)
+    maps = {}
+    idx_low = 0
+    for name, shape in zip(names, shapes):
+        length = int(np.prod(shape))
+        maps[name] = RecoveryMap(x[idx_low:idx_low+length].reshape(shape),
+                thetas, phis, name, grid=grid)
+        idx_low += length
+    return maps
@@ -1,5 +1,6 @@
 from station import Station
 from collections import OrderedDict
+from ..trace import Trace, coherence_matrix
 
 
 class StationArray(OrderedDict):
@@ -21,8 +22,79 @@ class StationArray(OrderedDict):
         for station in stations:
             self[station] = Station(st, et, station)
 
-    def coherence(self, fftlength=None, window='hanning',
-                  **kwargs):
+    def coherence(self, fftlength=None, window='hanning', all_pairs=False,
+                  components=None, output='dict', **kwargs):
+        """
+        Coherence between stations.
+
+        By default each pair of Z channels is done separately with
+        :meth:`seispy.trace.Trace.coherence`. With `all_pairs` every
+        channel is FFT'd once and all of the pairs are built from those
+        shared spectra (see :func:`seispy.trace.coherence_matrix`),
+        which is much faster for big arrays. Per-segment bandpassing
+        and renormalization are only available for separate pairs.
+
+        Parameters
+        ----------
+        fftlength : `float`, optional
+            length of ffts in seconds
+        window : `str`, optional, default='hanning'
+            window to use on segments
+        all_pairs : `bool`, optional, default=False
+            use shared spectra
+        components : `list`, optional, default=['Z']
+            components to use with `all_pairs`. With more than one
+            component, pairs of components at the same station are
+            included too.
+        output : `str`, optional, default='dict'
+            'dict' or 'matrix'. Only used with `all_pairs`.
+        whiten : `bool`, optional
+            whiten spectra
+
+        Returns
+        -------
+        COH : `OrderedDict`
+            coherence :class:`seispy.trace.Trace` for each pair, keyed by
+            'STA1-STA2' (or 'STA1:C1-STA2:C2' with several components).
+            With `output='matrix'` returns the [channel, channel, time]
+            array of coherences and the list of (station, component)
+            labels of its rows instead.
+        """
+        if not all_pairs:
+            return self._pair_coherence(fftlength=fftlength, window=window,
+                                        **kwargs)
+        if kwargs.get('bandpass') is not None or\
+                kwargs.get('normtype') is not None:
+            raise ValueError('all_pairs coherence does not do per-segment '
+                             'bandpassing or renormalization')
+        if components is None:
+            components = ['Z']
+        labels = [(station, comp) for station in self.keys()
+                  for comp in components]
+        traces = [self[station][comp] for station, comp in labels]
+        coh = coherence_matrix(traces, fftlength=fftlength, window=window,
+                               stacktype='ts',
+                               whiten=kwargs.get('whiten', False))
+        if output == 'matrix':
+            return coh, labels
+        COH = OrderedDict()
+        for ii in range(len(labels)):
+            for jj in range(ii + 1, len(labels)):
+                if len(components) == 1:
+                    newkey = labels[ii][0] + '-' + labels[jj][0]
+                else:
+                    newkey = '%s:%s-%s:%s' % (labels[ii] + labels[jj])
+                tr1, tr2 = traces[ii], traces[jj]
+                coh_ts = Trace(coh[ii, jj],
+                               name='coherence TS between %s and %s' % (
+                                   tr1.channel, tr2.channel),
+                               sample_rate=tr1.sample_rate)
+                coh_ts.deltax = tr1.location - tr2.location
+                coh_ts.x0 = -coh_ts.times[-1] / 2.
+                COH[newkey] = coh_ts
+        return COH
+
+    def _pair_coherence(self, fftlength=None, window='hanning', **kwargs):
         COH = OrderedDict()
         for ii in range(len(self.keys())):
             for jj in range(ii, len(self.keys())):
@@ -3,9 +3,16 @@ import matplotlib
 
 matplotlib.use('agg')
 import unittest
-from ..station import SeismometerArray
+from ..station import SeismometerArray, RecoveryAccumulator, recovery_sequence
+from ..station import Seismometer, ChannelArray, spiral
+from ..utils import ORFCache, STFTCache, RecoveryOperator
 import numpy.testing as npt
 import numpy as np
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from ..utils import normal_equations
 
 STATIONS = {0: [0, 0, 0]}
 A = 10
@@ -73,5 +80,162 @@ class TestSeismometerArray(unittest.TestCase):
                                       np.zeros(SAMPLE_FREQ * DURATION))
 
 
+class TestRecoveryAccumulator(unittest.TestCase):
+    def test_accumulate(self):
+        stations = {0: [0, 0, 0], 1: [500, 0, 0], 2: [0, 500, 0]}
+        data = SeismometerArray.initialize_all_good(stations, DURATION,
+                chans_type='fast_chans', start_time=0)
+        data.add_p_wave(A, PHI, THETA, FF, DURATION, c=VEL)
+        thetas = np.arange(3, 180, 30) * np.pi / 180
+        phis = np.arange(3, 360, 30) * np.pi / 180
+        acc = RecoveryAccumulator('p', stations, FF, [VEL], thetas=thetas,
+                                  phis=phis)
+        self.assertRaises(ValueError, lambda: acc.Y)
+        acc.update(data)
+        Y = acc.Y
+        GG, GY, shapes = normal_equations('p', OrderedDict(stations), FF,
+                [VEL], data.csd_matrix(), thetas=thetas, phis=phis)
+        npt.assert_array_almost_equal(acc.GG, GG)
+        npt.assert_array_almost_equal(acc.GY / A**2, GY / A**2)
+        maps, phis, thetas = acc.recovery_maps()
+        self.assertEqual(maps['p'].data.shape, (phis.size, thetas.size))
+        # same data again shouldn't change the running average
+        acc.update(data)
+        npt.assert_array_almost_equal(acc.Y, Y)
+        self.assertEqual(acc.nsegs, 2 * (DURATION - 1))
+
+
+class TestRecoverySequence(unittest.TestCase):
+    def test_warm_start(self):
+        stations = {0: [0, 0, 0], 1: [500, 0, 0], 2: [0, 500, 0]}
+        data = SeismometerArray.initialize_all_good(stations, DURATION,
+                chans_type='fast_chans', start_time=0)
+        data.add_p_wave(A, PHI, THETA, FF, DURATION, c=VEL)
+        thetas = np.arange(3, 180, 30) * np.pi / 180
+        phis = np.arange(3, 360, 30) * np.pi / 180
+        maps, phis, thetas, infos = recovery_sequence([data, data], 'p',
+                stations, FF, [VEL], thetas=thetas, phis=phis)
+        self.assertEqual(len(maps), 2)
+        # second solve starts at the answer
+        self.assertLess(infos[1]['itn'], infos[0]['itn'])
+        self.assertEqual(maps[1]['p'].get_contour(0.5)[1],
+                         maps[0]['p'].get_contour(0.5)[1])
+
+
+class TestRecoveryPaths(unittest.TestCase):
+    """
+    different ways of solving for the same map on an underdetermined
+    geometry (fewer real pair measurements than pixels)
+    """
+    def setUp(self):
+        self.stations = spiral(5, radius=500, height=50)
+        self.data = SeismometerArray.initialize_all_good(self.stations,
+                DURATION, chans_type='fast_chans')
+        self.data.add_p_wave(1e-6, np.pi / 3, np.pi / 2, FF, DURATION,
+                c=5700)
+        np.random.seed(1)
+        for station in self.data:
+            for chan in self.data[station]:
+                self.data[station][chan].value[:] += 1e-8 * np.random.randn(
+                        self.data[station][chan].size)
+        self.grid = dict(thetas=np.arange(3, 180, 12) * np.pi / 180,
+                         phis=np.arange(3, 360, 12) * np.pi / 180)
+
+    def recover(self, rec_str='p', v_list=[5700], **kwargs):
+        maps, phis, thetas = self.data.recovery_matrices(rec_str,
+                self.stations, FF, v_list, fftlength=4, overlap=2,
+                **dict(self.grid, **kwargs))
+        if rec_str == 'p':
+            return maps['p'].data
+        return maps
+
+    def assertSameMap(self, m1, m2, rtol):
+        a1 = np.abs(m1)
+        a2 = np.abs(m2)
+        self.assertEqual(np.unravel_index(np.argmax(a1), a1.shape),
+                         np.unravel_index(np.argmax(a2), a2.shape))
+        self.assertLess(np.linalg.norm(m1 - m2) / np.linalg.norm(m1), rtol)
+
+    def test_matrix_free_matches_default(self):
+        default = self.recover()
+        a = np.abs(default)
+        # source is at phi=60, theta=90
+        self.assertEqual(np.unravel_index(np.argmax(a), a.shape), (5, 7))
+        self.assertSameMap(default, self.recover(solver='matrix-free'), 0.1)
+
+    def test_paths_agree(self):
+        # the normal equations are badly conditioned, so the paths only
+        # agree to a few percent, not to rounding
+        rec_str, v_list = 'ps', [5700, 3000]
+        default = self.recover(rec_str, v_list)
+        acc = RecoveryAccumulator(rec_str, self.stations, FF, v_list,
+                                  fftlength=4, overlap=2, **self.grid)
+        acc.update(self.data)
+        others = [self.recover(rec_str, v_list, orf_cache=ORFCache()),
+                  self.recover(rec_str, v_list, stft_cache=STFTCache()),
+                  acc.recovery_maps()[0]]
+        for maps in others:
+            for pol in default:
+                self.assertSameMap(default[pol].data, maps[pol].data, 0.05)
+
+    def test_operator_mismatch(self):
+        op = self.data.recovery_operator('p', self.stations, FF, [5700],
+                                         **self.grid)
+        a = np.abs(self.recover(operator=op))
+        self.assertEqual(np.unravel_index(np.argmax(a), a.shape), (5, 7))
+        fname = os.path.join(tempfile.mkdtemp(), 'op.npz')
+        try:
+            op.save(fname)
+            op = RecoveryOperator.load(fname)
+        finally:
+            shutil.rmtree(os.path.dirname(fname))
+        # anything the operator wasn't built for is an error, not a
+        # wrong map
+        self.assertRaises(ValueError, self.recover, 'ps', [5700, 3000],
+                          operator=op)
+        self.assertRaises(ValueError, self.recover, v_list=[3000],
+                          operator=op)
+        self.assertRaises(ValueError, self.data.recovery_matrices, 'p',
+                          self.stations, 2 * FF, [5700], fftlength=4,
+                          overlap=2, operator=op, **self.grid)
+        self.assertRaises(ValueError, self.data.recovery_matrices, 'p',
+                          self.stations, FF, [5700], fftlength=4, overlap=2,
+                          operator=op)
+
+
+class TestChannelArray(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.seis = Seismometer.initialize_all_good(DURATION,
+                                                    location=[1, 2, 3])
+        for chan in ['HHE', 'HHN', 'HHZ']:
+            self.seis[chan].value[:] = np.random.randn(self.seis[chan].size)
+
+    def test_round_trip(self):
+        arrays = self.seis.to_channel_arrays()
+        self.assertEqual(list(arrays.keys()), [100, 1, 0.1])
+        self.assertEqual(arrays[100].channels, ['HHE', 'HHN', 'HHZ'])
+        seis = Seismometer.from_channel_arrays(arrays)
+        self.assertEqual(list(seis.keys()), list(self.seis.keys()))
+        for chan in seis.keys():
+            npt.assert_array_equal(seis[chan].value, self.seis[chan].value)
+            self.assertEqual(seis[chan].sample_rate,
+                             self.seis[chan].sample_rate)
+        npt.assert_array_equal(seis['HHZ'].location, [1, 2, 3])
+
+    def test_vectorized_operations(self):
+        arr = ChannelArray.from_traces(self.seis)
+        filtered = arr.bandpass(1, 10)
+        for chan in arr.channels:
+            npt.assert_array_almost_equal(filtered[chan].value,
+                                          self.seis[chan].bandpass(1, 10).value)
+        csdm = arr.csd_matrix()
+        self.assertEqual(csdm.value.shape, (101, 3, 3))
+        arr.inject(np.array([1, 0, 2])[:, None], channels=['HHE', 'HHN',
+                                                           'HHZ'])
+        npt.assert_array_almost_equal(arr['HHZ'].value,
+                                      self.seis['HHZ'].value + 2)
+
+
 if __name__ == "__main__":
     unittest.main()
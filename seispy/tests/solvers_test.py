@@ -0,0 +1,173 @@
+from __future__ import division
+import matplotlib
+
+matplotlib.use('agg')
+import unittest
+from ..utils.solvers import *
+import numpy.testing as npt
+import numpy as np
+import os
+import shutil
+import tempfile
+from scipy.sparse.linalg import lsqr
+from collections import OrderedDict
+from ..utils.orfcache import ORFCache
+from ..utils.spectral import CSDMatrix
+
+NPAIRS = 40
+M = 10
+
+
+class TestSolvers(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(1)
+        self.G = np.random.randn(NPAIRS, M) + 1j * np.random.randn(NPAIRS, M)
+        self.x = np.random.randn(M)
+        self.Y = np.dot(self.G, self.x)
+
+    def test_design_operator(self):
+        # operator should match explicitly stacked real matrix
+        A = design_operator(self.G)
+        A_dense = np.vstack((np.real(self.G), np.imag(self.G)))
+        b = np.random.randn(2 * NPAIRS)
+        npt.assert_array_almost_equal(A.matvec(self.x), np.dot(A_dense,
+                                                               self.x))
+        npt.assert_array_almost_equal(A.rmatvec(b), np.dot(A_dense.T, b))
+
+    def test_matrix_free_matches_dense(self):
+        GG = np.dot(np.conj(self.G).T, self.G)
+        GY = np.dot(np.conj(self.G).T, self.Y)
+        S_dense = lsqr(np.real(GG), np.real(GY), atol=1e-12, btol=1e-12)
+        S_free = solve_matrix_free(self.G, self.Y, atol=1e-12, btol=1e-12)
+        npt.assert_array_almost_equal(S_dense[0], S_free[0])
+        npt.assert_array_almost_equal(S_free[0], self.x)
+
+    def test_warm_start(self):
+        cold = lsqr_info(solve_matrix_free(self.G, self.Y, atol=1e-12,
+                                           btol=1e-12))
+        npt.assert_array_almost_equal(cold['x'], self.x)
+        # starting from the answer there is nothing left to do
+        warm = lsqr_info(solve_matrix_free(self.G, self.Y, atol=1e-12,
+                                           btol=1e-12, x0=cold['x']))
+        npt.assert_array_almost_equal(warm['x'], self.x)
+        self.assertLessEqual(warm['itn'], 2)
+
+    def test_warm_start_underdetermined(self):
+        # a real (underdetermined, badly conditioned) array geometry. A
+        # warm start from lsqr's answer should stop right away without
+        # making the residual worse
+        locs = OrderedDict([(ii, [500 * np.cos(ii), 500 * np.sin(ii),
+                                  50 * ii]) for ii in range(5)])
+        G, pairs, shapes = design_matrix('p', locs, 1, [5700],
+                thetas=np.arange(3, 180, 12) * np.pi / 180,
+                phis=np.arange(3, 360, 12) * np.pi / 180)
+        x = np.zeros(G.shape[1])
+        x[100] = 1
+        Y = np.dot(G, x) + 1e-3 * np.random.randn(G.shape[0])
+        GG = np.real(np.dot(np.conj(G).T, G))
+        GY = np.real(np.dot(np.conj(G).T, Y))
+        for solve, args in [(solve_lsqr, (GG, GY)),
+                            (solve_matrix_free, (G, Y))]:
+            cold = lsqr_info(solve(*args))
+            warm = lsqr_info(solve(*args, x0=cold['x']))
+            self.assertLessEqual(warm['itn'], 2)
+            self.assertLessEqual(warm['r1norm'], 1.001 * cold['r1norm'])
+
+
+class TestRecoveryOperator(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(2)
+        self.G = np.random.randn(NPAIRS, M) + 1j * np.random.randn(NPAIRS, M)
+        self.x = np.random.randn(M)
+        self.pairs = [(ii, ii, 'HHE', 'HHE') for ii in range(NPAIRS)]
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_solve(self):
+        op = RecoveryOperator(self.G, self.pairs, [(M, 1)], rcond=1e-10)
+        npt.assert_array_almost_equal(op.solve(np.dot(self.G, self.x)),
+                                      self.x)
+        self.assertEqual(op.rank, M)
+
+    def test_info(self):
+        op = RecoveryOperator(self.G, self.pairs, [(M, 1)], rcond=0.99)
+        Y = np.dot(self.G, self.x)
+        info = op.info(Y)
+        self.assertLess(info['rank'], M)
+        self.assertEqual(info['rcond'], 0.99)
+        A = np.vstack((np.real(self.G), np.imag(self.G)))
+        self.assertAlmostEqual(info['rnorm'], np.linalg.norm(
+            np.dot(A, info['x']) - data_vector(Y)))
+        self.assertFalse('istop' in info)
+
+    def test_save_load(self):
+        op = RecoveryOperator(self.G, self.pairs, [(M, 1)])
+        fname = os.path.join(self.tmpdir, 'op.npz')
+        op.save(fname)
+        op2 = RecoveryOperator.load(fname)
+        npt.assert_array_equal(op.pinv, op2.pinv)
+        self.assertEqual(op.pairs, op2.pairs)
+        self.assertEqual(op.shapes, op2.shapes)
+        self.assertEqual(op.rank, op2.rank)
+        Y = np.dot(self.G, self.x)
+        self.assertAlmostEqual(op.residual_norm(Y), op2.residual_norm(Y))
+
+    def test_recovery_pairs(self):
+        pairs = recovery_pairs(['A', 'B'], ['HHE', 'HHZ'])
+        self.assertEqual(len(pairs), 9)
+        pairs = recovery_pairs(['A', 'B'], ['HHE', 'HHZ'],
+                               autocorrelations=False)
+        self.assertEqual(len(pairs), 5)
+        self.assertFalse(('A', 'A', 'HHE', 'HHE') in pairs)
+
+
+class TestDesignMatrix(unittest.TestCase):
+    def test_matches_pair_orfs(self):
+        # batched orfs should give exactly what we get pair by pair
+        locs = OrderedDict([('A', [0, 0, 0]), ('B', [300, 100, -50]),
+                            ('C', [-200, 400, 20])])
+        for rec_str, v_list in [('p', [5700]), ('s', [3000]), ('r', [2500]),
+                                ('psr', [5700, 3000, 2500])]:
+            G, pairs, shapes = design_matrix(rec_str, locs, 1, v_list,
+                                             autocorrelations=False)
+            self.assertEqual(pairs, recovery_pairs(list(locs.keys()),
+                ['HHE', 'HHN', 'HHZ'], autocorrelations=False))
+            for ii, (s1, s2, c1, c2) in enumerate(pairs):
+                g, g_shapes = pair_orfs(rec_str, v_list, c1, c2, locs[s1],
+                                        locs[s2], 1, orf_cache=ORFCache())
+                npt.assert_array_almost_equal(G[ii], g[:, 0])
+            self.assertEqual(shapes, g_shapes)
+
+    def test_normal_equations(self):
+        locs = OrderedDict([('A', [0, 0, 0]), ('B', [300, 100, -50]),
+                            ('C', [-200, 400, 20])])
+        channels = ['HHE', 'HHN', 'HHZ']
+        keys = [(station, chan) for station in locs for chan in channels]
+        np.random.seed(3)
+        csdm = CSDMatrix.from_arrays(np.random.randn(len(keys), 1000), keys,
+                                     10, 4, overlap=2)
+        grid = dict(thetas=np.arange(3, 180, 30) * np.pi / 180,
+                    phis=np.arange(3, 360, 30) * np.pi / 180)
+        G, pairs, shapes = design_matrix('ps', locs, 1, [5700, 3000], **grid)
+        Y = pair_csds(csdm, pairs, 1)
+        # nearest bin is used when f isn't exactly on one
+        npt.assert_array_equal(pair_csds(csdm, pairs, 1 + 1e-9), Y)
+        npt.assert_array_equal(pair_csds(csdm, pairs, 0.1 + 0.2 + 0.7), Y)
+        # above the highest (5 Hz) bin
+        self.assertRaises(ValueError, pair_csds, csdm, pairs, 6)
+        self.assertRaises(ValueError, pair_csds, csdm, pairs, 0, nbins=1)
+        GG, GY, shapes = normal_equations('ps', locs, 1, [5700, 3000], csdm,
+                                          **grid)
+        npt.assert_array_almost_equal(GG, np.real(np.dot(np.conj(G).T, G)))
+        npt.assert_array_almost_equal(GY, np.real(np.dot(np.conj(G).T, Y)))
+        # parallel reduction is identical to serial
+        GG2, GY2, shapes2 = normal_equations('ps', locs, 1, [5700, 3000],
+                                             csdm, nproc=2, **grid)
+        npt.assert_array_equal(GG, GG2)
+        npt.assert_array_equal(GY, GY2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+from __future__ import division
+import matplotlib
+
+matplotlib.use('agg')
+import unittest
+from ..utils.spectral import *
+from ..utils.stftcache import STFTCache
+from ..trace import Trace
+import numpy.testing as npt
+import numpy as np
+from scipy.signal import csd
+import shutil
+import tempfile
+
+SAMPLE_FREQ = 100
+FFTLENGTH = 2
+OVERLAP = 1
+
+
+class TestCSDMatrix(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.data = np.random.randn(3, 20 * SAMPLE_FREQ)
+
+    def test_segment_view(self):
+        segs = segment_view(np.arange(10), 4, 2)
+        npt.assert_array_equal(segs, [[0, 1, 2, 3], [2, 3, 4, 5],
+                                      [4, 5, 6, 7], [6, 7, 8, 9]])
+
+    def test_csd_matrix_matches_scipy(self):
+        # every element of the matrix should match a pairwise welch csd
+        mat, freqs, nsegs = csd_matrix(self.data, SAMPLE_FREQ, FFTLENGTH,
+                                       overlap=OVERLAP)
+        for ii in range(3):
+            for jj in range(3):
+                f, pxy = csd(self.data[ii], self.data[jj], fs=SAMPLE_FREQ,
+                             window='hann', nperseg=FFTLENGTH * SAMPLE_FREQ,
+                             noverlap=OVERLAP * SAMPLE_FREQ)
+                npt.assert_array_almost_equal(freqs, f)
+                npt.assert_array_almost_equal(mat[:, ii, jj], pxy)
+
+    def test_unaveraged_csd_matrix(self):
+        mat, freqs, nsegs = csd_matrix(self.data, SAMPLE_FREQ, FFTLENGTH,
+                                       overlap=OVERLAP, average=False)
+        avg, freqs, nsegs = csd_matrix(self.data, SAMPLE_FREQ, FFTLENGTH,
+                                       overlap=OVERLAP)
+        self.assertEqual(mat.shape, (nsegs, freqs.size, 3, 3))
+        npt.assert_array_almost_equal(mat.mean(0), avg)
+
+    def test_narrowband_csd_matrix(self):
+        full, freqs, nsegs = csd_matrix(self.data, SAMPLE_FREQ, FFTLENGTH,
+                                        overlap=OVERLAP)
+        bins = [0, 9.5, 10, 10.5, 50]
+        mat, nb_freqs, nb_nsegs = csd_matrix(self.data, SAMPLE_FREQ,
+                                             FFTLENGTH, overlap=OVERLAP,
+                                             frequencies=bins)
+        idxs = [np.where(freqs == f)[0][0] for f in bins]
+        npt.assert_array_equal(nb_freqs, freqs[idxs])
+        self.assertEqual(nb_nsegs, nsegs)
+        npt.assert_array_almost_equal(mat, full[idxs])
+        self.assertRaises(ValueError, csd_matrix, self.data, SAMPLE_FREQ,
+                          FFTLENGTH, frequencies=[10.25])
+
+    def test_csd_lookup(self):
+        keys = [('A', 'HHE'), ('A', 'HHN'), ('B', 'HHE')]
+        csdm = CSDMatrix.from_arrays(self.data, keys, SAMPLE_FREQ, FFTLENGTH,
+                                     overlap=OVERLAP)
+        npt.assert_array_almost_equal(csdm.csd(('A', 'HHN'), ('B', 'HHE')),
+                                      csdm.value[:, 1, 2])
+        self.assertRaises(KeyError, csdm.csd, ('C', 'HHE'), ('A', 'HHE'))
+
+
+class TestRealSpectra(unittest.TestCase):
+    def test_twosided_spectrum(self):
+        np.random.seed(0)
+        for nfft in [200, 201]:
+            data = np.random.randn(3, nfft)
+            spec, freqs = rfft_spectrum(data, SAMPLE_FREQ, window='hanning')
+            expected = np.fft.fft(data * np.hanning(nfft)) / nfft
+            npt.assert_array_almost_equal(twosided_spectrum(spec, nfft),
+                                          expected)
+            npt.assert_array_almost_equal(freqs, np.abs(np.fft.fftfreq(nfft,
+                1. / SAMPLE_FREQ)[:nfft // 2 + 1]))
+            # frequency along first axis
+            npt.assert_array_almost_equal(
+                twosided_spectrum(spec.T, nfft, axis=0), expected.T)
+
+
+class TestSTFTCache(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.trs = [Trace(np.random.randn(20 * SAMPLE_FREQ),
+                          sample_rate=SAMPLE_FREQ, channel='X1:HH%d' % ii)
+                    for ii in range(3)]
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cached_csds(self):
+        cache = STFTCache()
+        data = np.vstack([tr.value for tr in self.trs])
+        expected, freqs, nsegs = csd_matrix(data, SAMPLE_FREQ, FFTLENGTH,
+                                            overlap=OVERLAP)
+        for ii in range(2):
+            stfts = [cache(tr, FFTLENGTH, overlap=OVERLAP) for tr in self.trs]
+            csd, n = csd_from_ffts(np.array([st[0] for st in stfts]),
+                                   stfts[0][2])
+            npt.assert_array_almost_equal(csd, expected)
+            self.assertEqual(n, nsegs)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.hits, 3)
+        psd, f = cache.psd(self.trs[0], FFTLENGTH, overlap=OVERLAP)
+        npt.assert_array_almost_equal(psd, np.real(expected[:, 0, 0]))
+        self.assertEqual(cache.hits, 4)
+
+    def test_spill_to_disk(self):
+        ffts = STFTCache()(self.trs[0], FFTLENGTH, overlap=OVERLAP)[0]
+        # room for one channel in memory
+        cache = STFTCache(max_bytes=ffts.nbytes * 1.5, spill_dir=self.tmpdir)
+        for tr in self.trs:
+            cache(tr, FFTLENGTH, overlap=OVERLAP)
+        self.assertEqual(len(cache), 1)
+        # evicted channel comes back from disk as a memmap
+        cache_ffts = cache(self.trs[0], FFTLENGTH, overlap=OVERLAP)[0]
+        self.assertTrue(isinstance(cache_ffts, np.memmap))
+        npt.assert_array_equal(cache_ffts, ffts)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.hits, 1)
+
+    def test_key(self):
+        tr = self.trs[0]
+        key = STFTCache.key(tr, FFTLENGTH, overlap=OVERLAP)
+        self.assertEqual(key, STFTCache.key(tr, FFTLENGTH, overlap=OVERLAP))
+        self.assertNotEqual(key, STFTCache.key(tr, FFTLENGTH))
+        self.assertNotEqual(key, STFTCache.key(tr, FFTLENGTH, overlap=OVERLAP,
+                                               window='hamming'))
+        self.assertNotEqual(key, STFTCache.key(self.trs[1], FFTLENGTH,
+                                               overlap=OVERLAP))
+
+
+if __name__ == "__main__":
+    unittest.main()
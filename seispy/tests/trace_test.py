@@ -1,5 +1,18 @@
-from ..trace import Trace, fetch
+from ..trace import Trace, fetch, coherence_matrix
+from ..trace.trace import sliding_abs_mean, weighted_renormalization
+from ..trace.trace import _stacked_coherence, boxcar_smooth, analytic_signal
+from ..trace.trace import plan_frame_reads, parse_frame_name, fetch_channels
+from ..trace.trace import iter_fetch
+from ..trace.pipeline import PreprocessingPipeline
+from ..trace.catalog import FrameCatalog
+from ..utils.spectral import twosided_spectrum
 import unittest
+import numpy as np
+import numpy.testing as npt
+import os
+import shutil
+import tempfile
+import warnings
 
 EPOCH_START = 1125384593
 EPOCH_END = 1125384693
@@ -17,5 +30,320 @@ class TraceTest(unittest.TestCase):
         self.assertTrue(data.times.value[-1] == EPOCH_END - data.dx.value)
         self.assertTrue(data.dx.value == 1. / EXPECTED_SRATE)
 
+    def test_plan_frame_reads(self):
+        frames = [('M-%d-100.gwf' % fst, fst, 100) for fst in [200, 0, 100]]
+        self.assertEqual(parse_frame_name('./M-1/M-1125384593-4096.gwf'),
+                         (1125384593, 4096))
+        plan = plan_frame_reads(frames, 50, 250)
+        self.assertEqual(plan, [('M-0-100.gwf', 50, 100),
+                                ('M-100-100.gwf', 100, 200),
+                                ('M-200-100.gwf', 200, 250)])
+        # frame ending on start time isn't read
+        self.assertEqual(plan_frame_reads(frames, 100, 150),
+                         [('M-100-100.gwf', 100, 150)])
+        # gaps are only an error if asked for
+        self.assertEqual(plan_frame_reads(frames[:2], 50, 250),
+                         [('M-0-100.gwf', 50, 100),
+                          ('M-200-100.gwf', 200, 250)])
+        self.assertRaises(ValueError, plan_frame_reads, frames[:2], 50, 250,
+                          strict=True)
+        # so are missing frames at either end
+        self.assertRaises(ValueError, plan_frame_reads, frames[1:], 50, 250,
+                          strict=True)
+        self.assertRaises(ValueError, plan_frame_reads, frames[1:], 0, 350,
+                          strict=True)
+        self.assertEqual(plan_frame_reads(frames, 50, 250, strict=True), plan)
+
+class FrameCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.framedir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.framedir, 'M-11253'))
+        for fst in [1125380000, 1125380100, 1125380200]:
+            self.touch(fst)
+
+    def tearDown(self):
+        shutil.rmtree(self.framedir)
+
+    def touch(self, fst, dur=100):
+        fname = os.path.join(self.framedir, 'M-%s' % str(fst)[:5],
+                             'M-%d-%d.gwf' % (fst, dur))
+        open(fname, 'w').close()
+        return os.path.normpath(fname)
+
+    def test_query(self):
+        catalog = FrameCatalog(self.framedir, list_channels=False)
+        frames = catalog.query(1125380050, 1125380200)
+        self.assertEqual([f[1:] for f in frames], [(1125380000, 100),
+                                                   (1125380100, 100)])
+        self.assertEqual(catalog.query(1125380300, 1125380400), [])
+        self.assertFalse(catalog.update(1125380050, 1125380200))
+
+    def test_incremental_update_and_reload(self):
+        path = os.path.join(self.framedir, 'catalog.npz')
+        catalog = FrameCatalog(self.framedir, path=path, list_channels=False)
+        catalog.update()
+        self.assertEqual(len(catalog), 3)
+        new = self.touch(1125380300)
+        # make sure directory looks modified
+        os.utime(os.path.dirname(new), (0, 0))
+        self.assertEqual(catalog.query(1125380250, 1125380350)[-1],
+                         (new, 1125380300, 100))
+        catalog2 = FrameCatalog(self.framedir, path=path)
+        self.assertEqual(len(catalog2), 4)
+        self.assertFalse(catalog2.update())
+
+    def test_load_other_framedir(self):
+        path = os.path.join(self.framedir, 'catalog.npz')
+        FrameCatalog(self.framedir, path=path, list_channels=False).update()
+        self.assertRaises(ValueError, FrameCatalog, './elsewhere', path=path)
+
+    def test_coarse_mtimes(self):
+        catalog = FrameCatalog(self.framedir, list_channels=False)
+        directory = os.path.join(self.framedir, 'M-11253')
+        catalog.update()
+        # new frame lands without the directory's mtime changing
+        mtime = os.path.getmtime(directory)
+        self.touch(1125380300)
+        os.utime(directory, (mtime, mtime))
+        # directory was listed right after it was modified, so we
+        # can't trust its mtime and list it again
+        self.assertTrue(catalog.update())
+        self.assertEqual(len(catalog), 4)
+        # an old mtime is trusted, unless we ask for a rescan
+        os.utime(directory, (0, 0))
+        catalog.update()
+        self.touch(1125380400)
+        os.utime(directory, (0, 0))
+        self.assertFalse(catalog.update())
+        self.assertEqual(len(catalog.query(1125380400, 1125380500,
+                                           rescan=True)), 1)
+
+    def test_unreadable_frames(self):
+        # placeholder frames are empty, so every read fails
+        catalog = FrameCatalog(self.framedir, list_channels=False)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertRaises(ValueError, fetch_channels, 1125380050,
+                              1125380200, ['DEAD:HHZ'], catalog=catalog,
+                              nproc=2, skip_failures=True)
+        self.assertEqual(len(caught), 2)
+
+    def test_array_fetch_failures(self):
+        from ..station import SeismometerArray
+        catalog = FrameCatalog(self.framedir, list_channels=False)
+        # unreadable frames are an error unless asked to skip them
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertRaises(Exception, SeismometerArray.fetch_data,
+                              1125380050, 1125380200, catalog=catalog,
+                              stations=['DEAD'])
+            self.assertRaises(Exception, next, SeismometerArray.iter_fetch(
+                1125380050, 1125380200, 100, catalog=catalog,
+                stations=['DEAD']))
+        self.assertEqual(len(caught), 0)
+
+    def test_iter_fetch_errors(self):
+        catalog = FrameCatalog(self.framedir, list_channels=False)
+        chunks = iter_fetch(['DEAD:HHZ'], 1125380000, 1125380300, 100,
+                            catalog=catalog, prefetch=2)
+        # errors from the background reader come out of the iterator
+        self.assertRaises(Exception, next, chunks)
+        self.assertRaises(ValueError, next, iter_fetch(['DEAD:HHZ'],
+                          1125380000, 1125380300, 0, catalog=catalog))
+
+
+class RenormalizationTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.data = np.random.randn(1000)
+        self.weights = np.random.randn(1000)
+
+    def _slow_means(self, data, Nsamps):
+        # window semantics of the original per-sample loop
+        means = np.zeros(data.size)
+        for idx in range(data.size):
+            if idx >= Nsamps and idx + Nsamps <= data.size:
+                means[idx] = np.mean(np.abs(data[idx - Nsamps:idx + Nsamps]))
+            elif idx - Nsamps < 0:
+                means[idx] = np.mean(np.abs(data[:idx + Nsamps]))
+            else:
+                means[idx] = np.mean(np.abs(data[idx - Nsamps:]))
+        return means
+
+    def test_sliding_abs_mean(self):
+        for Nsamps in [1, 10, 600]:
+            expected = self._slow_means(self.data, Nsamps)
+            npt.assert_array_almost_equal(sliding_abs_mean(self.data,
+                                                           Nsamps), expected)
+            npt.assert_array_almost_equal(sliding_abs_mean(self.data, Nsamps,
+                                          chunksize=37), expected)
+
+    def test_weighted_renormalization(self):
+        expected = self.data / self._slow_means(self.weights, 50)
+        npt.assert_array_almost_equal(weighted_renormalization(self.data,
+                                      self.weights, 50), expected)
+        out = np.zeros(self.data.size)
+        weighted_renormalization(self.data, self.weights, 50, chunksize=64,
+                                 out=out)
+        npt.assert_array_almost_equal(out, expected)
+    def test_boxcar_smooth(self):
+        for Nsamps in [1, 2, 7, 200]:
+            expected = np.convolve(self.data, np.ones(Nsamps) / Nsamps,
+                                   'same')
+            npt.assert_array_almost_equal(boxcar_smooth(self.data, Nsamps),
+                                          expected)
+            npt.assert_array_almost_equal(boxcar_smooth(self.data, Nsamps,
+                                          chunksize=37), expected)
+
+    def test_analytic_signal(self):
+        from scipy.signal import hilbert
+        data = np.random.randn(10007)
+        expected = hilbert(data)
+        npt.assert_array_almost_equal(analytic_signal(data).real, data)
+        # envelope is unchanged by default, right up to the ends
+        npt.assert_array_almost_equal(np.abs(analytic_signal(data)),
+                                      np.abs(expected))
+        chunked = analytic_signal(data, chunksize=1000, pad=2000)
+        # overlap takes care of chunk edges away from the ends
+        self.assertTrue(np.max(np.abs(chunked - expected)[2000:-2000]) <
+                        0.02 * np.max(np.abs(expected)))
+        # padding to a fast length only changes the envelope near the ends
+        fast = analytic_signal(data, fast=True)
+        npt.assert_array_almost_equal(fast.real, data)
+        self.assertTrue(np.max(np.abs(np.abs(fast) - np.abs(expected))
+                               [2000:-2000]) <
+                        0.01 * np.max(np.abs(expected)))
+
+
+class PreprocessingPipelineTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        sample_rate = 10
+        times = np.arange(2 * 3600 * sample_rate) / float(sample_rate)
+        data = np.random.randn(times.size) +\
+            20 * np.sin(2 * np.pi * 0.05 * times)
+        self.trace = Trace(data, sample_rate=sample_rate, t0=1e9)
+
+    def test_chunks_match_whole_trace(self):
+        pipe = PreprocessingPipeline(bandpass=(0.1, 2),
+                                     normtype='weighted_renorm', normlen=50,
+                                     chunklen=1800)
+        expected = pipe.process_trace(self.trace).value
+        chunks = list(pipe.chunks(self.trace))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[1].t0.value, 1e9 + 1800)
+        processed = pipe.process(self.trace)
+        npt.assert_array_equal(processed.value,
+                               np.hstack([c.value for c in chunks]))
+        # only per-chunk detrending is different
+        self.assertTrue(np.max(np.abs(processed.value - expected)) <
+                        1e-2 * np.max(np.abs(expected)))
+
+    def test_stack_spectra(self):
+        pipe = PreprocessingPipeline(chunklen=1000)
+        csd, asd1, asd2, freqs = pipe.stack_spectra(self.trace, self.trace,
+                                                    100)
+        # same thing all at once, with two-sided ffts
+        data = self.trace.value
+        Nsamps = 1000
+        win = np.hanning(Nsamps)
+        ffts = np.array([np.fft.fft(data[idx:idx + Nsamps] * win) / Nsamps
+                         for idx in range(0, data.size - Nsamps + 1,
+                                          Nsamps // 2)])
+        npt.assert_array_almost_equal(twosided_spectrum(csd, Nsamps),
+                                      np.mean(np.abs(ffts)**2, 0))
+        npt.assert_array_almost_equal(twosided_spectrum(asd1, Nsamps),
+                                      np.sqrt(np.mean(np.abs(ffts)**2, 0)))
+        npt.assert_array_almost_equal(freqs, np.fft.rfftfreq(Nsamps, d=0.1))
+
+
+class CoherenceTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(1)
+        common = np.random.randn(6000)
+        self.data1 = common + np.random.randn(common.size)
+        self.data2 = np.roll(common, 20) + np.random.randn(common.size)
+        self.tr1 = Trace(self.data1, sample_rate=100)
+        self.tr2 = Trace(self.data2, sample_rate=100)
+        self.tr1.location = np.zeros(3)
+        self.tr2.location = np.ones(3)
+
+    def _ffts(self, data, Nsamps):
+        # one two-sided fft per half-overlapping segment
+        window = np.hanning(Nsamps)
+        return np.array([np.fft.fft(data[idx:idx + Nsamps] * window) / Nsamps
+                         for idx in range(0, data.size - Nsamps + 1,
+                                          Nsamps // 2)])
+
+    def _shift(self, coh_ts):
+        N = coh_ts.size
+        return np.hstack((coh_ts[N // 2:], coh_ts[:N // 2])).real
+
+    def test_freq_stack(self):
+        fft1 = self._ffts(self.data1, 200)
+        fft2 = self._ffts(self.data2, 200)
+        coh = np.mean(np.conj(fft1) * fft2, 0) /\
+            np.sqrt(np.mean(np.abs(fft1)**2, 0) * np.mean(np.abs(fft2)**2, 0))
+        coh_ts = self.tr1.coherence(self.tr2, fftlength=2)
+        npt.assert_array_almost_equal(coh_ts.value,
+                                      self._shift(np.fft.ifft(coh)))
+        # delay between traces
+        self.assertEqual(np.argmax(coh_ts.value) - 100, 20)
+
+    def test_default_fftlength(self):
+        # one fft over the whole of each trace
+        coh_ts = self.tr1.coherence(self.tr2)
+        self.assertEqual(coh_ts.size, self.data1.size)
+        npt.assert_array_almost_equal(
+            coh_ts.value, self.tr1.coherence(
+                self.tr2, fftlength=self.data1.size / 100.).value)
+        npt.assert_array_almost_equal(
+            coherence_matrix([self.tr1, self.tr2])[0, 1], coh_ts.value)
+
+    def test_ts_stack(self):
+        fft1 = self._ffts(self.data1, 200)
+        fft2 = self._ffts(self.data2, 200)
+        coh = np.conj(fft1) * fft2 / (np.abs(fft1) * np.abs(fft2))
+        expected = np.mean(np.fft.ifft(coh, axis=-1), 0)
+        coh_ts = self.tr1.coherence(self.tr2, fftlength=2, stacktype='ts')
+        npt.assert_array_almost_equal(coh_ts.value, self._shift(expected))
+
+    def test_coherence_calc(self):
+        # one-sided spectra give the same answer as two-sided ones
+        tr1, tr2 = self.tr1[:200], self.tr2[:200]
+        fft1 = np.fft.fft(tr1.value * np.hanning(200)) / 200
+        fft2 = np.fft.fft(tr2.value * np.hanning(200)) / 200
+        npt.assert_array_almost_equal(
+            twosided_spectrum(tr1.fft_new().value, 200), fft1)
+        coh = np.conj(fft1) * fft2 / (np.abs(fft1) * np.abs(fft2))
+        npt.assert_array_almost_equal(tr1.coherence_calc(tr2).value,
+                                      np.fft.ifft(coh).real)
+        # 'spec' is two-sided and fftshifted, 'rspec' is one-sided
+        npt.assert_array_almost_equal(
+            tr1.coherence_calc(tr2, outtype='spec'), np.fft.fftshift(coh))
+        rspec = tr1.coherence_calc(tr2, outtype='rspec')
+        freqs = np.fft.rfftfreq(200, 0.01)
+        self.assertEqual(rspec.size, freqs.size)
+        self.assertEqual(freqs[-1], 50)
+        npt.assert_array_almost_equal(rspec, coh[:101])
+        # per-segment (looped) stacking matches the batched one
+        npt.assert_array_almost_equal(
+            self.tr1._looped_coherence(self.tr2, 2),
+            _stacked_coherence(self.data1, self.data2, 200))
+
+    def test_coherence_matrix(self):
+        tr3 = Trace(np.random.randn(self.data1.size), sample_rate=100)
+        tr3.location = np.zeros(3)
+        traces = [self.tr1, self.tr2, tr3]
+        for stacktype in ['freq', 'ts']:
+            coh = coherence_matrix(traces, fftlength=2, stacktype=stacktype)
+            self.assertEqual(coh.shape, (3, 3, 200))
+            for ii in range(3):
+                for jj in range(3):
+                    npt.assert_array_almost_equal(coh[ii, jj],
+                        traces[ii].coherence(traces[jj], fftlength=2,
+                                             stacktype=stacktype).value)
+
+
 if __name__ == "__main__":
     unittest.main()
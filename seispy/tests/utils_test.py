@@ -4,8 +4,13 @@ matplotlib.use('agg')
 import unittest
 from ..utils.orfs import *
 from ..utils.utils import *
+from ..utils.orfcache import ORFCache
+from ..utils.skygrid import *
 import numpy.testing as npt
 import numpy as np
+import shutil
+from collections import OrderedDict
+import tempfile
 
 
 class TestOrfs(unittest.TestCase):
@@ -88,6 +93,101 @@ class TestUtils(unittest.TestCase):
         dt = calc_travel_time(delta_vec, OMEGA, v)
         npt.assert_array_almost_equal(dt, np.array([1, 0, 0]))
 
+    def test_travel_time_tensor(self):
+        locs = OrderedDict([('A', [0, 0, 0]), ('B', [1000, 0, 0]),
+                            ('C', [0, 500, 250])])
+        OMEGA, omg_shape = sky_directions(np.arange(3, 180, 6) * np.pi / 180,
+                                          np.arange(3, 360, 6) * np.pi / 180)
+        dt, pairs = travel_time_tensor(locs, OMEGA, 3000)
+        self.assertEqual(dt.shape, (6, OMEGA.shape[0]))
+        for ii, (s1, s2) in enumerate(pairs):
+            delta = np.array(locs[s1]) - np.array(locs[s2])
+            npt.assert_array_almost_equal(dt[ii],
+                                          calc_travel_time(delta, OMEGA, 3000))
+        # orfs built from a slice of the tensor match the direct calculation
+        ii = pairs.index(('B', 'C'))
+        g1 = orf_p_directional([1, 0, 0], [0, 0, 1], locs['B'], locs['C'],
+                               3000, 1)[0]
+        g2 = orf_p_directional([1, 0, 0], [0, 0, 1], locs['B'], locs['C'],
+                               3000, 1, dt=dt[ii])[0]
+        npt.assert_array_almost_equal(g1, g2)
+
+
+class TestSkyGrid(unittest.TestCase):
+    def test_equal_area_grid(self):
+        for nside in [1, 2, 8]:
+            grid = EqualAreaGrid(nside)
+            self.assertEqual(grid.npix, 12 * nside**2)
+            self.assertAlmostEqual(grid.areas.sum(), 4 * np.pi)
+            # pixels are spread evenly over the whole sphere
+            npt.assert_array_almost_equal(grid.directions().mean(0),
+                                          np.zeros(3))
+            self.assertEqual(np.unique(np.round(grid.thetas, 10)).size,
+                             4 * nside - 1)
+            self.assertEqual((grid.thetas == np.pi / 2).sum(), 4 * nside)
+
+    def test_mesh_grid_orfs(self):
+        # a mesh grid should give the same orfs as thetas and phis
+        grid = MeshGrid()
+        g1, p, t = orf_s_directional([1, 0, 0], [0, 1, 0], [0, 0, 0],
+                                     [100, 200, 0], 3000, 1)[1:]
+        g2, p, t = orf_s_directional([1, 0, 0], [0, 1, 0], [0, 0, 0],
+                                     [100, 200, 0], 3000, 1, grid=grid)[1:]
+        npt.assert_array_almost_equal(g1, g2)
+        npt.assert_array_equal(grid.map_axes()[0], t)
+
+    def test_equal_area_orfs(self):
+        grid = EqualAreaGrid(4)
+        g, p, t = orf_p_directional([1, 0, 0], [1, 0, 0], [0, 0, 0],
+                                    [100, 200, 0], 3000, 1, grid=grid)
+        self.assertEqual(g.shape, (grid.npix,))
+        npt.assert_array_almost_equal(g, np.sin(grid.thetas)**2 *
+            np.cos(grid.phis)**2 * np.exp(-2 * np.pi * 1j *
+            np.dot(grid.directions(), [-100, -200, 0]) / 3000))
+
+
+class TestORFCache(unittest.TestCase):
+    def setUp(self):
+        self.args = ([1, 0, 0], [0, 1, 0], [0, 0, 0], [100, 20, 0], 3000, 1)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_matches_orf_picker(self):
+        cache = ORFCache()
+        for string in ['p', 's', 'r']:
+            expected = orf_picker(string, *self.args)
+            first = cache(string, *self.args)
+            second = cache(string, *self.args)
+            for e, f, s in zip(expected, first, second):
+                npt.assert_array_almost_equal(e, f)
+                npt.assert_array_almost_equal(e, s)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.hits, 3)
+
+    def test_disk_cache(self):
+        cache = ORFCache(cache_dir=self.tmpdir)
+        g1, g2, s1, s2 = cache('s', *self.args)
+        # new cache should read orfs back from disk
+        cache2 = ORFCache(cache_dir=self.tmpdir)
+        h1, h2, t1, t2 = cache2('s', *self.args)
+        self.assertEqual(cache2.hits, 1)
+        npt.assert_array_equal(g1, h1)
+        npt.assert_array_equal(g2, h2)
+        self.assertEqual(s1, t1)
+
+    def test_lru_eviction(self):
+        g, shape = orf_picker('p', *self.args)
+        cache = ORFCache(max_bytes=2 * g.nbytes)
+        for v in [1000, 2000, 3000]:
+            cache('p', self.args[0], self.args[1], self.args[2], self.args[3],
+                  v, 1)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(ORFCache.key('p', self.args[0], self.args[1],
+                                      self.args[2], self.args[3], 1000, 1)
+                         in cache)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1 +1,3 @@
 from .trace import *
+from .pipeline import *
+from .catalog import *
@@ -0,0 +1,253 @@
+from __future__ import division
+import os
+import glob
+import time
+import tempfile
+import numpy as np
+from .trace import parse_frame_name
+
+__all__ = ['FrameCatalog']
+
+# directories modified this close (in seconds) to when they were
+# listed might have changed again without their mtime changing
+MTIME_RESOLUTION = 2
+
+
+class FrameCatalog(object):
+    """
+    Catalog of frame files under a frame directory, with the start
+    time, duration and channels of each frame.
+
+    Frames are looked up by GPS interval with an index of frames
+    sorted by start time, so :func:`seispy.trace.fetch` doesn't have
+    to re-list the ``M-XXXXX`` directories for every channel. The
+    catalog is built incrementally: a directory is only listed again
+    when its modification time changes (or it was listed so soon
+    after being modified that a change could have been missed, e.g.
+    on filesystems with coarse timestamps), and only frames that weren't
+    there before have their channels read. If `path` is given the
+    catalog is saved there as a ``.npz`` file and loaded again next
+    time.
+
+    >>> catalog = FrameCatalog('/frames', path='/frames/catalog.npz')
+    >>> catalog.query(1125384593, 1125388193, channel='DEAD:HHZ')
+    >>> arr = SeismometerArray.fetch_data(st, et, catalog=catalog)
+
+    Parameters
+    ----------
+    framedir : `str`, optional, default='./'
+        top level frame directory, with frames in ``M-XXXXX``
+        subdirectories named by the first 5 digits of GPS time
+    path : `str`, optional
+        ``.npz`` file to keep the catalog in
+    list_channels : `bool`, optional, default=True
+        read the list of channels in each frame. Lets
+        :meth:`query` skip frames without the channel being fetched.
+    """
+    def __init__(self, framedir='./', path=None, list_channels=True):
+        super(FrameCatalog, self).__init__()
+        self.framedir = framedir
+        self.path = path
+        self.list_channels = list_channels
+        # path -> (start, duration, channels)
+        self._frames = {}
+        # directory -> (modification time, time it was listed)
+        self._dirs = {}
+        self._index = None
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _directories(self, st=None, et=None):
+        """
+        frame directories covering `st` to `et` (all of them if
+        no times are given)
+        """
+        if st is None or et is None:
+            return sorted(glob.glob('%s/M-*' % self.framedir))
+        return ['%s/M-%d' % (self.framedir, directory) for directory in
+                range(int(str(int(st))[:5]), int(str(int(et))[:5]) + 1)]
+
+    def update(self, st=None, et=None, rescan=False):
+        """
+        list directories covering `st` to `et` that are new or
+        have changed since they were last listed
+
+        Parameters
+        ----------
+        st : `int`, optional
+            start time (GPS time)
+        et : `int`, optional
+            end time (GPS time)
+        rescan : `bool`, optional, default=False
+            list directories even if they don't look like they've
+            changed
+
+        Returns
+        -------
+        changed : `bool`
+            True if any frames were added or removed
+        """
+        changed = False
+        for directory in self._directories(st, et):
+            key = os.path.normpath(directory)
+            if not os.path.isdir(directory):
+                if key in self._dirs:
+                    changed |= self._forget(key)
+                    del self._dirs[key]
+                continue
+            mtime = os.path.getmtime(directory)
+            listed = time.time()
+            if not rescan and key in self._dirs:
+                old_mtime, old_listed = self._dirs[key]
+                if (old_mtime == mtime and
+                        old_listed - old_mtime > MTIME_RESOLUTION):
+                    continue
+            paths = set(os.path.normpath(path) for path in
+                        glob.glob('%s/*.gwf' % directory))
+            changed |= self._forget(key, keep=paths)
+            for path in paths - set(self._frames):
+                start, duration = parse_frame_name(path)
+                self._frames[path] = (start, duration,
+                                      self._read_channels(path))
+                changed = True
+            self._dirs[key] = (mtime, listed)
+        if changed:
+            self._index = None
+            if self.path is not None:
+                self.save()
+        return changed
+
+    def _forget(self, directory, keep=()):
+        """
+        drop frames in `directory` that aren't in `keep`
+        """
+        gone = [path for path in self._frames if os.path.dirname(path) ==
+                directory and path not in keep]
+        for path in gone:
+            del self._frames[path]
+        return len(gone) > 0
+
+    def _read_channels(self, path):
+        if not self.list_channels:
+            return ()
+        from gwpy.io.gwf import get_channel_names
+        try:
+            return tuple(get_channel_names(path))
+        except (IOError, RuntimeError):
+            # unreadable frames are left in the catalog without channels
+            # so that the error is seen when they're read
+            return ()
+
+    def _build_index(self):
+        paths = sorted(self._frames, key=lambda path: self._frames[path][0])
+        starts = np.array([self._frames[path][0] for path in paths],
+                          dtype=np.int64)
+        ends = starts + np.array([self._frames[path][1] for path in paths],
+                                 dtype=np.int64)
+        # running maximum of end times is sorted too, so the first
+        # frame that can overlap an interval is a binary search away
+        maxends = np.maximum.accumulate(ends) if ends.size else ends
+        self._index = (paths, starts, ends, maxends)
+
+    def query(self, st, et, channel=None, update=True, rescan=False):
+        """
+        frames with data between `st` and `et`
+
+        Parameters
+        ----------
+        st : `int`
+            start time (GPS time)
+        et : `int`
+            end time (GPS time)
+        channel : `str`, optional
+            only return frames that have this channel (if channels
+            were listed)
+        update : `bool`, optional, default=True
+            check directories covering the interval for new frames
+            first
+        rescan : `bool`, optional, default=False
+            list directories covering the interval again even if
+            they don't look like they've changed
+
+        Returns
+        -------
+        frames : `list`
+            ``(path, start, duration)`` of each frame, in time order
+        """
+        if update or rescan:
+            self.update(st, et, rescan=rescan)
+        if self._index is None:
+            self._build_index()
+        paths, starts, ends, maxends = self._index
+        lo = np.searchsorted(maxends, st, side='right')
+        hi = np.searchsorted(starts, et, side='left')
+        frames = []
+        for ii in range(lo, hi):
+            if ends[ii] <= st:
+                continue
+            channels = self._frames[paths[ii]][2]
+            if channel is not None and channels and channel not in channels:
+                continue
+            frames.append((paths[ii], int(starts[ii]),
+                           int(ends[ii] - starts[ii])))
+        return frames
+
+    def channels(self, path):
+        """
+        channels in a frame, as listed when it was cataloged
+        """
+        return list(self._frames[os.path.normpath(path)][2])
+
+    def save(self, path=None):
+        """
+        save catalog to a ``.npz`` file (defaults to `path`)
+        """
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError('No path to save catalog to')
+        paths = sorted(self._frames)
+        dirs = sorted(self._dirs)
+        # write to temporary file and move it so that
+        # nobody sees a partial file
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(
+            os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, framedir=self.framedir, paths=np.array(paths, dtype=str),
+                     starts=np.array([self._frames[p][0] for p in paths],
+                                     dtype=np.int64),
+                     durations=np.array([self._frames[p][1] for p in paths],
+                                        dtype=np.int64),
+                     channels=np.array([' '.join(self._frames[p][2]) for p in
+                                        paths], dtype=str),
+                     dirs=np.array(dirs, dtype=str),
+                     mtimes=np.array([self._dirs[d][0] for d in dirs],
+                                     dtype=float),
+                     listed=np.array([self._dirs[d][1] for d in dirs],
+                                     dtype=float))
+        os.rename(tmpname, path)
+
+    def load(self, path=None):
+        """
+        load catalog saved by :meth:`save` (defaults to `path`). It
+        must have been made for the same frame directory.
+        """
+        if path is None:
+            path = self.path
+        with np.load(path) as f:
+            framedir = str(f['framedir'])
+            if os.path.abspath(framedir) != os.path.abspath(self.framedir):
+                raise ValueError('Catalog %s is for frames in %s, not %s' %
+                                 (path, framedir, self.framedir))
+            frames = dict(
+                (str(p), (int(s), int(d), tuple(str(c).split())))
+                for p, s, d, c in zip(f['paths'], f['starts'],
+                                      f['durations'], f['channels']))
+            dirs = dict((str(d), (float(m), float(l))) for d, m, l in
+                        zip(f['dirs'], f['mtimes'], f['listed']))
+        self._frames = frames
+        self._dirs = dirs
+        self._index = None
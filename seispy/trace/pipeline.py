@@ -0,0 +1,282 @@
+from __future__ import division
+import numpy as np
+from scipy.ndimage import convolve1d
+from .trace import Trace
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip
+
+__all__ = ['PreprocessingPipeline', 'whiten_spectrum']
+
+NORMTYPES = [None, 'water_level', 'bit', 'weighted_renorm']
+
+
+class PreprocessingPipeline(object):
+    """
+    Bandpass -> renormalize -> whiten, applied to long traces
+    a chunk at a time.
+
+    Each chunk of output is computed from the chunk plus `pad`
+    seconds of data on either side (overlap-save), and the padding
+    is thrown away, so filter transients and the renormalization
+    windows at chunk edges see the same data they would if the whole
+    trace was processed at once. Only ``chunklen + 2 * pad`` seconds
+    of data are in memory at any time, so the input can be backed by
+    a `numpy.memmap`.
+
+    The steps are the same as
+    :meth:`seispy.trace.Trace.bandpass` followed by
+    :meth:`seispy.trace.Trace.renormalization`. Both detrend
+    the data, which is done per chunk here, so results differ
+    slightly from processing the whole trace at once.
+
+    >>> pipe = PreprocessingPipeline(bandpass=(0.1, 10), normtype='bit')
+    >>> for chunk in pipe.chunks(day_of_data):
+    ...     do_something(chunk)
+    >>> csd, asd1, asd2, freqs = pipe.stack_spectra(tr1, tr2, 100)
+
+    Parameters
+    ----------
+    bandpass : `tuple`, optional
+        (flow, fhigh) of bandpass filter in Hz. No filtering by default.
+    normtype : `str`, optional
+        type of renormalization, see
+        :meth:`seispy.trace.Trace.renormalization`. No renormalization
+        by default.
+    normlen : `float`, optional
+        number of seconds used for 'weighted_renorm'
+    whiten : `bool`, optional, default=False
+        whiten spectra in :meth:`stack_spectra`
+    whiten_width : `float`, optional, default=1
+        width in Hz of the smoothing used for whitening
+    chunklen : `float`, optional, default=3600
+        seconds of output per chunk
+    pad : `float`, optional
+        seconds of data to add to each side of a chunk. Default is
+        picked from the lowest filter frequency and `normlen`.
+    """
+    def __init__(self, bandpass=None, normtype=None, normlen=None,
+            whiten=False, whiten_width=1, chunklen=3600, pad=None):
+        super(PreprocessingPipeline, self).__init__()
+        if normtype not in NORMTYPES:
+            raise ValueError('normtype must be one of %s' % str(NORMTYPES))
+        if normtype == 'weighted_renorm' and normlen is None:
+            raise ValueError('if type is weighted_renorm you need number '
+                             'of seconds to renormalize by!')
+        if bandpass is not None and len(bandpass) != 2:
+            raise ValueError('bandpass must be (flow, fhigh)')
+        self.bandpass = bandpass
+        self.normtype = normtype
+        self.normlen = normlen
+        self.whiten = whiten
+        self.whiten_width = whiten_width
+        self.chunklen = chunklen
+        if pad is None:
+            pad = self._default_pad()
+        self.pad = pad
+
+    def _default_pad(self):
+        """
+        padding long enough for filter transients and
+        renormalization windows to die out
+        """
+        pad = 0
+        if self.bandpass is not None:
+            # IIR transients last several periods of the lowest frequency
+            pad += 10. / self.bandpass[0]
+        if self.normtype == 'weighted_renorm':
+            # earthquake band filter in renormalization plus its window
+            pad += 10. / 0.03 + self.normlen
+        elif self.normtype == 'water_level':
+            # hilbert transform kernel falls off slowly
+            pad += 60
+        return pad
+
+    def process_trace(self, trace):
+        """
+        process a whole trace at once
+
+        Parameters
+        ----------
+        trace : :class:`seispy.trace.Trace`
+            data to process
+
+        Returns
+        -------
+        processed : :class:`seispy.trace.Trace`
+            bandpassed and renormalized data
+        """
+        TS = trace
+        if self.bandpass is not None:
+            TS = TS.bandpass(self.bandpass[0], self.bandpass[1])
+        if self.normtype is not None:
+            TS = TS.renormalization(Ns=self.normlen, type=self.normtype)
+        return TS
+
+    def chunks(self, trace):
+        """
+        generator of processed chunks of `trace`
+
+        Parameters
+        ----------
+        trace : :class:`seispy.trace.Trace`
+            data to process
+
+        Returns
+        -------
+        chunks : `generator`
+            :class:`seispy.trace.Trace` for each `chunklen` seconds of
+            processed data, in order
+        """
+        sample_rate = trace.sample_rate.value
+        N = trace.size
+        chunksize = max(int(self.chunklen * sample_rate), 1)
+        padsize = int(np.ceil(self.pad * sample_rate))
+        t0 = trace.t0.value
+        for start in range(0, N, chunksize):
+            stop = min(start + chunksize, N)
+            lo = max(start - padsize, 0)
+            hi = min(stop + padsize, N)
+            padded = Trace(np.asarray(trace.value[lo:hi]),
+                           sample_rate=trace.sample_rate, name=trace.name,
+                           channel=trace.channel, t0=t0 + lo / sample_rate)
+            processed = self.process_trace(padded)
+            yield Trace(processed.value[start - lo:stop - lo],
+                        sample_rate=trace.sample_rate, name=trace.name,
+                        channel=trace.channel, t0=t0 + start / sample_rate)
+
+    def process(self, trace, out=None):
+        """
+        process `trace` chunk by chunk
+
+        Parameters
+        ----------
+        trace : :class:`seispy.trace.Trace`
+            data to process
+        out : `numpy.ndarray`, optional
+            array to put the result in. A `numpy.memmap` keeps
+            memory bounded for traces that don't fit in memory.
+
+        Returns
+        -------
+        processed : :class:`seispy.trace.Trace`
+            processed data
+        """
+        if out is None:
+            out = np.zeros(trace.size)
+        if out.size != trace.size:
+            raise ValueError('out must be the same size as trace')
+        idx = 0
+        for chunk in self.chunks(trace):
+            out[idx:idx + chunk.size] = chunk.value
+            idx += chunk.size
+        return Trace(out, sample_rate=trace.sample_rate, name=trace.name,
+                     channel=trace.channel, t0=trace.t0)
+
+    def stack_spectra(self, tr1, tr2, fftlength, window='hanning'):
+        """
+        average cross- and auto-spectra of two traces over
+        `fftlength` second segments of the processed data, as in the
+        'freq' stacking of :meth:`seispy.trace.Trace.coherence`.
+        Segments overlap by half when using a hanning window.
+        Processed data are never held in memory all at once.
+
+        Parameters
+        ----------
+        tr1 : :class:`seispy.trace.Trace`
+            first trace
+        tr2 : :class:`seispy.trace.Trace`
+            second trace, same size and sample rate as `tr1`
+        fftlength : `float`
+            length of segments in seconds
+        window : `str`, optional, default='hanning'
+            'hanning' or None
+
+        Returns
+        -------
+        csd : `numpy.ndarray`
+            average of ``conj(fft1) * fft2``
+        asd1 : `numpy.ndarray`
+            root mean square of ``abs(fft1)``
+        asd2 : `numpy.ndarray`
+            root mean square of ``abs(fft2)``
+        freqs : `numpy.ndarray`
+            non-negative frequencies. Spectra are one-sided; see
+            :func:`seispy.utils.spectral.twosided_spectrum`.
+        """
+        from ..utils.spectral import rfft_spectrum
+        if tr1.size != tr2.size or tr1.sample_rate != tr2.sample_rate:
+            raise ValueError('traces must have same size and sample rate')
+        sample_rate = tr1.sample_rate.value
+        Nsamps = int(fftlength * sample_rate)
+        if Nsamps > tr1.size:
+            raise ValueError('fftlength is longer than traces')
+        if window == 'hanning':
+            step = Nsamps // 2
+        else:
+            window = None
+            step = Nsamps
+        nfreqs = Nsamps // 2 + 1
+        df = sample_rate / Nsamps
+        csd = np.zeros(nfreqs, dtype=complex)
+        psd1 = np.zeros(nfreqs)
+        psd2 = np.zeros(nfreqs)
+        nsegs = 0
+        segs1 = _segments(self.chunks(tr1), Nsamps, step)
+        segs2 = _segments(self.chunks(tr2), Nsamps, step)
+        for seg1, seg2 in izip(segs1, segs2):
+            fft1, freqs = rfft_spectrum(seg1, sample_rate, window=window)
+            fft2, freqs = rfft_spectrum(seg2, sample_rate, window=window)
+            if self.whiten:
+                fft1 = whiten_spectrum(fft1, df, width=self.whiten_width)
+                fft2 = whiten_spectrum(fft2, df, width=self.whiten_width)
+            csd += np.conj(fft1) * fft2
+            psd1 += np.abs(fft1)**2
+            psd2 += np.abs(fft2)**2
+            nsegs += 1
+        return (csd / nsegs, np.sqrt(psd1 / nsegs), np.sqrt(psd2 / nsegs),
+                freqs)
+
+
+def whiten_spectrum(fft, df, width=1, axis=-1):
+    """
+    divide a spectrum by a smoothed version of its absolute
+    value, as in :meth:`seispy.spec.Spec.whiten`
+
+    Parameters
+    ----------
+    fft : `numpy.ndarray`
+        spectrum to whiten. Can hold several spectra, e.g.
+        [segment, frequency].
+    df : `float`
+        frequency spacing in Hz
+    width : `float`, optional, default=1
+        smooth over `width` Hz on either side of each frequency
+    axis : `int`, optional, default=-1
+        frequency axis of `fft`
+
+    Returns
+    -------
+    whitened : `numpy.ndarray`
+        whitened spectrum
+    """
+    nwin = max(int(2 * width / df), 1)
+    # same alignment as numpy.convolve(..., 'same')
+    origin = -1 if nwin % 2 == 0 else 0
+    env = convolve1d(np.abs(fft), np.ones(nwin) / nwin, axis=axis,
+                     mode='constant', origin=origin)
+    return fft / env
+
+
+def _segments(chunks, Nsamps, step):
+    """
+    generator of `Nsamps` long segments, `step` samples apart,
+    from a stream of chunks. Segments can straddle chunks.
+    """
+    buf = np.zeros(0)
+    for chunk in chunks:
+        buf = np.hstack((buf, chunk.value))
+        while buf.size >= Nsamps:
+            yield buf[:Nsamps]
+            buf = buf[step:]
@@ -1,4 +1,13 @@
-from gwpy.timeseries import TimeSeries
+from gwpy.timeseries import TimeSeries, TimeSeriesDict
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import threading
+import warnings
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
 import numpy as np
 import scipy
 import glob
@@ -8,12 +17,22 @@ from gwpy.time import *
 class Trace(TimeSeries):
     """class for doing seismic data analysis, inherited from gwpy TimeSeries"""
 
-    def hilbert(self):
+    def hilbert(self, chunksize=None, pad=None, fast=False):
         """
         Performs hilbert transform to get envelope of TS data.
 
+        Long traces can be done in overlapping chunks, and FFTs can be
+        padded to a fast length (see :func:`analytic_signal`).
+
         Parameters
         ----------
+        chunksize : `int`, optional
+            number of samples to transform at once. Default is the
+            whole trace.
+        pad : `int`, optional
+            samples of overlap on each side of a chunk
+        fast : `bool`, optional, default=False
+            pad FFTs to a length with small prime factors
 
         Returns
         -------
@@ -24,7 +43,8 @@ class Trace(TimeSeries):
             be considered hilbert transform)
         """
         # hilbert transform
-        arr = scipy.signal.hilbert(self.value)
+        arr = analytic_signal(self.value, chunksize=chunksize, pad=pad,
+                              fast=fast)
 
         # class assignment stuff...
         TS = Trace(arr)
@@ -37,6 +57,10 @@ class Trace(TimeSeries):
         still not sure how exactly this works and seems to
         produce some edge effects
 
+        Same as ``np.convolve(abs(data), boxcar, 'same')``, but
+        done with a cumulative sum, so it's O(N) no matter how
+        wide the boxcar is.
+
         Parameters
         ----------
         width : `int`, optional, default=1,
@@ -48,21 +72,18 @@ class Trace(TimeSeries):
             Smoothed time series trace.
         """
 
-        TS = np.abs(self)
+        TS = np.abs(self.value)
 
         # turn width into # of samples
-        width = width * TS.sample_rate.value
-
-        # get window
-        window = np.ones((2 * width))
+        width = width * self.sample_rate.value
 
         # do convolution
-        TS = np.convolve(TS, window / (2 * width), 'same')
+        TS = boxcar_smooth(TS, int(2 * width))
         TS = Trace(TS)
 #        TS.__dict__ = self.copy_metadata()
         return TS.detrend()
 
-    def renormalization(self, Ns=None, type='water_level'):
+    def renormalization(self, Ns=None, type='water_level', chunksize=None):
         """
         Does renormalization to get rid of things like
         EQs.
@@ -90,6 +111,11 @@ class Trace(TimeSeries):
             Type of renormalization. Default
             is water level renormalization.
             Other options: 'bit', 'weighted_renorm'
+        chunksize : int, optional
+            Number of samples to process at once for
+            'weighted_renorm' and for the hilbert transform in
+            'water_level'. Bounds the size of temporary
+            arrays. Default is the whole trace at once.
 
         Returns:
         --------
@@ -106,21 +132,10 @@ class Trace(TimeSeries):
             TS = self
             # apply EQ bandpass filter
             EQ_TS = TS.bandpass(0.03, 0.1)
-            Nsamps = Ns * EQ_TS.sample_rate.value
-            idx = 0
-            normed = np.zeros(EQ_TS.size)
+            Nsamps = int(Ns * EQ_TS.sample_rate.value)
             # get weights from bandpassed data, apply them to raw data
-            for datum in TS.value:
-                if idx >= Nsamps and idx + Nsamps <= EQ_TS.value.size:
-                    normed[idx] = datum / \
-                        np.mean(np.abs(EQ_TS.value[idx - Nsamps:idx + Nsamps]))
-                elif idx - Nsamps < 0:
-                    normed[idx] = datum / \
-                        np.mean(np.abs(EQ_TS.value[:idx + Nsamps]))
-                elif idx + Nsamps > EQ_TS.value.size:
-                    normed[idx] = datum / \
-                        np.mean(np.abs(EQ_TS.value[idx - Nsamps:]))
-                idx += 1
+            normed = weighted_renormalization(TS.value, EQ_TS.value, Nsamps,
+                                              chunksize=chunksize)
             normed = Trace(
                 normed, sample_rate=TS.sample_rate,
                 name=TS.name)
@@ -128,7 +143,7 @@ class Trace(TimeSeries):
         # water level renormalization
         elif type == 'water_level':
             # take hilbert transform
-            hil = self.hilbert()
+            hil = self.hilbert(chunksize=chunksize)
 
             # get envelope
             env = np.abs(hil)
@@ -146,63 +161,48 @@ class Trace(TimeSeries):
 #            TS.__dict__ = self.copy_metadata()
             return TS.detrend()
 
-    # def fft_new(self, **kwargs):
-    #     """
-    #     Calculates fft (keeps negative frequencies as well...
-    #     we need them for ambient noise cross correlation).
-    #
-    #     NOTE: This is renormalized to be the correct spectrum,
-    #     however that means that you cannot just use
-    #     numpy.fft.ifft(self.fft_new(window=None))
-    #     to get back the original timeseries.
-    #
-    #     >>> data1 = read_frame(frame, channel)
-    #     >>> TS_old = np.fft.ifft(data1.size * data1.fft_new(window=None))
-    #     >>> data1 == TS_old
-    #
-    #     self.fft() uses the same normalization, but does not offer
-    #     whitening and windowing like this function does.
-    #
-    #     can do whitening if you want
-    #
-    #     Parameters:
-    #     -----------
-    #     whiten: `bool`, optional
-    #         Whitens spectrum on both sides.
-    #
-    #     Returns:
-    #     --------
-    #     fft : `Spec`, fft
-    #         Whitened if wanted
-    #     """
-    #     kwargs = self._check_fft_kwargs(kwargs)
-    #
-    #     # whiten
-    #     # if kwargs['whiten']:
-    #     #     Nsecs = self.value.size / self.sample_rate.value
-    #     #     TS = self.whiten(1. / 8 * Nsecs, 1. / 16 * Nsecs)
-    #     # else:
-    #     TS = self
-    #     # window and fft...
-    #     if kwargs['window'] == 'hanning':
-    #         window = np.hanning(TS.value.size)
-    #         fft = np.fft.fft(
-    #             TS.value * window) / (TS.size)
-    #         freqs = np.fft.fftfreq(
-    #             TS.value.size, d=(1. / TS.sample_rate.value))
-    #     else:
-    #         fft = np.fft.fft(
-    #             TS.value) / TS.size
-    #         freqs = np.fft.fftfreq(
-    #             TS.value.size, d=(1. / TS.sample_rate.value))
-    #     # put things in the right order
-    #     fft = Spec(
-    #         fft, f0=freqs[0], df=(freqs[1] - freqs[0]),
-    #         name=self.name, epoch=self.epoch)
-    #     if kwargs['whiten']:
-    #         fft = fft.whiten(width=1)
-    #
-    #     return fft
+    def fft_new(self, **kwargs):
+        """
+        Calculates one-sided fft of (real) data. Negative frequencies
+        are the complex conjugates of the positive ones, so they
+        aren't computed; use
+        :func:`seispy.utils.spectral.twosided_spectrum` to get them
+        back (we need them for ambient noise cross correlation).
+
+        NOTE: This is renormalized to be the correct spectrum,
+        however that means that you cannot just use
+        numpy.fft.irfft(self.fft_new(window=None))
+        to get back the original timeseries.
+
+        >>> data1 = read_frame(frame, channel)
+        >>> TS_old = np.fft.irfft(data1.size * data1.fft_new(window=None),
+        ...                       n=data1.size)
+        >>> data1 == TS_old
+
+        can do whitening if you want
+
+        Parameters:
+        -----------
+        whiten: `bool`, optional
+            Whitens spectrum (over 1 Hz).
+        window: `str`, optional, default='hanning'
+            'hanning' or None
+
+        Returns:
+        --------
+        fft : `Spec`, fft
+            Whitened if wanted
+        """
+        from ..utils.spectral import rfft_spectrum
+        from ..spec import Spec
+        kwargs = self._check_fft_kwargs(kwargs)
+        fft, freqs = rfft_spectrum(self.value, self.sample_rate.value,
+                                   window=kwargs['window'])
+        fft = Spec(fft, f0=0, df=(freqs[1] - freqs[0]), name=self.name,
+                   epoch=self.epoch)
+        if kwargs['whiten']:
+            fft = fft.whiten(width=1)
+        return fft
 
     def _check_fft_kwargs(self, kwargs):
         try:
@@ -226,6 +226,13 @@ class Trace(TimeSeries):
         -----------
         tr : `Trace`
             Trace time series to calculate coherence with.
+        outtype : `str`, optional, default='ts'
+            'ts' for the coherence time series, 'spec' for the
+            two-sided coherence spectrum in
+            ``np.fft.fftshift(np.fft.fftfreq(self.size, self.dx))``
+            order, 'rspec' for the one-sided spectrum at
+            ``np.fft.rfftfreq(self.size, self.dx)``, or 'components'
+            for the one-sided spectra of the two traces.
 
         Return:
         -------
@@ -255,20 +262,25 @@ class Trace(TimeSeries):
             new2 = tr.bandpass(flow, fhigh).fft_new(
                 whiten=whiten, window=window)
 
-        coh = np.conj(new1) * new2 / (np.abs(new1) * np.abs(new2))
-        # do ifft, but need to rearrange frequencies
-        coh_ts = np.fft.ifft(coh)
+        coh = np.conj(new1.value) * new2.value /\
+            (np.abs(new1.value) * np.abs(new2.value))
+        # coherence of real data is hermitian, so irfft is enough
+        coh_ts = np.fft.irfft(coh, n=self.size)
         coh_ts = TimeSeries(coh_ts, name='coherence TS between %s and %s' % (
             self.channel, tr.channel), sample_rate=(self.sample_rate))
         if outtype == 'ts':
             return coh_ts
         if outtype == 'spec':
-            return np.fft.fftshift(coh)
+            from ..utils.spectral import twosided_spectrum
+            return np.fft.fftshift(twosided_spectrum(coh, self.size))
+        if outtype == 'rspec':
+            # non-negative frequencies only
+            return coh
         if outtype == 'components':
             return new1, new2
 
     def coherence(self, tr, window='hanning', fftlength=None, stacktype='freq',
-                  **kwargs):
+                  stft_cache=None, **kwargs):
         """
         Calculate coherence between self and `tr` trace object.
 
@@ -276,13 +288,16 @@ class Trace(TimeSeries):
         ----------
         tr : `Trace`
             object with with to calculate coherence
-        fftlength : `int`
-            length of ffts to take when calculating coherence
+        fftlength : `float`, optional
+            length of ffts in seconds. Defaults to length of traces.
         stacktype : `str`
             method used to stack coherences. options are 'ts' and 'freq'
             'ts' averages resultant ifft'ed timeseries together. 'freq'
             averages csds and psds individually and takes ratio of them at
             the end and then takes ifft.
+        stft_cache : :class:`seispy.utils.stftcache.STFTCache`, optional
+            cache to get segment FFTs from, so traces that are used in
+            several pairs are only FFT'd once
 
         Returns
         -------
@@ -290,27 +305,57 @@ class Trace(TimeSeries):
             coherence timeseries with acausal followed by causal times
         """
         if fftlength is None:
-            fftlength = self.size
+            fftlength = self.duration.value
         Nsamps = fftlength * self.sample_rate.value
 
+        # without per-segment filtering or renormalization
+        # every segment can be done at once
+        if kwargs.get('bandpass') is None and kwargs.get('normtype') is None:
+            whiten = kwargs.get('whiten', False)
+            fft1 = _trace_segment_ffts(self, fftlength, window=window,
+                                       whiten=whiten, stft_cache=stft_cache)
+            fft2 = _trace_segment_ffts(tr, fftlength, window=window,
+                                       whiten=whiten, stft_cache=stft_cache)
+            coh_ts = _coherence_from_ffts(fft1, fft2, int(Nsamps),
+                                          stacktype=stacktype)
+        else:
+            coh_ts = self._looped_coherence(tr, fftlength, window=window,
+                                            stacktype=stacktype, **kwargs)
+        deltaXvec = self.location - tr.location
+        N = coh_ts.size
+        coh_ts = np.hstack((coh_ts[N / 2:], coh_ts[:N / 2]))
+        coh_ts = Trace(coh_ts, name='coherence TS between %s and %s' % (
+            self.channel, tr.channel), sample_rate=(self.sample_rate))
+        coh_ts.deltax = deltaXvec
+        coh_ts.x0 = -coh_ts.times[-1] / 2.
+        return coh_ts.real
+
+    def _looped_coherence(self, tr, fftlength, window='hanning',
+                          stacktype='freq', **kwargs):
+        """
+        coherence stacked one segment at a time, for when each segment
+        needs its own preprocessing in :meth:`coherence_calc`
+        """
+        Nsamps = int(fftlength * self.sample_rate.value)
         # stack
-        if window == 'hanning' and fftlength <= 2 * self.size:
+        if window == 'hanning' and Nsamps <= 2 * self.size:
             nsteps = 2 * self.size / Nsamps
         else:
             nsteps = self.size / Nsamps
         for step in range(int(nsteps) - 1):
-            idx1 = step * Nsamps / 2.
+            idx1 = step * Nsamps // 2
             idx2 = idx1 + Nsamps
             if stacktype is 'freq':
                 new1, new2 = self[idx1:idx2].coherence_calc(
                     tr[idx1:idx2], outtype='components', window=window,
                     **kwargs)
+                new1, new2 = new1.value, new2.value
                 if step == 0:
                     csd = np.conj(new1) * new2
                     asd1 = np.abs(new1)
                     asd2 = np.abs(new2)
                 else:
-                    csd = (csd * step + new1 * new2) / (step + 1)
+                    csd = (csd * step + np.conj(new1) * new2) / (step + 1)
                     asd1 = np.sqrt(
                         (asd1 ** 2 * step + np.abs(new1)**2) / (step + 1))
                     asd2 = np.sqrt(
@@ -328,15 +373,8 @@ class Trace(TimeSeries):
 
         if stacktype is 'freq':
             coh = csd / (asd1 * asd2)
-            coh_ts = np.fft.ifft(coh)
-        deltaXvec = self.location - tr.location
-        N = coh_ts.size
-        coh_ts = np.hstack((coh_ts[N / 2:], coh_ts[:N / 2]))
-        coh_ts = Trace(coh_ts, name='coherence TS between %s and %s' % (
-            self.channel, tr.channel), sample_rate=(self.sample_rate))
-        coh_ts.deltax = deltaXvec
-        coh_ts.x0 = -coh_ts.times[-1] / 2.
-        return coh_ts.real
+            coh_ts = np.fft.irfft(coh, n=Nsamps)
+        return coh_ts
 
     def get_location(self):
         """
@@ -381,10 +419,390 @@ class Trace(TimeSeries):
         return np.asarray(xyz_list[staname])
 
 
-def fetch(st, et, channel, framedir='./'):
+def boxcar_smooth(data, Nsamps, chunksize=None):
+    """
+    Convolve `data` with a boxcar of `Nsamps` samples, normalized to
+    sum to one. Same output as
+    ``np.convolve(data, np.ones(Nsamps) / Nsamps, 'same')``
+    (zeros beyond the ends of the data), but uses a cumulative sum,
+    so it is O(N) rather than O(N * Nsamps).
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        data to smooth
+    Nsamps : `int`
+        length of boxcar in samples
+    chunksize : `int`, optional
+        number of output samples to compute at once. Default is
+        everything at once.
+
+    Returns
+    -------
+    smoothed : `numpy.ndarray`
+        smoothed data
+    """
+    Nsamps = int(Nsamps)
+    if Nsamps < 1:
+        raise ValueError('boxcar must be at least one sample long')
+    N = data.size
+    if chunksize is None:
+        chunksize = N
+    chunksize = max(int(chunksize), 1)
+    # window for sample i is [i - back, i + ahead]
+    ahead = (Nsamps - 1) // 2
+    back = Nsamps - 1 - ahead
+    smoothed = np.zeros(N)
+    for start in range(0, N, chunksize):
+        stop = min(start + chunksize, N)
+        lo = max(start - back, 0)
+        hi = min(stop + ahead, N)
+        csum = np.zeros(hi - lo + 1)
+        np.cumsum(data[lo:hi], out=csum[1:])
+        idx = np.arange(start, stop)
+        win_lo = np.maximum(idx - back, 0)
+        win_hi = np.minimum(idx + ahead + 1, N)
+        smoothed[start:stop] = (csum[win_hi - lo] - csum[win_lo - lo]) /\
+            Nsamps
+    return smoothed
+
+
+def analytic_signal(data, chunksize=None, pad=None, fast=False):
+    """
+    Analytic signal of real data (:func:`scipy.signal.hilbert`).
+    By default this is exactly :func:`scipy.signal.hilbert` of the
+    whole array.
+
+    With `chunksize`, the data are transformed in chunks with `pad`
+    samples of overlap on either side, which are thrown away. The
+    hilbert transform kernel falls off like 1/t, so the result agrees
+    with the full transform to about ``1 / pad`` away from the ends.
+
+    With `fast`, each FFT is padded to a length with small prime
+    factors by reflecting the data at its ends, and the padding is
+    thrown away. This is much quicker for awkward lengths (e.g.
+    large primes) but changes the envelope near the ends of the
+    data a little.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        real data
+    chunksize : `int`, optional
+        number of output samples per chunk. Default is the whole
+        array in one FFT.
+    pad : `int`, optional
+        samples of overlap on each side of a chunk. Defaults to
+        `chunksize`.
+    fast : `bool`, optional, default=False
+        pad FFTs to a fast length
+
+    Returns
+    -------
+    analytic : `numpy.ndarray`
+        complex analytic signal
+    """
+    from scipy.fftpack import next_fast_len
+    from scipy.signal import hilbert
+    N = data.size
+    if chunksize is None:
+        chunksize = N
+        pad = 0
+    chunksize = max(int(chunksize), 1)
+    if pad is None:
+        pad = chunksize
+    pad = int(pad)
+    out = np.zeros(N, dtype=complex)
+    for start in range(0, N, chunksize):
+        stop = min(start + chunksize, N)
+        lo = max(start - pad, 0)
+        hi = min(stop + pad, N)
+        segment = data[lo:hi]
+        before = 0
+        if fast:
+            # reflect rather than zero pad, so there's no step at the
+            # ends of the data for the transform to ring on
+            extra = next_fast_len(segment.size) - segment.size
+            before = extra // 2
+            segment = np.pad(segment, (before, extra - before),
+                             mode='reflect')
+        hil = hilbert(segment)
+        out[start:stop] = hil[before + start - lo:before + stop - lo]
+    return out
+
+
+def sliding_abs_mean(data, Nsamps, chunksize=None):
+    """
+    Mean of the absolute value of `data` over the window
+    ``[i - Nsamps, i + Nsamps)`` around each sample. Near the
+    edges the window is cut off at the ends of the data.
+
+    Uses a cumulative sum, so it costs O(N) no matter how
+    wide the window is.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        data to average
+    Nsamps : `int`
+        half-width of window in samples
+    chunksize : `int`, optional
+        number of output samples to compute at once. Each
+        chunk only needs ``chunksize + 2 * Nsamps`` samples of
+        `data` in memory, so `data` can be a `numpy.memmap`.
+        Default is everything at once.
+
+    Returns
+    -------
+    means : `numpy.ndarray`
+        mean of absolute value in window around each sample
+    """
+    Nsamps = int(Nsamps)
+    N = data.size
+    if chunksize is None:
+        chunksize = N
+    chunksize = max(int(chunksize), 1)
+    means = np.zeros(N)
+    for start in range(0, N, chunksize):
+        stop = min(start + chunksize, N)
+        # samples needed for this chunk of output
+        lo = max(start - Nsamps, 0)
+        hi = min(stop + Nsamps, N)
+        csum = np.zeros(hi - lo + 1)
+        np.cumsum(np.abs(data[lo:hi]), out=csum[1:])
+        idx = np.arange(start, stop)
+        win_lo = np.maximum(idx - Nsamps, 0)
+        win_hi = np.minimum(idx + Nsamps, N)
+        means[start:stop] = (csum[win_hi - lo] - csum[win_lo - lo]) /\
+            (win_hi - win_lo)
+    return means
+
+
+def weighted_renormalization(data, weight_data, Nsamps, chunksize=None,
+                             out=None):
+    """
+    Divide data by the mean absolute value of `weight_data`
+    (usually earthquake-band data) in a window of
+    ``2 * Nsamps`` samples around each sample.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        data to renormalize
+    weight_data : `numpy.ndarray`
+        data to calculate weights from. Same size as `data`
+    Nsamps : `int`
+        half-width of window in samples
+    chunksize : `int`, optional
+        number of samples to process at once. With `out` set
+        to a `numpy.memmap`, traces that don't fit in memory can
+        be renormalized chunk by chunk.
+    out : `numpy.ndarray`, optional
+        array to put the result in
+
+    Returns
+    -------
+    normed : `numpy.ndarray`
+        renormalized data
+    """
+    N = data.size
+    if weight_data.size != N:
+        raise ValueError('data and weight_data must be the same size')
+    if out is None:
+        out = np.zeros(N)
+    if chunksize is None:
+        chunksize = N
+    chunksize = max(int(chunksize), 1)
+    for start in range(0, N, chunksize):
+        stop = min(start + chunksize, N)
+        lo = max(start - int(Nsamps), 0)
+        hi = min(stop + int(Nsamps), N)
+        # weights for this chunk from the chunk plus its neighbours
+        means = sliding_abs_mean(weight_data[lo:hi], Nsamps)
+        out[start:stop] = data[start:stop] / means[start - lo:stop - lo]
+    return out
+
+
+def _segment_ffts(data, Nsamps, window='hanning', whiten=False, df=None):
+    """
+    rffts of every segment of `data` (half overlapping with a
+    hanning window), from a strided view of the data and one
+    batched FFT.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        [..., sample] array of data
+    Nsamps : `int`
+        samples per segment
+    window : `str`, optional, default='hanning'
+        'hanning' or None
+    whiten : `bool`, optional, default=False
+        whiten each segment's spectrum over 1 Hz
+    df : `float`, optional
+        frequency spacing, needed for whitening
+
+    Returns
+    -------
+    ffts : `numpy.ndarray`
+        [..., segment, frequency] array of rffts
+    """
+    from ..utils.spectral import segment_view, rfft_spectrum
+    from .pipeline import whiten_spectrum
+    if window == 'hanning':
+        nstep = Nsamps // 2
+    else:
+        window = None
+        nstep = Nsamps
+    segs = segment_view(data, Nsamps, nstep)
+    # positive frequencies are enough for real data
+    ffts, freqs = rfft_spectrum(segs, window=window)
+    if whiten:
+        ffts = whiten_spectrum(ffts, df, width=1)
+    return ffts
+
+
+def _stacked_coherence(data1, data2, Nsamps, window='hanning',
+                       stacktype='freq', whiten=False, df=None):
+    """
+    Coherence between two arrays from all of their segments at
+    once.
+
+    Parameters
+    ----------
+    data1 : `numpy.ndarray`
+        first data array
+    data2 : `numpy.ndarray`
+        second data array
+    Nsamps : `int`
+        samples per segment
+    window : `str`, optional, default='hanning'
+        'hanning' or None
+    stacktype : `str`, optional, default='freq'
+        'freq' averages csds and psds and takes their ratio,
+        'ts' averages coherence timeseries of each segment
+    whiten : `bool`, optional, default=False
+        whiten each segment's spectrum over 1 Hz
+    df : `float`, optional
+        frequency spacing, needed for whitening
+
+    Returns
+    -------
+    coh_ts : `numpy.ndarray`
+        coherence timeseries, causal times followed by acausal
+    """
+    fft1 = _segment_ffts(data1, Nsamps, window=window, whiten=whiten, df=df)
+    fft2 = _segment_ffts(data2, Nsamps, window=window, whiten=whiten, df=df)
+    return _coherence_from_ffts(fft1, fft2, Nsamps, stacktype=stacktype)
+
+
+def _coherence_from_ffts(fft1, fft2, Nsamps, stacktype='freq'):
+    """
+    stack [segment, frequency] rffts of two traces into a
+    coherence timeseries (causal times followed by acausal)
+    """
+    if stacktype == 'freq':
+        asd1 = np.sqrt(np.mean(np.abs(fft1)**2, axis=0))
+        asd2 = np.sqrt(np.mean(np.abs(fft2)**2, axis=0))
+        coh = np.mean(np.conj(fft1) * fft2, axis=0) / (asd1 * asd2)
+    elif stacktype == 'ts':
+        # ifft is linear, so averaging coherence timeseries is the
+        # same as averaging coherence spectra of each segment
+        coh = np.mean(np.conj(fft1) * fft2 / (np.abs(fft1) * np.abs(fft2)),
+                      axis=0)
+    else:
+        raise ValueError("stacktype must be 'freq' or 'ts'")
+    return np.fft.irfft(coh, n=Nsamps)
+
+
+def _trace_segment_ffts(tr, fftlength, window='hanning', whiten=False,
+                        stft_cache=None):
+    """
+    :func:`_segment_ffts` of one trace, from `stft_cache`
+    (a :class:`seispy.utils.stftcache.STFTCache`) if there is one
+    """
+    Nsamps = int(fftlength * tr.sample_rate.value)
+
+    def compute():
+        return (_segment_ffts(tr.value, Nsamps, window=window, whiten=whiten,
+                              df=1. / fftlength),)
+    if stft_cache is None:
+        return compute()[0]
+    tag = 'coherence-whitened' if whiten else 'coherence'
+    key = stft_cache.key(tr, fftlength, window=str(window), tag=tag)
+    return stft_cache.cached(key, compute)[0]
+
+
+def coherence_matrix(traces, fftlength=None, window='hanning',
+                     stacktype='freq', whiten=False, stft_cache=None):
+    """
+    Coherence between every pair of traces. Each trace is only
+    segmented and FFT'd once, and the cross spectra for all pairs
+    come from one matrix product per frequency.
+
+    Parameters
+    ----------
+    traces : `list`
+        list of :class:`seispy.trace.Trace` with the same
+        size and sample rate
+    fftlength : `float`, optional
+        length of ffts in seconds. Defaults to length of traces.
+    window : `str`, optional, default='hanning'
+        'hanning' or None
+    stacktype : `str`, optional, default='freq'
+        method used to stack coherences, see :meth:`Trace.coherence`
+    whiten : `bool`, optional, default=False
+        whiten each segment's spectrum over 1 Hz
+    stft_cache : :class:`seispy.utils.stftcache.STFTCache`, optional
+        cache to get each trace's FFTs from
+
+    Returns
+    -------
+    coh : `numpy.ndarray`
+        [trace, trace, time] array. ``coh[i, j]`` is the same as
+        ``traces[i].coherence(traces[j]).value``, with acausal
+        followed by causal times.
+    """
+    sample_rate = traces[0].sample_rate.value
+    for tr in traces:
+        if tr.size != traces[0].size or tr.sample_rate.value != sample_rate:
+            raise ValueError('traces must have same size and sample rate')
+    if fftlength is None:
+        fftlength = traces[0].size / sample_rate
+    Nsamps = int(fftlength * sample_rate)
+    if stft_cache is None:
+        data = np.vstack([tr.value for tr in traces])
+        ffts = _segment_ffts(data, Nsamps, window=window, whiten=whiten,
+                             df=1. / fftlength)
+    else:
+        ffts = np.array([_trace_segment_ffts(tr, fftlength, window=window,
+                                             whiten=whiten,
+                                             stft_cache=stft_cache)
+                         for tr in traces])
+    nsegs = ffts.shape[1]
+    if stacktype == 'ts':
+        ffts = ffts / np.abs(ffts)
+    elif stacktype != 'freq':
+        raise ValueError("stacktype must be 'freq' or 'ts'")
+    # [frequency, trace, segment]
+    ffts = ffts.transpose(2, 0, 1)
+    csds = np.matmul(np.conj(ffts), ffts.transpose(0, 2, 1)) / nsegs
+    if stacktype == 'freq':
+        asds = np.sqrt(np.mean(np.abs(ffts)**2, axis=-1))
+        csds /= asds[:, :, None] * asds[:, None, :]
+    coh = np.fft.irfft(csds.transpose(1, 2, 0), n=Nsamps, axis=-1)
+    return np.concatenate((coh[..., Nsamps // 2:], coh[..., :Nsamps // 2]),
+                          axis=-1)
+
+
+def fetch(st, et, channel, framedir='./', catalog=None, strict=False):
     """
     fetch data based on location of frames
 
+    The frames and the range of samples needed from each are worked
+    out before anything is read. The output is allocated once and
+    each frame's data is copied into place.
+
     Parameters
     ----------
     st : `int`
@@ -393,59 +811,349 @@ def fetch(st, et, channel, framedir='./'):
         end time (GPS time)
     channel : `channel`
         channel to load data for
+    framedir : `str`, optional, default='./'
+        top level frame directory, with frames in ``M-XXXXX``
+        subdirectories named by the first 5 digits of GPS time
+    catalog : :class:`seispy.trace.catalog.FrameCatalog`, optional
+        catalog to look frames up in. Pass the same catalog to
+        repeated calls so frame directories aren't listed every time.
+        Overrides `framedir`.
+    strict : `bool`, optional, default=False
+        raise a `ValueError` if the frames don't cover `st` to `et`
+        without gaps. Otherwise the data from the frames that are
+        there are joined end to end, starting at `st`, so times in the
+        trace after a gap are off by the length of the gap.
 
     Returns
     -------
     TS : `Trace`
         Trace object containing data between start and end times
     """
-    # uncomment when not testing
-    # for looping over directories where frames
-    # are located
+    if catalog is not None:
+        framedir = catalog.framedir
+        frames = catalog.query(st, et, channel=channel)
+    else:
+        frames = find_frames(st, et, framedir=framedir)
+    if len(frames) == 0:
+        raise ValueError('No files found...we looked here: %s/M-%s/' %
+                         (framedir, str(et)[:5]))
+    plan = plan_frame_reads(frames, st, et, strict=strict)
+    if len(plan) == 0:
+        raise ValueError('No frames in %s cover %d to %d' % (framedir, st, et))
+    return _read_planned(plan, [channel], st)[0][channel]
+
+
+def find_frames(st, et, framedir='./'):
+    """
+    list frames in the ``M-XXXXX`` directories that can contain data
+    between `st` and `et`
+
+    Parameters
+    ----------
+    st : `int`
+        start time (GPS time)
+    et : `int`
+        end time (GPS time)
+    framedir : `str`, optional, default='./'
+        top level frame directory
+
+    Returns
+    -------
+    frames : `list`
+        ``(path, start, duration)`` of each frame, sorted by path
+    """
     st_dir = int(str(st)[:5])
     et_dir = int(str(et)[:5])
-    dirs = np.arange(st_dir, et_dir + 1)
-    files = []
-    for directory in dirs:
-        # print 'FRAME READING TESTING MODE!!!'
+    frames = []
+    for directory in range(st_dir, et_dir + 1):
         loaddir = '%s/M-%d/' % (framedir, directory)
-        new_files = sorted(glob.glob(loaddir + '/*.gwf'))
-        files.extend(new_files)
-    vals = np.asarray([])
-    if len(files)==0:
-        raise ValueError('No files found...we looked here: %s' % loaddir)
-
-#    for file in files:
-    for ii in range(len(files)):
-        file = files[ii]
-        # start is before frame start, end is before frame end
-        # we want to load fst -> et
-        fst = int(file.split('-')[-2])
-        dur = int(file.split('-')[-1][:-4])
-        if st <= fst and et <= fst + dur and et >= fst:
-            val = read_frame(file, channel, st=fst, et=et)
-            vals = np.hstack((vals, val.value))
-        # start is after frame start, end is before frame end
-        # we want to load only st -> et
-        elif st >= fst and et <= fst + dur:
-            val = read_frame(file, channel, st=st, et=et)
-            vals = np.hstack((vals, val.value))
-        # start is after frame start end is after or equal to frame end
-        # we want to load st -> fst + dur
-        elif st >= fst and st < (fst + dur) and et >= fst + dur:
-            val = read_frame(file, channel, st=st, et=fst + dur)
-            vals = np.hstack((vals, val.value))
-        # start is before frame start, end is after frame end
-        # load fst -> fst + dur (whole frame)
-        elif st <= fst and et >= fst + dur:
-            val = read_frame(file, channel)
-            vals = np.hstack((vals, val.value))
+        for path in sorted(glob.glob(loaddir + '/*.gwf')):
+            fst, dur = parse_frame_name(path)
+            frames.append((path, fst, dur))
+    return frames
+
+
+def parse_frame_name(path):
+    """
+    start time and duration of a frame from its name,
+    e.g. ``M-1125384593-4096.gwf``
+
+    Returns
+    -------
+    start : `int`
+        GPS start time of frame
+    duration : `int`
+        duration of frame in seconds
+    """
+    parts = path.split('-')
+    return int(parts[-2]), int(parts[-1][:-4])
+
+
+def plan_frame_reads(frames, st, et, strict=False):
+    """
+    work out which part of each frame to read to get data between
+    `st` and `et`
+
+    Parameters
+    ----------
+    frames : `list`
+        ``(path, start, duration)`` of frames
+    st : `int`
+        start time (GPS time)
+    et : `int`
+        end time (GPS time)
+    strict : `bool`, optional, default=False
+        raise a `ValueError` if the frames leave a gap anywhere
+        between `st` and `et`
+
+    Returns
+    -------
+    plan : `list`
+        ``(path, read_start, read_end)`` for each frame with data
+        in the interval, in time order
+    """
+    plan = []
+    for path, fst, dur in sorted(frames, key=lambda frame: frame[1]):
+        read_st = max(st, fst)
+        read_et = min(et, fst + dur)
+        if read_et > read_st:
+            plan.append((path, read_st, read_et))
+    if strict and len(plan):
+        if plan[0][1] != st or plan[-1][2] != et:
+            raise ValueError('Frames only cover %d to %d, not %d to %d' %
+                             (plan[0][1], plan[-1][2], st, et))
+        for (path1, st1, et1), (path2, st2, et2) in zip(plan[:-1], plan[1:]):
+            if st2 != et1:
+                raise ValueError('Frames %s and %s are not contiguous' %
+                                 (path1, path2))
+    return plan
+
+
+def fetch_channels(st, et, channels, framedir='./', catalog=None, nproc=1,
+                   pool='thread', skip_failures=False, full_output=False,
+                   strict=False):
+    """
+    fetch several channels at once. Each frame is opened and decoded
+    once for all channels, rather than once per channel as with
+    :func:`fetch`.
+
+    Parameters
+    ----------
+    st : `int`
+        start time (GPS time)
+    et : `int`
+        end time (GPS time)
+    channels : `list`
+        channels to load data for, e.g. ``['DEAD:HHZ', 'LHS:HHZ']``.
+        They can have different sample rates.
+    framedir : `str`, optional, default='./'
+        top level frame directory
+    catalog : :class:`seispy.trace.catalog.FrameCatalog`, optional
+        catalog to look frames up in. Overrides `framedir`.
+    nproc : `int`, optional, default=1
+        number of frames to read at the same time
+    pool : `str`, optional, default='thread'
+        'thread' or 'process' pool of workers to read frames with
+        when `nproc` is more than 1. Threads are enough when reading
+        is limited by (e.g. network filesystem) I/O.
+    skip_failures : `bool`, optional, default=False
+        if a frame can't be read, warn and leave zeros for its span
+        instead of raising an error
+    full_output : `bool`, optional, default=False
+        also return frames that couldn't be read
+    strict : `bool`, optional, default=False
+        raise a `ValueError` if the frames don't cover `st` to `et`
+        without gaps, instead of joining the data on either side of
+        a gap (see :func:`fetch`)
+
+    Returns
+    -------
+    traces : `collections.OrderedDict`
+        `Trace` for each channel, in the order requested
+    failures : `list`
+        only if `full_output` is True. ``(path, error)`` for each
+        frame that couldn't be read
+    """
+    if catalog is not None:
+        framedir = catalog.framedir
+        frames = catalog.query(st, et)
+    else:
+        frames = find_frames(st, et, framedir=framedir)
+    plan = plan_frame_reads(frames, st, et, strict=strict)
+    if len(plan) == 0:
+        raise ValueError('No frames in %s cover %d to %d' % (framedir, st, et))
+    traces, failures = _read_planned(plan, channels, st, nproc=nproc,
+                                     pool=pool, skip_failures=skip_failures)
+    if full_output:
+        return traces, failures
+    return traces
+
+
+def _read_frame_task(args):
+    """
+    read every channel from one planned frame segment. Lives at
+    module level so that it can be sent to a process pool. If
+    `skip_failures` is set errors are returned instead of raised, so
+    that one bad frame doesn't stop the others.
+    """
+    path, read_st, read_et, channels, skip_failures = args
+    try:
+        traces = read_frame_channels(path, channels, st=read_st, et=read_et)
+    except Exception as e:
+        if not skip_failures:
+            raise
+        return None, '%s: %s' % (type(e).__name__, e)
+    # plain arrays and metadata are cheap to send between processes
+    return [(tr.value, tr.dx.value, tr.name,
+             None if tr.channel is None else tr.channel.name)
+            for tr in traces.values()], None
+
+
+def _read_planned(plan, channels, t0, nproc=1, pool='thread',
+                  skip_failures=False):
+    """
+    read the frame segments in `plan` (from :func:`plan_frame_reads`)
+    for every channel into preallocated arrays, one per channel,
+    starting at `t0`. Segments are placed end to end, so any gaps
+    between them are closed up. Frames are read by a pool of `nproc`
+    workers, and copied into place in order as they come back.
+    """
+    if pool not in ['thread', 'process']:
+        raise ValueError("pool must be 'thread' or 'process'")
+    tasks = [(path, read_st, read_et, list(channels), skip_failures) for
+             path, read_st, read_et in plan]
+    workers = None
+    if nproc > 1 and len(tasks) > 1:
+        if pool == 'thread':
+            workers = ThreadPool(processes=min(nproc, len(tasks)))
         else:
-            continue
-    TS = Trace(vals, x0=st, dx=val.dx, name=val.name, channel=val.channel)
-    loc = TS.get_location()
-    TS.location = loc
-    return TS
+            workers = Pool(processes=min(nproc, len(tasks)))
+        results = workers.imap(_read_frame_task, tasks)
+    else:
+        results = (_read_frame_task(task) for task in tasks)
+    vals = OrderedDict()
+    offsets = {}
+    metadata = {}
+    failures = []
+    try:
+        for ii, (frame_vals, error) in enumerate(results):
+            path, read_st, read_et = plan[ii]
+            if error is not None:
+                warnings.warn('Could not read %s, leaving zeros from %d to '
+                              '%d (%s)' % (path, read_st, read_et, error))
+                failures.append((path, error))
+                continue
+            for chan, (val, dx, name, channel) in zip(channels, frame_vals):
+                if chan not in vals:
+                    sizes = [int(round((seg_et - seg_st) / dx)) for
+                             _, seg_st, seg_et in plan]
+                    offsets[chan] = np.cumsum([0] + sizes)
+                    vals[chan] = np.zeros(offsets[chan][-1])
+                    metadata[chan] = (dx, name, channel)
+                idx = offsets[chan][ii]
+                n = min(val.size, offsets[chan][ii + 1] - idx)
+                vals[chan][idx:idx + n] = val[:n]
+    finally:
+        if workers is not None:
+            workers.close()
+            workers.join()
+    if len(failures) == len(plan):
+        raise ValueError('Could not read any frames between %d and %d' %
+                         (plan[0][1], plan[-1][2]))
+    traces = OrderedDict()
+    for chan in channels:
+        dx, name, channel = metadata[chan]
+        TS = Trace(vals[chan], x0=t0, dx=dx, name=name, channel=channel)
+        TS.location = TS.get_location()
+        traces[chan] = TS
+    return traces, failures
+
+
+def iter_fetch(channels, st, et, stride, framedir='./', catalog=None,
+               prefetch=1, **kwargs):
+    """
+    iterate over contiguous `stride` second chunks of several
+    channels. The next chunks are read by a background thread while
+    the caller works on the current one, so reading frames overlaps
+    with analysis.
+
+    >>> for traces in iter_fetch(['DEAD:HHZ', 'LHS:HHZ'], st, et, 3600):
+    ...     do_something(traces)
+
+    Parameters
+    ----------
+    channels : `list`
+        channels to load data for
+    st : `int`
+        start time (GPS time)
+    et : `int`
+        end time (GPS time)
+    stride : `int`
+        seconds of data per chunk. The last chunk is shorter if
+        `stride` doesn't divide ``et - st``.
+    framedir : `str`, optional, default='./'
+        top level frame directory
+    catalog : :class:`seispy.trace.catalog.FrameCatalog`, optional
+        catalog to look frames up in. One is made and shared by all
+        chunks if not given.
+    prefetch : `int`, optional, default=1
+        number of chunks to read ahead. Bounds how much data is
+        held in memory waiting for the caller.
+    **kwargs
+        passed on to :func:`fetch_channels` (e.g. `nproc`,
+        `skip_failures`)
+
+    Returns
+    -------
+    chunks : `generator`
+        `collections.OrderedDict` of `Trace` for each channel, for
+        each chunk in order
+    """
+    if stride <= 0:
+        raise ValueError('stride must be positive')
+    if prefetch < 1:
+        raise ValueError('prefetch must be at least 1')
+    if catalog is None:
+        from .catalog import FrameCatalog
+        catalog = FrameCatalog(framedir)
+    spans = [(start, min(start + stride, et)) for start in
+             np.arange(st, et, stride)]
+    chunks = Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # give up if the caller stopped iterating
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read_ahead():
+        for chunk_st, chunk_et in spans:
+            try:
+                item = (fetch_channels(chunk_st, chunk_et, channels,
+                                       catalog=catalog, **kwargs), None)
+            except Exception as e:
+                put((None, e))
+                return
+            if not put(item):
+                return
+
+    reader = threading.Thread(target=read_ahead)
+    reader.daemon = True
+    reader.start()
+    try:
+        for ii in range(len(spans)):
+            traces, error = chunks.get()
+            if error is not None:
+                raise error
+            yield traces
+    finally:
+        stop.set()
+        reader.join()
 
 
 def read_frame(frame, channel, st=None, et=None, cfac=1.589459e-9):
@@ -470,13 +1178,43 @@ def read_frame(frame, channel, st=None, et=None, cfac=1.589459e-9):
     TS : `Trace`
         time series trace
     """
+    return read_frame_channels(frame, [channel], st=st, et=et,
+                               cfac=cfac)[channel]
+
 
+def read_frame_channels(frame, channels, st=None, et=None,
+                        cfac=1.589459e-9):
+    """
+    reads several channels from a ligo frame, opening it only once
+
+    Parameters
+    ----------
+    frame : `str`
+        filepath to a frame
+    channels : `list`
+        channels in the frame to load
+    st : `int`, date string, optional
+        optional start time. defaults to beginning
+        of frame
+    et : `int ,date string, optional
+        optional end time. defaults to end
+        of frame
+
+    Returns
+    -------
+    traces : `collections.OrderedDict`
+        time series trace for each channel
+    """
     if st is not None and et is not None:
-        d1 = cfac * Trace.read(frame, channel, st, et).detrend()
+        data = TimeSeriesDict.read(frame, channels, st, et)
     else:
-        d1 = cfac * Trace.read(frame, channel).detrend()
-    d1.location = d1.get_location()
-    return d1
+        data = TimeSeriesDict.read(frame, channels)
+    traces = OrderedDict()
+    for chan in channels:
+        d1 = cfac * data[chan].view(Trace).detrend()
+        d1.location = d1.get_location()
+        traces[chan] = d1
+    return traces
 
 
 def read_mseed(f, starttime=None, endtime=None):
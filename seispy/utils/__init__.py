@@ -1,2 +1,7 @@
 from .orfs import *
 from .utils import *
+from .spectral import *
+from .orfcache import *
+from .solvers import *
+from .skygrid import *
+from .stftcache import *
@@ -0,0 +1,176 @@
+from __future__ import division
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from .orfs import orf_picker
+
+
+def _default_grid(thetas, phis):
+    """
+    fill in default theta/phi grid used by the directional orfs
+    """
+    if thetas is None:
+        thetas = np.arange(3,180,6) * np.pi / 180
+    if phis is None:
+        phis = np.arange(3,360,6) * np.pi / 180
+    return thetas, phis
+
+
+class ORFCache(object):
+    """
+    Cache for directional overlap reduction functions.
+
+    ORFs only depend on the station locations, channel vectors,
+    velocity, frequency and sky grid (and epsilon, alpha for r-waves),
+    never on the data. Results of :func:`seispy.utils.orfs.orf_picker`
+    are kept in an in-memory LRU keyed by a hash of those inputs and
+    are optionally persisted to `cache_dir` as ``.npz`` files so that
+    separate runs can share them.
+
+    >>> cache = ORFCache(cache_dir='./orf_cache')
+    >>> g, g_shape = cache('p', [1,0,0], [0,1,0], loc1, loc2, 5700, 1)
+    """
+    def __init__(self, max_bytes=2**30, cache_dir=None):
+        super(ORFCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def key(string, ch1_vec, ch2_vec, det1_loc, det2_loc, v, f, thetas=None,
+            phis=None, epsilon=0.1, alpha=1000, grid=None):
+        """
+        hash of everything an orf depends on
+
+        Returns
+        -------
+        key : `str`
+            sha1 hex digest
+        """
+        thetas, phis = _default_grid(thetas, phis)
+        h = hashlib.sha1(str(string).encode())
+        if grid is not None:
+            # pixels (and map shape) of the grid replace the mesh
+            thetas, phis = grid.thetas, grid.phis
+            h.update(str(grid.shape).encode())
+        for arr in [ch1_vec, ch2_vec, det1_loc, det2_loc, v, f, thetas, phis]:
+            arr = np.ascontiguousarray(arr, dtype=float)
+            h.update(str(arr.shape).encode())
+            h.update(arr.tostring())
+        # only r-waves depend on ellipticity and attenuation
+        if string == 'r':
+            h.update(np.array([epsilon, alpha], dtype=float).tostring())
+        return h.hexdigest()
+
+    def __call__(self, string, ch1_vec, ch2_vec, det1_loc, det2_loc, v, f,
+            thetas=None, phis=None, epsilon=0.1, alpha=1000, grid=None):
+        """
+        cached version of :func:`seispy.utils.orfs.orf_picker`. Takes the
+        same arguments and returns the same thing.
+        """
+        key = self.key(string, ch1_vec, ch2_vec, det1_loc, det2_loc, v, f,
+                thetas=thetas, phis=phis, epsilon=epsilon, alpha=alpha,
+                grid=grid)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = orf_picker(string, ch1_vec, ch2_vec, det1_loc, det2_loc, v,
+                f, thetas=thetas, phis=phis, epsilon=epsilon, alpha=alpha,
+                grid=grid)
+        self.put(key, result)
+        return result
+
+    def get(self, key):
+        """
+        get orfs from memory, then disk. Returns None if they
+        aren't cached.
+        """
+        try:
+            result = self._cache.pop(key)
+            # re-insert to mark as most recently used
+            self._cache[key] = result
+            return result
+        except KeyError:
+            pass
+        result = self._read(key)
+        if result is not None:
+            self._store(key, result)
+        return result
+
+    def put(self, key, result):
+        """
+        add orfs to cache (and disk if we have a cache directory)
+        """
+        for arr in result:
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+        self._store(key, result)
+        self._write(key, result)
+
+    def clear(self):
+        """
+        empty in-memory cache. Files on disk are left alone.
+        """
+        self._cache.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def _store(self, key, result):
+        nbytes = sum([arr.nbytes for arr in result if isinstance(arr,
+            np.ndarray)])
+        if nbytes > self.max_bytes:
+            return
+        self._cache[key] = result
+        self.nbytes += nbytes
+        # evict least recently used
+        while self.nbytes > self.max_bytes:
+            old_key, old = self._cache.popitem(last=False)
+            self.nbytes -= sum([arr.nbytes for arr in old if
+                isinstance(arr, np.ndarray)])
+
+    def _fname(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def _read(self, key):
+        if self.cache_dir is None:
+            return None
+        fname = self._fname(key)
+        if not os.path.isfile(fname):
+            return None
+        with np.load(fname) as f:
+            norfs = int(f['norfs'])
+            orfs = [f['orf%d' % ii] for ii in range(norfs)]
+            shapes = [tuple(f['shape%d' % ii]) for ii in range(norfs)]
+        for arr in orfs:
+            arr.flags.writeable = False
+        return tuple(orfs + shapes)
+
+    def _write(self, key, result):
+        if self.cache_dir is None:
+            return
+        orfs = [arr for arr in result if isinstance(arr, np.ndarray)]
+        shapes = [arr for arr in result if isinstance(arr, tuple)]
+        arrs = {'norfs': len(orfs)}
+        for ii, (orf, shape) in enumerate(zip(orfs, shapes)):
+            arrs['orf%d' % ii] = orf
+            arrs['shape%d' % ii] = np.asarray(shape)
+        # write to temporary file and move it so that
+        # concurrent jobs never see a partial file
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrs)
+        os.rename(tmpname, self._fname(key))
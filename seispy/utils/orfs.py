@@ -2,7 +2,24 @@ from __future__ import division
 import numpy as np
 from scipy.interpolate import interp1d
 from scipy.special import sph_harm
-from .utils import calc_travel_time
+from .utils import calc_travel_time, travel_time_tensor, station_pairs
+
+def _sky_mesh(thetas=None, phis=None, grid=None):
+    """
+    polar and azimuthal angle of every direction we want orfs for,
+    arranged like the maps they go into. Uses the pixels of `grid`
+    if one is supplied, otherwise a theta/phi mesh.
+    """
+    if grid is not None:
+        THETAS, PHIS = grid.meshgrid()
+        thetas, phis = grid.map_axes()
+        return THETAS, PHIS, thetas, phis
+    if thetas is None:
+        thetas = np.arange(3,180,6) * np.pi / 180
+    if phis is None:
+        phis = np.arange(3,360,6) * np.pi / 180
+    THETAS, PHIS = np.meshgrid(thetas, phis)
+    return THETAS, PHIS, thetas, phis
 
 def orf_p(ch1_vec, ch2_vec, det1_loc, det2_loc, vp, ff=None, thetamesh=1,
         phimesh=1):
@@ -117,7 +134,7 @@ def orf_s(ch1_vec, ch2_vec, det1_loc, det2_loc, vs, ff=None, thetamesh=1,phimesh
     return gammas, ff
 
 def orf_p_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vp, f, thetas=None,
-        phis=None):
+        phis=None, dt=None, grid=None):
     """
     Calculate p-wave overlap reduction function between
     two channels
@@ -139,6 +156,13 @@ def orf_p_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vp, f, thetas=None,
     phis : `numpy.ndarray`, optional
         list of phi values to use. If not supplied,
         defaults to 3 -> 357 in increments of 6 degrees.
+    dt : `numpy.ndarray`, optional
+        precomputed travel times across this baseline for each
+        direction (e.g. a row of
+        :func:`seispy.utils.utils.travel_time_tensor`).
+        Calculated here if not supplied.
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to calculate orfs on. Overrides `thetas` and `phis`.
 
     Returns
     -------
@@ -153,19 +177,16 @@ def orf_p_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vp, f, thetas=None,
     # get separation vector
     x_vec = np.array(det1_loc) - np.array(det2_loc)
     # make it a unit vector
-    if thetas is None:
-        thetas = np.arange(3,180,6) * np.pi / 180
-    if phis is None:
-        phis = np.arange(3,360,6) * np.pi / 180
-    THETAS, PHIS = np.meshgrid(thetas, phis)
+    THETAS, PHIS, thetas, phis = _sky_mesh(thetas, phis, grid)
     # much faster to vectorize things
     OmgX = np.sin(THETAS)*np.cos(PHIS)
     OmgY = np.sin(THETAS)*np.sin(PHIS)
     OmgZ = (np.cos(THETAS))
     Omg_shape = OmgX.shape
     OMEGA = np.vstack((OmgX.flatten(), OmgY.flatten(), OmgZ.flatten())).T
-    dt = calc_travel_time(x_vec, OMEGA, vp)
-    dt = dt.reshape(Omg_shape)
+    if dt is None:
+        dt = calc_travel_time(x_vec, OMEGA, vp)
+    dt = np.reshape(dt, Omg_shape)
     sf = ((OmgX*ch1_vec[0] +
             OmgY*ch1_vec[1] + OmgZ*ch1_vec[2]) * (OmgX*ch2_vec[0] +
             OmgY*ch2_vec[1] + OmgZ*ch2_vec[2]))
@@ -173,7 +194,7 @@ def orf_p_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vp, f, thetas=None,
     return gammas, phis, thetas
 
 def orf_s_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vs, f,
-        thetas=None,phis=None):
+        thetas=None,phis=None, dt=None, grid=None):
     """
     Calculate p-wave overlap reduction function between
     two channels
@@ -191,6 +212,13 @@ def orf_s_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vs, f,
         velocity of s-wave
     f : `float`
         frequency at which you would like the orf
+    dt : `numpy.ndarray`, optional
+        precomputed travel times across this baseline for each
+        direction (e.g. a row of
+        :func:`seispy.utils.utils.travel_time_tensor`).
+        Calculated here if not supplied.
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to calculate orfs on. Overrides `thetas` and `phis`.
 
     Returns
     -------
@@ -206,11 +234,7 @@ def orf_s_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vs, f,
     # get separation vector
     x_vec = np.array(det1_loc) - np.array(det2_loc)
     # make it a unit vector
-    if thetas is None:
-        thetas = np.arange(3,180,6) * np.pi / 180
-    if phis is None:
-        phis = np.arange(3,360,6) * np.pi / 180
-    THETAS, PHIS = np.meshgrid(thetas, phis)
+    THETAS, PHIS, thetas, phis = _sky_mesh(thetas, phis, grid)
     dtheta = thetas[1] - thetas[0]
     dphi = phis[1] - phis[0]
     # much faster to vectorize things
@@ -233,13 +257,15 @@ def orf_s_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, vs, f,
         (ChiX*ch2_vec[0] +ChiY*ch2_vec[1] + ChiZ*ch2_vec[2])
     omg_shape = OmgX.shape
     OMEGA = np.vstack((OmgX.flatten(), OmgY.flatten(), OmgZ.flatten())).T
-    dt = calc_travel_time(x_vec, OMEGA, vs).reshape(omg_shape)
+    if dt is None:
+        dt = calc_travel_time(x_vec, OMEGA, vs)
+    dt = np.reshape(dt, omg_shape)
     gamma1 = sf1 * np.exp(-2*np.pi*1j*f*dt)
     gamma2 = sf2 * np.exp(-2*np.pi*1j*f*dt)
     return gamma1,gamma2,phis,thetas
 
 def orf_r_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, epsilon, alpha, vr, f,
-        thetas=None,phis=None):
+        thetas=None,phis=None, dt=None, grid=None):
     """
     Calculate r-wave overlap reduction function between
     two channels
@@ -257,6 +283,13 @@ def orf_r_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, epsilon, alpha, vr,
         velocity of s-wave
     f : `float`
         frequency at which you would like the orf
+    dt : `numpy.ndarray`, optional
+        precomputed travel times across this baseline for each
+        direction (e.g. a row of
+        :func:`seispy.utils.utils.travel_time_tensor`).
+        Calculated here if not supplied.
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to calculate orfs on. Overrides `thetas` and `phis`.
 
     Returns
     -------
@@ -270,11 +303,7 @@ def orf_r_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, epsilon, alpha, vr,
     # get separation vector
     x_vec = np.array(det1_loc) - np.array(det2_loc)
     # make it a unit vector
-    if thetas is None:
-        thetas = np.arange(3,180,6) * np.pi / 180
-    if phis is None:
-        phis = np.arange(3,360,6) * np.pi / 180
-    THETAS, PHIS = np.meshgrid(thetas, phis)
+    THETAS, PHIS, thetas, phis = _sky_mesh(thetas, phis, grid)
     # much faster to vectorize things
     OmgX = np.sin(THETAS)*np.cos(PHIS)
     OmgY = np.sin(THETAS)*np.sin(PHIS)
@@ -298,7 +327,10 @@ def orf_r_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, epsilon, alpha, vr,
 
     omg_shape = OmgX.shape
     OMEGA = np.vstack((OmgX.flatten(), OmgY.flatten(), OmgZ.flatten())).T
-    dt = calc_travel_time(x_vec, OMEGA, vr).reshape(omg_shape)
+    if dt is None:
+        dt = calc_travel_time(x_vec, OMEGA, vr)
+    # only theta = pi/2 contributes a delay
+    dt = np.where(THETAS == np.pi / 2, np.reshape(dt, omg_shape), 0)
     gamma = sf1*np.conj(sf2)*np.exp(-2*np.pi*1j*f*dt) * np.exp(-(det1_loc[2] +
         det2_loc[2]) / float(alpha))
     return gamma,phis,thetas
@@ -482,17 +514,126 @@ def orf_p_sph(l,m,ch1_vec, ch2_vec, det1_loc, det2_loc, vp, ff=None, thetamesh=1
     return gammas, ff
 
 def orf_picker(string, ch1_vec, ch2_vec, det1_loc, det2_loc, v, f, thetas=None,
-        phis=None, epsilon=0.1, alpha=1000):
+        phis=None, epsilon=0.1, alpha=1000, grid=None):
     if string is 'r':
         g1, p, t =  orf_r_directional(ch1_vec, ch2_vec, det1_loc, det2_loc, epsilon,
-                alpha, v, f, thetas=thetas, phis=phis)
+                alpha, v, f, thetas=thetas, phis=phis, grid=grid)
         return g1.reshape((g1.size,1)), g1.shape
     if string is 's':
         g1, g2, p, t =  orf_s_directional(ch1_vec, ch2_vec, det1_loc, det2_loc,
-                v, f, thetas=thetas, phis=phis)
+                v, f, thetas=thetas, phis=phis, grid=grid)
         return g1.reshape((g1.size,1)), g2.reshape((g2.size,1)), g1.shape, g2.shape
     if string is 'p':
         g1, p, t = orf_p_directional(ch1_vec, ch2_vec, det1_loc, det2_loc,
-                 v, f, thetas=thetas, phis=phis)
+                 v, f, thetas=thetas, phis=phis, grid=grid)
         return g1.reshape((g1.size,1)), g1.shape
 
+
+
+def _polarization_vectors(string, thetas, phis, epsilon=0.1, grid=None):
+    """
+    Unit (or, for r-waves, complex) polarization vectors for every
+    direction on the sky grid, along with the propagation directions
+    used for travel times.
+
+    Returns
+    -------
+    pols : `numpy.ndarray`
+        [polarization, direction, 3] array
+    OMEGA : `numpy.ndarray`
+        [direction, 3] propagation directions
+    omg_shape : `tuple`
+        (n_phi, n_theta) shape of the grid
+    """
+    THETAS, PHIS, thetas, phis = _sky_mesh(thetas, phis, grid)
+    omg_shape = THETAS.shape
+    THETAS = THETAS.flatten()
+    PHIS = PHIS.flatten()
+    OMEGA = np.vstack((np.sin(THETAS)*np.cos(PHIS),
+        np.sin(THETAS)*np.sin(PHIS), np.cos(THETAS))).T
+    if string == 'p':
+        pols = OMEGA[None, :, :]
+    elif string == 's':
+        psi = np.vstack((-np.sin(PHIS), np.cos(PHIS),
+            np.zeros(PHIS.size))).T
+        chi = np.vstack((-np.cos(THETAS)*np.cos(PHIS),
+            -np.cos(THETAS)*np.sin(PHIS), np.sin(THETAS))).T
+        pols = np.array([psi, chi])
+    elif string == 'r':
+        pols = np.vstack((np.cos(PHIS), np.sin(PHIS),
+            np.exp(1j * np.pi / 2) * epsilon * np.ones(PHIS.size))).T
+        pols = pols[None, :, :]
+        # only theta = pi/2 sticks around
+        OMEGA = OMEGA * (THETAS == np.pi / 2)[:, None]
+    else:
+        raise ValueError('wave type must be one of \'p\', \'s\' or \'r\'')
+    return pols, OMEGA, omg_shape
+
+def orf_tensor(string, channel_vecs, station_locs, v, f, thetas=None,
+        phis=None, epsilon=0.1, alpha=1000, pairs=None, grid=None):
+    """
+    Directional overlap reduction functions for every pair of
+    stations, every combination of channels and every polarization
+    of one wave type at once.
+
+    Geometric factors are computed once for the whole sky grid and
+    the phase factor :math:`e^{-2\pi i f \Delta t}` once for each
+    baseline, so this is a handful of broadcasts rather than
+    one call to the directional orfs per pair and channel combination.
+
+    Parameters
+    ----------
+    string : `str`
+        wave type, 'p', 's' or 'r'
+    channel_vecs : `list`
+        channel vectors (e.g. ``[[1,0,0], [0,1,0], [0,0,1]]``)
+    station_locs : `dict`
+        station locations
+    v : `float`
+        velocity of wave
+    f : `float`
+        frequency at which you would like the orfs
+    thetas : `numpy.ndarray`, optional
+        list of theta values to use. Assumed to be angle FROM the north pole.
+        If not supplied, defaults to 3 -> 177 in increments of 6 degrees.
+    phis : `numpy.ndarray`, optional
+        list of phi values to use. If not supplied,
+        defaults to 3 -> 357 in increments of 6 degrees.
+    epsilon : `float`, optional, default=0.1
+        r-wave ellipticity
+    alpha : `float`, optional, default=1000
+        r-wave attenuation depth
+    pairs : `list`, optional
+        list of (station1, station2) tuples. Defaults to
+        :func:`seispy.utils.utils.station_pairs` of all stations.
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to calculate orfs on. Overrides `thetas` and `phis`.
+
+    Returns
+    -------
+    gammas : `numpy.ndarray`
+        [pair, chan1, chan2, polarization, direction] array of orfs.
+        ``gammas[ii, kk, ll, pol]`` is the flattened version of what
+        the matching directional orf returns.
+    pairs : `list`
+        list of (station1, station2) tuples, one for each pair
+    omg_shape : `tuple`
+        shape of each map
+    """
+    if pairs is None:
+        pairs = station_pairs(station_locs.keys())
+    pols, OMEGA, omg_shape = _polarization_vectors(string, thetas, phis,
+            epsilon=epsilon, grid=grid)
+    # [channel, polarization, direction] projections
+    proj = np.dot(pols, np.asarray(channel_vecs, dtype=float).T)
+    proj = np.rollaxis(proj, 2, 0)
+    # [chan1, chan2, polarization, direction] geometric factors
+    sf = proj[:, None, :, :] * np.conj(proj)[None, :, :, :]
+    dt, pairs = travel_time_tensor(station_locs, OMEGA, v, pairs=pairs)
+    phase = np.exp(-2*np.pi*1j*f*dt)
+    if string == 'r':
+        depths = np.array([station_locs[s1][2] + station_locs[s2][2] for
+            s1, s2 in pairs])
+        phase *= np.exp(-depths / float(alpha))[:, None]
+    gammas = sf[None, ...] * phase[:, None, None, None, :]
+    return gammas, pairs, omg_shape
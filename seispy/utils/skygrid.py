@@ -0,0 +1,224 @@
+from __future__ import division
+import numpy as np
+
+
+class SkyGrid(object):
+    """
+    Set of pixels on the sky that we recover maps on.
+
+    Each pixel has a polar angle (from the north pole) and an
+    azimuthal angle. Maps on the grid have shape `shape`, and
+    flattening them gives pixels in the same order as `thetas`
+    and `phis`.
+
+    Parameters
+    ----------
+    thetas : `numpy.ndarray`
+        polar angle of each pixel in radians
+    phis : `numpy.ndarray`
+        azimuthal angle of each pixel in radians
+    shape : `tuple`, optional
+        shape of maps on this grid. Defaults to ``(npix,)``.
+    areas : `numpy.ndarray`, optional
+        solid angle of each pixel in steradians
+    """
+    is_mesh = False
+
+    def __init__(self, thetas, phis, shape=None, areas=None):
+        super(SkyGrid, self).__init__()
+        self.thetas = np.asarray(thetas, dtype=float).flatten()
+        self.phis = np.asarray(phis, dtype=float).flatten()
+        if self.thetas.size != self.phis.size:
+            raise ValueError('Need one theta and one phi for each pixel')
+        if shape is None:
+            shape = (self.thetas.size,)
+        if int(np.prod(shape)) != self.thetas.size:
+            raise ValueError('shape does not match number of pixels')
+        self.shape = tuple(shape)
+        self.areas = areas
+
+    @property
+    def npix(self):
+        """
+        number of pixels
+        """
+        return self.thetas.size
+
+    def meshgrid(self):
+        """
+        polar and azimuthal angles arranged like maps on this grid
+
+        Returns
+        -------
+        THETAS : `numpy.ndarray`
+            polar angles with shape `shape`
+        PHIS : `numpy.ndarray`
+            azimuthal angles with shape `shape`
+        """
+        return self.thetas.reshape(self.shape), self.phis.reshape(self.shape)
+
+    def map_axes(self):
+        """
+        theta and phi values that label maps on this grid. For
+        a general grid these are the pixel angles.
+
+        Returns
+        -------
+        thetas : `numpy.ndarray`
+            theta values
+        phis : `numpy.ndarray`
+            phi values
+        """
+        return self.thetas, self.phis
+
+    def directions(self):
+        """
+        unit vector pointing at each pixel
+
+        Returns
+        -------
+        OMEGA : `numpy.ndarray`
+            npix x 3 matrix of unit vectors
+        """
+        return np.vstack((np.sin(self.thetas)*np.cos(self.phis),
+            np.sin(self.thetas)*np.sin(self.phis), np.cos(self.thetas))).T
+
+    def subset(self, mask):
+        """
+        grid made of just the pixels selected by `mask`
+
+        Parameters
+        ----------
+        mask : `numpy.ndarray`
+            boolean mask (or indices) of pixels to keep, in flattened
+            pixel order
+
+        Returns
+        -------
+        grid : :class:`seispy.utils.skygrid.SkyGrid`
+            one-dimensional grid of selected pixels
+        """
+        areas = None
+        if self.areas is not None:
+            areas = np.asarray(self.areas).flatten()[mask]
+        return SkyGrid(self.thetas[mask], self.phis[mask], areas=areas)
+
+
+class MeshGrid(SkyGrid):
+    """
+    Regular theta/phi mesh. This is the grid recovery has always
+    used, with maps of shape (n_phi, n_theta).
+
+    Parameters
+    ----------
+    thetas : `numpy.ndarray`, optional
+        polar angles. Defaults to 3 -> 177 in increments of 6 degrees.
+    phis : `numpy.ndarray`, optional
+        azimuthal angles. Defaults to 3 -> 357 in increments of 6 degrees.
+    """
+    is_mesh = True
+
+    def __init__(self, thetas=None, phis=None):
+        if thetas is None:
+            thetas = np.arange(3,180,6) * np.pi / 180
+        if phis is None:
+            phis = np.arange(3,360,6) * np.pi / 180
+        self.theta_values = np.asarray(thetas, dtype=float)
+        self.phi_values = np.asarray(phis, dtype=float)
+        THETAS, PHIS = np.meshgrid(self.theta_values, self.phi_values)
+        areas = None
+        if self.theta_values.size > 1 and self.phi_values.size > 1:
+            dtheta = self.theta_values[1] - self.theta_values[0]
+            dphi = self.phi_values[1] - self.phi_values[0]
+            areas = np.sin(THETAS) * dtheta * dphi
+        super(MeshGrid, self).__init__(THETAS, PHIS, shape=THETAS.shape,
+                areas=areas)
+
+    def map_axes(self):
+        """
+        theta and phi values of the mesh
+        """
+        return self.theta_values, self.phi_values
+
+
+class EqualAreaGrid(SkyGrid):
+    """
+    Equal-area, iso-latitude pixelization of the sphere, laid out
+    like HEALPix in the RING scheme (Gorski et al. 2005).
+
+    There are ``12 * nside**2`` pixels, all with solid angle
+    ``4 * pi / npix``, on ``4 * nside - 1`` rings of constant theta.
+    Unlike the theta/phi mesh there is no crowding of pixels near the
+    poles, so the same resolution needs far fewer pixels. For
+    example, ``nside=8`` has 768 pixels about 7 degrees across,
+    where the default 6 degree mesh has 1800.
+
+    Parameters
+    ----------
+    nside : `int`, optional, default=8
+        resolution parameter
+    """
+    def __init__(self, nside=8):
+        nside = int(nside)
+        if nside < 1:
+            raise ValueError('nside must be a positive integer')
+        self.nside = nside
+        thetas, phis = _ring_pixel_centers(nside)
+        npix = thetas.size
+        super(EqualAreaGrid, self).__init__(thetas, phis,
+                areas=4 * np.pi / npix * np.ones(npix))
+
+
+def _ring_pixel_centers(nside):
+    """
+    pixel centers of an equal-area ring pixelization
+    (HEALPix ``pix2ang`` in the RING scheme)
+    """
+    npix = 12 * nside**2
+    ncap = 2 * nside * (nside - 1)
+    pix = np.arange(npix)
+    z = np.zeros(npix)
+    phis = np.zeros(npix)
+
+    # north polar cap
+    north = pix < ncap
+    p = pix[north]
+    ring = np.floor((1 + np.sqrt(1 + 2 * p)) / 2).astype(int)
+    j = p - 2 * ring * (ring - 1) + 1
+    z[north] = 1 - ring**2 / (3 * nside**2)
+    phis[north] = (j - 0.5) * np.pi / (2 * ring)
+
+    # equatorial belt
+    belt = (pix >= ncap) & (pix < npix - ncap)
+    p = pix[belt] - ncap
+    ring = p // (4 * nside) + nside
+    j = p % (4 * nside) + 1
+    # every other ring starts at phi = 0
+    shift = np.where((ring + nside) % 2, 1, 0.5)
+    z[belt] = 4 / 3 - 2 * ring / (3 * nside)
+    phis[belt] = (j - shift) * np.pi / (2 * nside)
+
+    # south polar cap mirrors the north one
+    south = pix >= npix - ncap
+    p = npix - 1 - pix[south]
+    ring = np.floor((1 + np.sqrt(1 + 2 * p)) / 2).astype(int)
+    j = p - 2 * ring * (ring - 1) + 1
+    z[south] = -(1 - ring**2 / (3 * nside**2))
+    phis[south] = 2 * np.pi - (j - 0.5) * np.pi / (2 * ring)
+
+    return np.arccos(np.clip(z, -1, 1)), phis
+
+
+def as_sky_grid(thetas=None, phis=None, grid=None):
+    """
+    sky grid to recover on. Returns `grid` if it was supplied,
+    otherwise a :class:`MeshGrid` of `thetas` and `phis`.
+
+    Returns
+    -------
+    grid : :class:`seispy.utils.skygrid.SkyGrid`
+        sky grid
+    """
+    if grid is not None:
+        return grid
+    return MeshGrid(thetas=thetas, phis=phis)
@@ -0,0 +1,804 @@
+from __future__ import division
+import numpy as np
+from multiprocessing import Pool
+from scipy.sparse.linalg import LinearOperator, lsqr
+from .orfs import orf_picker, orf_tensor
+from .utils import set_channel_vector, station_pairs
+
+
+def design_operator(G):
+    """
+    Matrix-free operator for the real least-squares problem
+    behind recovery.
+
+    Recovery solves :math:`\Re(G^\dagger G) x = \Re(G^\dagger Y)`
+    for a real map `x`, where each row of `G` is the orf for one
+    pair of channels. That is the normal equation of
+
+    .. math::
+
+        \\begin{bmatrix}\Re G \\\\ \Im G\end{bmatrix} x =
+        \\begin{bmatrix}\Re Y \\\\ \Im Y\end{bmatrix}
+
+    so the two systems have the same least-squares solution.
+    Recovery is usually underdetermined, though, and `lsqr` stops
+    on a different residual for each, so early-stopped solutions of
+    the stacked system don't match the normal equations. Use
+    :func:`normal_operator` to iterate on the same system as the
+    dense solver.
+
+    Parameters
+    ----------
+    G : `numpy.ndarray`
+        [pair, direction] complex array of stacked orfs
+
+    Returns
+    -------
+    A : `scipy.sparse.linalg.LinearOperator`
+        real operator with shape (2 * npairs, M)
+    """
+    G = np.asarray(G)
+    npairs, M = G.shape
+
+    def matvec(x):
+        gx = np.dot(G, np.ravel(x))
+        return np.hstack((np.real(gx), np.imag(gx)))
+
+    def rmatvec(r):
+        r = np.ravel(r)
+        return np.real(np.dot(np.conj(G).T, r[:npairs] + 1j * r[npairs:]))
+
+    return LinearOperator((2 * npairs, M), matvec=matvec, rmatvec=rmatvec,
+                          dtype=float)
+
+
+def data_vector(Y):
+    """
+    Real right-hand side that goes with :func:`design_operator`
+
+    Parameters
+    ----------
+    Y : `numpy.ndarray`
+        complex cross-spectra, one per pair
+
+    Returns
+    -------
+    b : `numpy.ndarray`
+        real and imaginary parts of `Y` stacked
+    """
+    Y = np.ravel(np.asarray(Y))
+    return np.hstack((np.real(Y), np.imag(Y)))
+
+
+def normal_operator(G):
+    """
+    Matrix-free :math:`\Re(G^\dagger G)`, the (real, symmetric)
+    matrix of the normal equations that the dense recovery path
+    hands to `lsqr`.
+
+    Parameters
+    ----------
+    G : `numpy.ndarray`
+        [pair, direction] complex array of stacked orfs
+
+    Returns
+    -------
+    A : `scipy.sparse.linalg.LinearOperator`
+        real operator with shape (M, M)
+    """
+    G = np.asarray(G)
+    M = G.shape[1]
+
+    def matvec(x):
+        return np.real(np.dot(np.conj(G).T, np.dot(G, np.ravel(x))))
+
+    return LinearOperator((M, M), matvec=matvec, rmatvec=matvec,
+                          dtype=float)
+
+
+def normal_norm(G):
+    """
+    Frobenius norm of :math:`\Re(G^\dagger G)` without building it.
+    :math:`\Re(G^\dagger G) = A^T A` for :math:`A = [\Re G; \Im G]`,
+    which has the same norm as :math:`A A^T`, so we use whichever
+    of the two is smaller.
+    """
+    A = np.vstack((np.real(G), np.imag(G)))
+    if A.shape[0] <= A.shape[1]:
+        return np.linalg.norm(np.dot(A, A.T))
+    return np.linalg.norm(np.dot(A.T, A))
+
+
+def solve_matrix_free(G, Y, iter_lim=1000, atol=1e-6, btol=1e-6, x0=None):
+    """
+    Solve for the recovered map directly from stacked orfs, never
+    materializing :math:`G^\dagger G`. Memory use is
+    O(npairs x M) instead of O(M^2).
+
+    `lsqr` iterates on the same system as the dense path,
+    :math:`\Re(G^\dagger G) x = \Re(G^\dagger Y)`, with
+    :math:`\Re(G^\dagger G)` applied as two matrix-vector products
+    (see :func:`normal_operator`). Recovery is usually
+    underdetermined, and it is stopping `lsqr` early on this system
+    that regularizes the maps, so `atol` and `btol` mean the same
+    thing here as for the dense solver and the maps agree.
+
+    Parameters
+    ----------
+    G : `numpy.ndarray`
+        [pair, direction] complex array of stacked orfs
+    Y : `numpy.ndarray`
+        complex cross-spectra, one per pair
+    iter_lim : `int`, optional, default=1000
+        maximum number of `lsqr` iterations
+    atol : `float`, optional, default=1e-6
+        `lsqr` stopping tolerance
+    btol : `float`, optional, default=1e-6
+        `lsqr` stopping tolerance
+    x0 : `numpy.ndarray`, optional
+        initial guess, e.g. the solution for a neighbouring
+        segment or frequency
+
+    Returns
+    -------
+    S : `tuple`
+        output of :func:`scipy.sparse.linalg.lsqr`
+    """
+    G = np.asarray(G)
+    GY = np.real(np.dot(np.conj(G).T, np.ravel(Y)))
+    # norm is only needed to adjust tolerances for a warm start
+    anorm = normal_norm(G) if x0 is not None else None
+    return solve_lsqr(normal_operator(G), GY, iter_lim=iter_lim, atol=atol,
+                      btol=btol, x0=x0, anorm=anorm)
+
+
+def solve_lsqr(A, b, iter_lim=1000, atol=1e-6, btol=1e-6, x0=None,
+               anorm=None):
+    """
+    :func:`scipy.sparse.linalg.lsqr`, optionally warm-started.
+
+    With an initial guess `lsqr` solves for the correction
+    :math:`\delta x = x - x_0` from the initial residual
+    :math:`r_0 = b - A x_0`, so its stopping test
+    :math:`\|r\| \le btol \|b\| + atol \|A\| \|x\|` becomes
+    :math:`\|r\| \le btol \|r_0\| + atol \|A\| \|\delta x\|`. A good
+    guess then makes the test much stricter than it would be from a
+    cold start and it takes *more* iterations. We use
+
+    .. math::
+
+        btol' = \frac{btol \|b\| + atol \|A\| \|x_0\|}{\|r_0\|}
+
+    instead, so warm and cold starts stop at the same residual.
+
+    Parameters
+    ----------
+    A : `numpy.ndarray`, `scipy.sparse.linalg.LinearOperator`
+        matrix to solve with
+    b : `numpy.ndarray`
+        right-hand side
+    iter_lim : `int`, optional, default=1000
+        maximum number of `lsqr` iterations
+    atol : `float`, optional, default=1e-6
+        `lsqr` stopping tolerance
+    btol : `float`, optional, default=1e-6
+        `lsqr` stopping tolerance
+    x0 : `numpy.ndarray`, optional
+        initial guess, e.g. the solution for a neighbouring
+        segment or frequency
+    anorm : `float`, optional
+        Frobenius norm of `A`. Only needed for a warm start
+        when `A` is not an array.
+
+    Returns
+    -------
+    S : `tuple`
+        output of :func:`scipy.sparse.linalg.lsqr`
+    """
+    if x0 is not None:
+        x0 = np.ravel(x0)
+        if anorm is None:
+            anorm = np.linalg.norm(A)
+        r0norm = np.linalg.norm(b - A.dot(x0))
+        if r0norm > 0:
+            btol = (btol * np.linalg.norm(b) + atol * anorm *
+                    np.linalg.norm(x0)) / r0norm
+    return lsqr(A, b, iter_lim=iter_lim, atol=atol, btol=btol, x0=x0)
+
+
+def lsqr_info(S):
+    """
+    Name the pieces of :func:`scipy.sparse.linalg.lsqr` output
+
+    Parameters
+    ----------
+    S : `tuple`
+        output of :func:`scipy.sparse.linalg.lsqr`
+
+    Returns
+    -------
+    info : `dict`
+        solution 'x', stopping reason 'istop', number of iterations
+        'itn' and the residual and condition estimates 'r1norm',
+        'r2norm', 'anorm', 'acond', 'arnorm', 'xnorm'
+    """
+    keys = ['x', 'istop', 'itn', 'r1norm', 'r2norm', 'anorm', 'acond',
+            'arnorm', 'xnorm', 'var']
+    return dict(zip(keys, S))
+
+
+def recovery_pairs(stations, channels, autocorrelations=True):
+    """
+    List of station/channel combinations used in recovery. We
+    don't double count stations or channels.
+
+    Parameters
+    ----------
+    stations : `list`
+        station names
+    channels : `list`
+        channel names
+    autocorrelations : `bool`, optional, default=True
+        include a channel correlated with itself
+
+    Returns
+    -------
+    pairs : `list`
+        list of ``(station1, station2, chan1, chan2)`` tuples
+    """
+    pairs = []
+    for ii, station1 in enumerate(stations):
+        for station2 in list(stations)[ii:]:
+            for kk, chan1 in enumerate(channels):
+                for chan2 in list(channels)[kk:]:
+                    if (autocorrelations is False and station1 == station2
+                            and chan1 == chan2):
+                        continue
+                    pairs.append((station1, station2, chan1, chan2))
+    return pairs
+
+
+def pair_orfs(rec_str, v_list, chan1, chan2, det1_loc, det2_loc, f,
+              thetas=None, phis=None, epsilon=0.1, alpha=1000,
+              orf_cache=None, grid=None):
+    """
+    Stacked orfs for one pair of channels, for every wave type
+    in `rec_str`. s-waves contribute two polarizations.
+
+    Parameters
+    ----------
+    rec_str : `str`
+        wave types to recover, e.g. 'ps'
+    v_list : `list`
+        velocity for each wave type
+    chan1 : `str`
+        first channel name (e.g. 'HHE')
+    chan2 : `str`
+        second channel name
+    det1_loc : `list-like`
+        location of first station
+    det2_loc : `list-like`
+        location of second station
+    f : `float`
+        frequency
+    orf_cache : :class:`seispy.utils.orfcache.ORFCache`, optional
+        cache for orfs. By default orfs are computed every time and
+        nothing is kept around.
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to recover on. Overrides `thetas` and `phis`.
+
+    Returns
+    -------
+    g : `numpy.ndarray`
+        (M, 1) array of stacked orfs
+    shapes : `list`
+        shape of each map (one per polarization)
+    """
+    if orf_cache is None:
+        orf_cache = orf_picker
+    ch1_vec = set_channel_vector(chan1)
+    ch2_vec = set_channel_vector(chan2)
+    g = []
+    shapes = []
+    for rec, v in zip(rec_str, v_list):
+        orfs = orf_cache(rec, ch1_vec, ch2_vec, det1_loc, det2_loc, v,
+                float(f), thetas=thetas, phis=phis, epsilon=epsilon,
+                alpha=alpha, grid=grid)
+        npol = len(orfs) // 2
+        g.extend(orfs[:npol])
+        shapes.extend(orfs[npol:])
+    return np.vstack(g), shapes
+
+
+def design_matrix(rec_str, station_locs, f, v_list, channels=None,
+                  thetas=None, phis=None, epsilon=0.1, alpha=1000,
+                  autocorrelations=True, pairs=None, grid=None):
+    """
+    Whole recovery design matrix from batched orfs (see
+    :func:`seispy.utils.orfs.orf_tensor`). Rows are ordered like
+    :func:`recovery_pairs` and columns are the flattened maps for
+    each polarization of each wave type in `rec_str`, which is the
+    same layout :func:`pair_orfs` gives one row at a time.
+
+    Parameters
+    ----------
+    rec_str : `str`
+        wave types to recover, e.g. 'ps'
+    station_locs : `dict`
+        station locations. Order of keys sets order of pairs.
+    f : `float`
+        frequency
+    v_list : `list`
+        velocity for each wave type
+    channels : `list`, optional
+        channels to use. Defaults to HHE, HHN, HHZ
+    autocorrelations : `bool`, optional, default=True
+        include a channel correlated with itself
+    pairs : `list`, optional
+        (station1, station2) pairs to include. Defaults to
+        :func:`seispy.utils.utils.station_pairs` of all stations.
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to recover on. Overrides `thetas` and `phis`.
+
+    Returns
+    -------
+    G : `numpy.ndarray`
+        [pair, direction] complex array of stacked orfs
+    pairs : `list`
+        list of ``(station1, station2, chan1, chan2)`` tuples
+    shapes : `list`
+        shape of each map (one per polarization)
+    """
+    if channels is None:
+        channels = ['HHE','HHN','HHZ']
+    if pairs is None:
+        pairs = station_pairs(station_locs.keys())
+    spairs = list(pairs)
+    ch_vecs = [set_channel_vector(chan) for chan in channels]
+    # unique channel combinations, in the order recovery_pairs uses
+    kk, ll = np.triu_indices(len(channels))
+    pairs = [(s1, s2, channels[k], channels[l]) for s1, s2 in spairs
+             for k, l in zip(kk, ll)]
+    blocks = []
+    shapes = []
+    for rec, v in zip(rec_str, v_list):
+        gammas, spairs, shape = orf_tensor(rec, ch_vecs, station_locs, v,
+                float(f), thetas=thetas, phis=phis, epsilon=epsilon,
+                alpha=alpha, pairs=spairs, grid=grid)
+        # [pair, combination, polarization, direction]
+        gammas = gammas[:, kk, ll]
+        npol = gammas.shape[2]
+        blocks.append(gammas.reshape((len(pairs), -1)))
+        shapes.extend([shape] * npol)
+    G = np.hstack(blocks)
+    if autocorrelations is False:
+        keep = [ii for ii, (s1, s2, c1, c2) in enumerate(pairs) if not
+                (s1 == s2 and c1 == c2)]
+        G = G[keep]
+        pairs = [pairs[ii] for ii in keep]
+    return G, pairs, shapes
+
+
+def _normal_equations_shard(args):
+    """
+    :math:`\Re(G^\dagger G)` and :math:`\Re(G^\dagger Y)` for one
+    shard of station pairs. Lives at module level so that it can be
+    sent to a process pool.
+    """
+    (rec_str, station_locs, f, v_list, channels, thetas, phis, epsilon,
+        alpha, autocorrelations, spairs, Y, grid) = args
+    G, pairs, shapes = design_matrix(rec_str, station_locs, f, v_list,
+            channels=channels, thetas=thetas, phis=phis, epsilon=epsilon,
+            alpha=alpha, autocorrelations=autocorrelations, pairs=spairs,
+            grid=grid)
+    GG = np.real(np.dot(np.conj(G).T, G))
+    GY = np.real(np.dot(np.conj(G).T, Y))
+    return GG, GY, shapes
+
+
+def normal_equations(rec_str, station_locs, f, v_list, csdm, channels=None,
+                     thetas=None, phis=None, epsilon=0.1, alpha=1000,
+                     autocorrelations=True, nproc=1, grid=None):
+    """
+    Accumulate the real normal equations
+    :math:`\Re(G^\dagger G) x = \Re(G^\dagger Y)` behind recovery.
+
+    Station pairs are sharded by their first station. Each shard
+    builds its rows of the design matrix and returns partial sums,
+    which are added up in shard order. Shards don't depend on
+    `nproc`, so serial and parallel runs give identical results.
+
+    Parameters
+    ----------
+    rec_str : `str`
+        wave types to recover, e.g. 'ps'
+    station_locs : `dict`
+        station locations. Order of keys sets order of pairs.
+    f : `float`
+        recovery frequency
+    v_list : `list`
+        velocity for each wave type
+    csdm : :class:`seispy.utils.spectral.CSDMatrix`
+        averaged CSD matrix indexed by ``(station, channel)``
+    channels : `list`, optional
+        channels to use. Defaults to HHE, HHN, HHZ
+    autocorrelations : `bool`, optional, default=True
+        include a channel correlated with itself
+    nproc : `int`, optional, default=1
+        number of processes to spread shards over
+    grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+        sky grid to recover on. Overrides `thetas` and `phis`.
+
+    Returns
+    -------
+    GG : `numpy.ndarray`
+        (M, M) real matrix :math:`\Re(G^\dagger G)`
+    GY : `numpy.ndarray`
+        length M real vector :math:`\Re(G^\dagger Y)`
+    shapes : `list`
+        shape of each map (one per polarization)
+    """
+    if channels is None:
+        channels = ['HHE','HHN','HHZ']
+    stations = list(station_locs.keys())
+    tasks = []
+    for ii, station1 in enumerate(stations):
+        spairs = [(station1, station2) for station2 in stations[ii:]]
+        pairs = recovery_pairs(stations[ii:], channels,
+                autocorrelations=autocorrelations)
+        pairs = [pair for pair in pairs if pair[0] == station1]
+        Y = pair_csds(csdm, pairs, f)
+        tasks.append((rec_str, station_locs, f, v_list, channels, thetas,
+                      phis, epsilon, alpha, autocorrelations, spairs, Y,
+                      grid))
+    if nproc > 1:
+        pool = Pool(processes=min(nproc, len(tasks)))
+        try:
+            results = pool.map(_normal_equations_shard, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(map(_normal_equations_shard, tasks))
+    GG, GY, shapes = results[0]
+    GG = GG.copy()
+    GY = GY.copy()
+    for partial_GG, partial_GY, shapes in results[1:]:
+        GG += partial_GG
+        GY += partial_GY
+    return GG, GY, shapes
+
+
+def recovery_bins(f, fftlength, nbins=1):
+    """
+    Frequencies of the FFT bins that :func:`pair_csds` sums over.
+    Passing these to :meth:`seispy.utils.spectral.CSDMatrix.from_arrays`
+    avoids calculating CSDs at every other frequency.
+
+    Parameters
+    ----------
+    f : `float`
+        recovery frequency
+    fftlength : `float`
+        length of FFTs in seconds
+    nbins : `int`, optional, default=1
+        number of bins on either side of `f`
+
+    Returns
+    -------
+    frequencies : `numpy.ndarray`
+        ``2 * nbins + 1`` frequencies centered on `f`
+    """
+    return f + np.arange(-nbins, nbins + 1) / fftlength
+
+
+def pair_csds(csdm, pairs, f, nbins=1):
+    """
+    Cross-spectra for each pair at the recovery frequency.
+
+    Parameters
+    ----------
+    csdm : :class:`seispy.utils.spectral.CSDMatrix`
+        averaged CSD matrix indexed by ``(station, channel)``
+    pairs : `list`
+        list of ``(station1, station2, chan1, chan2)``
+    f : `float`
+        recovery frequency
+    nbins : `int`, optional, default=1
+        number of bins on either side of `f` to sum over
+
+    Returns
+    -------
+    Y : `numpy.ndarray`
+        complex cross-spectra, one per pair
+
+    Raises
+    ------
+    ValueError
+        if `csdm` has no bin within half a bin of `f`, or not
+        `nbins` bins on either side of it
+    """
+    freqs = np.asarray(csdm.frequencies, dtype=float)
+    # bins are rarely exactly f in floating point, so take the nearest
+    idx = int(np.argmin(np.abs(freqs - f)))
+    if freqs.size > 1:
+        df = np.min(np.diff(freqs))
+        if np.abs(freqs[idx] - f) > df / 2:
+            raise ValueError('No frequency bin near %g Hz, nearest is %g Hz'
+                             % (f, freqs[idx]))
+    elif not np.isclose(freqs[idx], f):
+        raise ValueError('No frequency bin near %g Hz, only have %g Hz' %
+                         (f, freqs[idx]))
+    if idx - nbins < 0 or idx + nbins >= freqs.size:
+        raise ValueError('Need %d bins on either side of %g Hz' % (nbins, f))
+    Y = np.zeros(len(pairs), dtype=complex)
+    for ii, (station1, station2, chan1, chan2) in enumerate(pairs):
+        cp = csdm.csd((station1, chan1), (station2, chan2))
+        Y[ii] = cp[idx-nbins:idx+nbins+1].sum()
+    return Y
+
+
+class RecoveryOperator(object):
+    """
+    Factor-once, solve-many recovery.
+
+    The orfs depend only on array geometry, frequency, velocities and
+    sky grid, so for a fixed configuration we can compute a
+    (truncated SVD) pseudo-inverse of the real design matrix
+    :math:`[\Re G; \Im G]` once. Recovering a map from new cross-spectra
+    is then one matrix-vector product.
+
+    Truncating the SVD regularizes the map differently from stopping
+    `lsqr` early. Peaks end up in the same place, but amplitudes can
+    differ from the `lsqr` maps by tens of percent, up to about a
+    factor of two depending on the array and `rcond`. Smaller
+    `rcond` keeps more singular values and gives larger amplitudes.
+
+    >>> op = RecoveryOperator.from_geometry('p', stations, 1, [5700])
+    >>> x = op.solve(Y)
+
+    Parameters
+    ----------
+    G : `numpy.ndarray`
+        complex design matrix, one row per pair
+    pairs : `list`
+        ``(station1, station2, chan1, chan2)`` for each row of `G`
+    shapes : `list`
+        shape of the map for each wave type
+    rcond : `float`, optional, default=1e-2
+        relative cutoff for small singular values
+    rec_str, recovery_freq, v_list, thetas, phis : optional
+        configuration `G` was built for. Kept (and saved) so that
+        :meth:`check` can catch the operator being used for
+        something else. :meth:`from_geometry` fills them in.
+    """
+    def __init__(self, G, pairs, shapes, rcond=1e-2, rec_str=None,
+                 recovery_freq=None, v_list=None, thetas=None, phis=None):
+        super(RecoveryOperator, self).__init__()
+        self.pairs = list(pairs)
+        self.shapes = list(shapes)
+        self.rcond = rcond
+        self.rec_str = rec_str
+        self.recovery_freq = recovery_freq
+        self.v_list = v_list if v_list is None else np.asarray(v_list,
+                                                               dtype=float)
+        self.thetas = thetas if thetas is None else np.asarray(thetas,
+                                                               dtype=float)
+        self.phis = phis if phis is None else np.asarray(phis, dtype=float)
+        G = np.asarray(G)
+        if G.shape[0] != len(self.pairs):
+            raise ValueError('Need one row of G for each pair')
+        A = np.vstack((np.real(G), np.imag(G)))
+        U, s, Vt = np.linalg.svd(A, full_matrices=False)
+        keep = s > rcond * s.max()
+        self.singular_values = s
+        self.rank = int(keep.sum())
+        # orthonormal basis for the data the operator can fit
+        self.basis = U[:, keep]
+        # pinv = V diag(1/s) U^T, truncated to the kept singular values
+        self.pinv = np.dot(Vt[keep].T / s[keep], U[:, keep].T)
+
+    @classmethod
+    def from_geometry(cls, rec_str, station_locs, recovery_freq, v_list,
+                      channels=None, thetas=None, phis=None, epsilon=0.1,
+                      alpha=1000, autocorrelations=True, orf_cache=None,
+                      rcond=1e-2, grid=None):
+        """
+        Build design matrix for an array and factor it.
+
+        Parameters
+        ----------
+        rec_str : `str`
+            wave types to recover, e.g. 'ps'
+        station_locs : `dict`
+            station locations. Order of keys sets order of pairs.
+        recovery_freq : `float`
+            frequency of recovery
+        v_list : `list`
+            velocity for each wave type
+        channels : `list`, optional
+            channels to use. Defaults to HHE, HHN, HHZ
+        orf_cache : :class:`seispy.utils.orfcache.ORFCache`, optional
+            if given, orfs are pulled from this cache pair by pair.
+            Otherwise the design matrix is built in one go with
+            :func:`design_matrix`.
+        rcond : `float`, optional, default=1e-2
+            singular values smaller than `rcond` times the largest
+            singular value are dropped. See the class docstring for
+            how this affects amplitudes.
+        grid : :class:`seispy.utils.skygrid.SkyGrid`, optional
+            sky grid to recover on. Overrides `thetas` and `phis`.
+
+        Returns
+        -------
+        op : :class:`seispy.utils.solvers.RecoveryOperator`
+            factored recovery operator
+        """
+        # angles that label maps, as in `recovery_matrices`
+        if grid is not None:
+            map_thetas, map_phis = grid.map_axes()
+        else:
+            map_thetas, map_phis = thetas, phis
+            if map_thetas is None:
+                map_thetas = np.arange(3,180,6) * np.pi / 180
+            if map_phis is None:
+                map_phis = np.arange(3,360,6) * np.pi / 180
+        config = dict(rcond=rcond, rec_str=rec_str,
+                      recovery_freq=recovery_freq, v_list=v_list,
+                      thetas=map_thetas, phis=map_phis)
+        if orf_cache is None:
+            G, pairs, shapes = design_matrix(rec_str, station_locs,
+                    recovery_freq, v_list, channels=channels, thetas=thetas,
+                    phis=phis, epsilon=epsilon, alpha=alpha,
+                    autocorrelations=autocorrelations, grid=grid)
+            return cls(G, pairs, shapes, **config)
+        if channels is None:
+            channels = ['HHE','HHN','HHZ']
+        pairs = recovery_pairs(list(station_locs.keys()), channels,
+                               autocorrelations=autocorrelations)
+        G = []
+        for station1, station2, chan1, chan2 in pairs:
+            g, shapes = pair_orfs(rec_str, v_list, chan1, chan2,
+                    station_locs[station1], station_locs[station2],
+                    recovery_freq, thetas=thetas, phis=phis,
+                    epsilon=epsilon, alpha=alpha, orf_cache=orf_cache,
+                    grid=grid)
+            G.append(g[:, 0])
+        return cls(np.array(G), pairs, shapes, **config)
+
+    def check(self, rec_str, recovery_freq, v_list, thetas, phis):
+        """
+        make sure the operator was built for this configuration.
+        Anything the operator doesn't know (e.g. if it was made
+        straight from a design matrix) isn't checked.
+
+        Parameters
+        ----------
+        rec_str : `str`
+            wave types to recover
+        recovery_freq : `float`
+            frequency of recovery
+        v_list : `list`
+            velocity for each wave type
+        thetas : `numpy.ndarray`
+            theta values that label maps
+        phis : `numpy.ndarray`
+            phi values that label maps
+
+        Raises
+        ------
+        ValueError
+            if any of them don't match what the operator was
+            built for
+        """
+        if self.rec_str is not None and rec_str != self.rec_str:
+            raise ValueError('Operator was built to recover %r, not %r' %
+                             (self.rec_str, rec_str))
+        if (self.recovery_freq is not None and
+                not np.isclose(recovery_freq, self.recovery_freq)):
+            raise ValueError('Operator was built for %g Hz, not %g Hz' %
+                             (self.recovery_freq, recovery_freq))
+        for name, mine, theirs in [('velocities', self.v_list, v_list),
+                                   ('thetas', self.thetas, thetas),
+                                   ('phis', self.phis, phis)]:
+            if mine is None:
+                continue
+            theirs = np.asarray(theirs, dtype=float)
+            if theirs.shape != mine.shape or not np.allclose(theirs, mine):
+                raise ValueError('Operator was built for different %s' %
+                                 name)
+
+    def solve(self, Y):
+        """
+        recover map from cross-spectra
+
+        Parameters
+        ----------
+        Y : `numpy.ndarray`
+            complex cross-spectra, ordered like `self.pairs`
+
+        Returns
+        -------
+        x : `numpy.ndarray`
+            recovered (flattened) map
+        """
+        return np.dot(self.pinv, data_vector(Y))
+
+    def residual_norm(self, Y):
+        """
+        norm of the residual :math:`\|[\Re G; \Im G] x - [\Re Y; \Im Y]\|`
+        of the map recovered from `Y`, i.e. the part of the data
+        that the kept singular vectors can't fit
+
+        Parameters
+        ----------
+        Y : `numpy.ndarray`
+            complex cross-spectra, ordered like `self.pairs`
+
+        Returns
+        -------
+        rnorm : `float`
+            residual norm
+        """
+        b = data_vector(Y)
+        return np.linalg.norm(b - np.dot(self.basis, np.dot(self.basis.T, b)))
+
+    def info(self, Y, x=None):
+        """
+        information about a solve, for
+        ``recovery_matrices(..., full_output=True)``
+
+        Parameters
+        ----------
+        Y : `numpy.ndarray`
+            complex cross-spectra, ordered like `self.pairs`
+        x : `numpy.ndarray`, optional
+            map recovered from `Y`, if it has already been solved for
+
+        Returns
+        -------
+        info : `dict`
+            flattened solution 'x', number of singular values kept
+            'rank', cutoff 'rcond' and residual norm 'rnorm' (see
+            :meth:`residual_norm`)
+        """
+        if x is None:
+            x = self.solve(Y)
+        return {'x': x, 'rank': self.rank, 'rcond': self.rcond,
+                'rnorm': self.residual_norm(Y)}
+
+    def save(self, fname):
+        """
+        save factored operator to an ``.npz`` file
+        """
+        config = dict((key, getattr(self, key)) for key in
+                      ['rec_str', 'recovery_freq', 'v_list', 'thetas', 'phis']
+                      if getattr(self, key) is not None)
+        np.savez(fname, pinv=self.pinv, pairs=np.array(self.pairs,
+                 dtype=object), shapes=np.array(self.shapes),
+                 singular_values=self.singular_values, rcond=self.rcond,
+                 basis=self.basis, **config)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        load factored operator saved with
+        :meth:`~seispy.utils.solvers.RecoveryOperator.save`
+        """
+        with np.load(fname, allow_pickle=True) as f:
+            op = cls.__new__(cls)
+            op.pinv = f['pinv']
+            op.pairs = [tuple(pair) for pair in f['pairs']]
+            op.shapes = [tuple(shape) for shape in f['shapes']]
+            op.singular_values = f['singular_values']
+            op.basis = f['basis']
+            op.rcond = float(f['rcond'])
+            op.rank = int((op.singular_values > op.rcond *
+                           op.singular_values.max()).sum())
+            # operators saved without their configuration aren't checked
+            op.rec_str = str(f['rec_str']) if 'rec_str' in f.files else None
+            op.recovery_freq = (float(f['recovery_freq']) if
+                                'recovery_freq' in f.files else None)
+            for key in ['v_list', 'thetas', 'phis']:
+                setattr(op, key, f[key] if key in f.files else None)
+        return op
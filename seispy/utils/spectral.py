@@ -0,0 +1,410 @@
+from __future__ import division
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy.signal import get_window
+
+
+def segment_view(data, nfft, nstep):
+    """
+    Zero-copy view of overlapping segments of the last
+    axis of an array.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        data to segment. Segments are taken along the last axis.
+    nfft : `int`
+        number of samples in each segment
+    nstep : `int`
+        number of samples between the start of consecutive segments
+
+    Returns
+    -------
+    segments : `numpy.ndarray`
+        read-only view with shape ``data.shape[:-1] + (nsegs, nfft)``
+    """
+    data = np.asarray(data)
+    nfft = int(nfft)
+    nstep = int(nstep)
+    if nstep < 1:
+        raise ValueError('overlap must be less than fftlength')
+    nsegs = 1 + (data.shape[-1] - nfft) // nstep
+    if nsegs < 1:
+        raise ValueError('fftlength cannot be longer than the data')
+    shape = data.shape[:-1] + (nsegs, nfft)
+    strides = data.strides[:-1] + (data.strides[-1] * nstep,
+                                   data.strides[-1])
+    segs = as_strided(data, shape=shape, strides=strides)
+    segs.flags.writeable = False
+    return segs
+
+
+def onesided_factor(nfft):
+    """
+    Factor to turn a two-sided density into a one-sided
+    density, i.e. 2 everywhere except DC and Nyquist.
+
+    Parameters
+    ----------
+    nfft : `int`
+        number of samples in FFT
+
+    Returns
+    -------
+    factor : `numpy.ndarray`
+        factor for each of the ``nfft // 2 + 1`` rfft bins
+    """
+    factor = 2 * np.ones(nfft // 2 + 1)
+    factor[0] = 1
+    if not nfft % 2:
+        factor[-1] = 1
+    return factor
+
+
+def rfft_spectrum(data, sample_rate=1, window=None, axis=-1):
+    """
+    One-sided spectrum of real data, normalized by the number of
+    samples like :meth:`seispy.trace.Trace.fft_new`. Only the
+    ``nfft // 2 + 1`` non-negative frequencies are computed; the
+    negative frequencies of real data are their complex conjugates
+    (see :func:`twosided_spectrum`).
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        real data. Can be a stack of segments.
+    sample_rate : `float`, optional, default=1
+        sample rate of data in Hz
+    window : `str`, `numpy.ndarray`, optional
+        window to apply before the FFT. 'hanning' is
+        `numpy.hanning`, other strings go to
+        :func:`scipy.signal.get_window`. No window by default.
+    axis : `int`, optional, default=-1
+        time axis of `data`
+
+    Returns
+    -------
+    spectrum : `numpy.ndarray`
+        ``rfft(data * window) / nfft`` along `axis`
+    frequencies : `numpy.ndarray`
+        frequencies of rfft bins
+    """
+    data = np.asarray(data)
+    nfft = data.shape[axis]
+    if window is not None:
+        if isinstance(window, str):
+            if window == 'hanning':
+                window = np.hanning(nfft)
+            else:
+                window = get_window(window, nfft)
+        shape = [1] * data.ndim
+        shape[axis] = nfft
+        data = data * np.asarray(window).reshape(shape)
+    spectrum = np.fft.rfft(data, axis=axis) / nfft
+    return spectrum, np.fft.rfftfreq(nfft, 1. / sample_rate)
+
+
+def twosided_spectrum(spectrum, nfft, axis=-1):
+    """
+    Rebuild the full `numpy.fft.fft` spectrum of real data
+    from its one-sided rfft spectrum.
+
+    Parameters
+    ----------
+    spectrum : `numpy.ndarray`
+        one-sided spectrum, ``nfft // 2 + 1`` bins along `axis`
+    nfft : `int`
+        number of samples in the original data
+    axis : `int`, optional, default=-1
+        frequency axis
+
+    Returns
+    -------
+    spectrum : `numpy.ndarray`
+        two-sided spectrum in `numpy.fft.fftfreq` order
+    """
+    spectrum = np.rollaxis(np.asarray(spectrum), axis, spectrum.ndim)
+    # negative frequencies, excluding DC (and Nyquist for even nfft)
+    negative = np.conj(spectrum[..., 1:(nfft + 1) // 2][..., ::-1])
+    full = np.concatenate((spectrum, negative), axis=-1)
+    return np.rollaxis(full, full.ndim - 1, axis)
+
+
+def windowed_ffts(data, sample_rate, fftlength, overlap=0, window='hann',
+                  detrend=True):
+    """
+    Segment, window and FFT data once for every segment.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        [channel, sample] (or just [sample]) array of real data
+    sample_rate : `float`
+        sample rate of data in Hz
+    fftlength : `float`
+        length of each segment in seconds
+    overlap : `float`, optional, default=0
+        overlap between segments in seconds
+    window : `str`, `numpy.ndarray`, optional, default='hann'
+        window to apply to each segment. See
+        :func:`scipy.signal.get_window`
+    detrend : `bool`, optional, default=True
+        remove mean from each segment before windowing
+        (same as `scipy.signal.csd`)
+
+    Returns
+    -------
+    ffts : `numpy.ndarray`
+        [..., segment, frequency] array of rffts
+    frequencies : `numpy.ndarray`
+        frequencies of rfft bins
+    scale : `numpy.ndarray`
+        scale factor for each frequency that turns
+        ``conj(X) * Y`` into a one-sided cross spectral density
+    """
+    nfft = int(round(fftlength * sample_rate))
+    noverlap = int(round(overlap * sample_rate))
+    segs = segment_view(data, nfft, nfft - noverlap)
+    if isinstance(window, str):
+        window = get_window(window, nfft)
+    window = np.asarray(window)
+    if detrend:
+        segs = segs - segs.mean(axis=-1)[..., None]
+    ffts = np.fft.rfft(segs * window, axis=-1)
+    frequencies = np.fft.rfftfreq(nfft, 1. / sample_rate)
+    scale = onesided_factor(nfft) / (sample_rate * (window ** 2).sum())
+    return ffts, frequencies, scale
+
+
+def narrowband_ffts(data, sample_rate, fftlength, frequencies, overlap=0,
+                    window='hann', detrend=True):
+    """
+    Same coefficients as :func:`windowed_ffts`, but only at a few
+    frequencies. Each segment is projected onto precomputed complex
+    exponentials (a direct DFT), which costs O(N) per frequency
+    instead of a full FFT.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        [channel, sample] (or just [sample]) array of real data
+    sample_rate : `float`
+        sample rate of data in Hz
+    fftlength : `float`
+        length of each segment in seconds
+    frequencies : `list`
+        frequencies to evaluate. Must be FFT bins, i.e. multiples
+        of ``1 / fftlength``.
+    overlap : `float`, optional, default=0
+        overlap between segments in seconds
+    window : `str`, `numpy.ndarray`, optional, default='hann'
+        window to apply to each segment
+    detrend : `bool`, optional, default=True
+        remove mean from each segment before windowing
+
+    Returns
+    -------
+    ffts : `numpy.ndarray`
+        [..., segment, frequency] array of DFT coefficients
+    frequencies : `numpy.ndarray`
+        frequencies of bins
+    scale : `numpy.ndarray`
+        scale factor for each frequency that turns
+        ``conj(X) * Y`` into a one-sided cross spectral density
+    """
+    nfft = int(round(fftlength * sample_rate))
+    noverlap = int(round(overlap * sample_rate))
+    segs = segment_view(data, nfft, nfft - noverlap)
+    if isinstance(window, str):
+        window = get_window(window, nfft)
+    window = np.asarray(window)
+    bins = np.round(np.asarray(frequencies, dtype=float) * nfft /
+                    sample_rate).astype(int)
+    if np.any(bins < 0) or np.any(bins > nfft // 2):
+        raise ValueError('frequencies must be between 0 and Nyquist')
+    if not np.allclose(bins * sample_rate / nfft, frequencies):
+        raise ValueError('frequencies must be multiples of 1 / fftlength')
+    # windowed complex exponentials, [sample, frequency]
+    kernel = window[:, None] * np.exp(-2j * np.pi * np.arange(nfft)[:, None]
+                                      * bins[None, :] / nfft)
+    ffts = np.dot(segs, kernel)
+    if detrend:
+        # removing the mean before windowing is the same as
+        # subtracting mean * DFT of the window
+        ffts -= segs.mean(axis=-1)[..., None] * kernel.sum(axis=0)
+    scale = onesided_factor(nfft)[bins] / (sample_rate *
+                                           (window ** 2).sum())
+    return ffts, np.fft.rfftfreq(nfft, 1. / sample_rate)[bins], scale
+
+
+def csd_matrix(data, sample_rate, fftlength, overlap=0, window='hann',
+               average=True, frequencies=None):
+    """
+    Cross spectral density between every pair of channels. Each
+    channel is FFT'd once per segment and CSDs are built from
+    outer products of the FFTs.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        [channel, sample] array of real data
+    sample_rate : `float`
+        sample rate of data in Hz
+    fftlength : `float`
+        length of each segment in seconds
+    overlap : `float`, optional, default=0
+        overlap between segments in seconds
+    window : `str`, `numpy.ndarray`, optional, default='hann'
+        window to apply to each segment
+    average : `bool`, optional, default=True
+        average over segments. If False the full
+        [segment, frequency, channel, channel] tensor is returned.
+    frequencies : `list`, optional
+        only calculate CSDs at these FFT bins (see
+        :func:`narrowband_ffts`). Defaults to all frequencies.
+
+    Returns
+    -------
+    csd : `numpy.ndarray`
+        [frequency, channel, channel] array of cross spectral densities
+        (or [segment, frequency, channel, channel] if `average` is False).
+        ``csd[..., i, j]`` is the CSD of channel i with channel j, i.e.
+        :math:`\langle \tilde x_i^* \tilde x_j \\rangle`, which is the
+        convention used by `scipy.signal.csd`.
+    frequencies : `numpy.ndarray`
+        frequency array
+    nsegs : `int`
+        number of segments that went into the estimate
+    """
+    data = np.atleast_2d(data)
+    if frequencies is None:
+        ffts, frequencies, scale = windowed_ffts(data, sample_rate,
+                                                 fftlength, overlap=overlap,
+                                                 window=window)
+    else:
+        ffts, frequencies, scale = narrowband_ffts(data, sample_rate,
+                                                   fftlength, frequencies,
+                                                   overlap=overlap,
+                                                   window=window)
+    csd, nsegs = csd_from_ffts(ffts, scale, average=average)
+    return csd, frequencies, nsegs
+
+
+def csd_from_ffts(ffts, scale, average=True):
+    """
+    Cross spectral densities between every pair of channels from
+    FFTs that have already been taken (e.g. by :func:`windowed_ffts`
+    or from a :class:`seispy.utils.stftcache.STFTCache`).
+
+    Parameters
+    ----------
+    ffts : `numpy.ndarray`
+        [channel, segment, frequency] array of FFTs
+    scale : `numpy.ndarray`
+        scale factor for each frequency
+    average : `bool`, optional, default=True
+        average over segments
+
+    Returns
+    -------
+    csd : `numpy.ndarray`
+        [frequency, channel, channel] array of cross spectral densities
+        (or [segment, frequency, channel, channel] if `average` is False)
+    nsegs : `int`
+        number of segments
+    """
+    nchans, nsegs, nfreqs = ffts.shape
+    if average:
+        csd = np.zeros((nfreqs, nchans, nchans), dtype=complex)
+        # one matrix product per frequency sums over segments
+        for ii in range(nfreqs):
+            xf = ffts[:, :, ii]
+            csd[ii] = np.dot(np.conj(xf), xf.T)
+        csd *= (scale / nsegs)[:, None, None]
+    else:
+        # [segment, frequency, channel]
+        xf = np.rollaxis(ffts, 0, 3)
+        csd = np.conj(xf)[..., :, None] * xf[..., None, :]
+        csd *= scale[None, :, None, None]
+    return csd, nsegs
+
+
+class CSDMatrix(object):
+    """
+    Cross spectral density matrix for a set of channels,
+    indexed by channel keys (e.g. ``(station, channel)`` tuples).
+    """
+    def __init__(self, value, frequencies, channels, nsegs=1):
+        super(CSDMatrix, self).__init__()
+        self.value = value
+        self.frequencies = np.asarray(frequencies)
+        self.channels = list(channels)
+        self.nsegs = nsegs
+        self._index = dict((chan, ii) for ii, chan in enumerate(self.channels))
+
+    @classmethod
+    def from_arrays(cls, data, channels, sample_rate, fftlength, overlap=0,
+                    window='hann', average=True, frequencies=None):
+        """
+        Calculate CSD matrix from [channel, sample] array
+
+        Parameters
+        ----------
+        data : `numpy.ndarray`
+            [channel, sample] array of real data
+        channels : `list`
+            list of keys, one for each row of `data`
+        sample_rate : `float`
+            sample rate of data in Hz
+        fftlength : `float`
+            length of each segment in seconds
+        overlap : `float`, optional, default=0
+            overlap between segments in seconds
+        window : `str`, optional, default='hann'
+            window to apply to each segment
+        average : `bool`, optional, default=True
+            average over segments
+        frequencies : `list`, optional
+            only calculate CSDs at these FFT bins. Defaults to
+            all frequencies.
+
+        Returns
+        -------
+        csdm : :class:`seispy.utils.spectral.CSDMatrix`
+            cross spectral density matrix
+        """
+        if len(channels) != np.atleast_2d(data).shape[0]:
+            raise ValueError('Need one channel key for each row of data')
+        csd, frequencies, nsegs = csd_matrix(data, sample_rate, fftlength,
+                                             overlap=overlap, window=window,
+                                             average=average,
+                                             frequencies=frequencies)
+        return cls(csd, frequencies, channels, nsegs=nsegs)
+
+    def index(self, chan):
+        """
+        index of channel `chan` in matrix
+        """
+        try:
+            return self._index[chan]
+        except KeyError:
+            raise KeyError('%s is not in this CSD matrix' % str(chan))
+
+    def csd(self, chan1, chan2):
+        """
+        CSD between two channels
+
+        Parameters
+        ----------
+        chan1 : key
+            first channel
+        chan2 : key
+            second channel
+
+        Returns
+        -------
+        csd : `numpy.ndarray`
+            CSD of `chan1` and `chan2` as a function of frequency
+            (and segment, if the matrix was not averaged)
+        """
+        return self.value[..., self.index(chan1), self.index(chan2)]
@@ -0,0 +1,227 @@
+from __future__ import division
+import os
+import glob
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from .spectral import windowed_ffts, narrowband_ffts
+
+
+class STFTCache(object):
+    """
+    Cache for windowed FFTs (short-time Fourier transforms) of
+    individual channels.
+
+    Coherence, PSDs and recovery all segment, window and FFT the
+    same channels. Results are kept in an in-memory LRU keyed by the
+    channel, its time span and sample rate, and the FFT parameters,
+    so that e.g. recovering maps again on a different sky grid or
+    with different velocities reuses the FFTs instead of going back
+    to the time series. When `spill_dir` is set, entries evicted from
+    memory are written there as ``.npy`` files and read back as
+    `numpy.memmap` arrays.
+
+    Channels are identified by their `channel` name when they have
+    one, otherwise by a hash of their data.
+
+    >>> cache = STFTCache(spill_dir='./stft_cache')
+    >>> csdm = arr.csd_matrix(stft_cache=cache)
+    >>> ffts, freqs, scale = cache(arr['DEAD']['HHZ'], 2, overlap=1)
+    """
+    def __init__(self, max_bytes=2**30, spill_dir=None):
+        super(STFTCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        if spill_dir is not None and not os.path.isdir(spill_dir):
+            os.makedirs(spill_dir)
+
+    @staticmethod
+    def key(trace, fftlength, overlap=0, window='hann', frequencies=None,
+            tag='stft'):
+        """
+        hash of everything an STFT depends on
+
+        Parameters
+        ----------
+        trace : :class:`seispy.trace.Trace`
+            data
+        fftlength : `float`
+            length of segments in seconds
+        overlap : `float`, optional, default=0
+            overlap between segments in seconds
+        window : `str`, `numpy.ndarray`, optional, default='hann'
+            window
+        frequencies : `list`, optional
+            frequencies the STFT was evaluated at (all by default)
+        tag : `str`, optional, default='stft'
+            kind of transform, for consumers with their own
+            normalization
+
+        Returns
+        -------
+        key : `str`
+            sha1 hex digest
+        """
+        h = hashlib.sha1(str(tag).encode())
+        if trace.channel is not None:
+            h.update(str(trace.channel).encode())
+        else:
+            h.update(np.ascontiguousarray(trace.value).tostring())
+        h.update(np.array([trace.t0.value, trace.size,
+                           trace.sample_rate.value, fftlength,
+                           overlap]).tostring())
+        if isinstance(window, str):
+            h.update(window.encode())
+        else:
+            h.update(np.ascontiguousarray(window, dtype=float).tostring())
+        if frequencies is not None:
+            h.update(np.ascontiguousarray(frequencies,
+                                          dtype=float).tostring())
+        return h.hexdigest()
+
+    def __call__(self, trace, fftlength, overlap=0, window='hann',
+            frequencies=None):
+        """
+        cached :func:`seispy.utils.spectral.windowed_ffts` of a trace
+        (or :func:`seispy.utils.spectral.narrowband_ffts` if
+        `frequencies` is given)
+
+        Returns
+        -------
+        ffts : `numpy.ndarray`
+            [segment, frequency] array of FFTs
+        frequencies : `numpy.ndarray`
+            frequencies of FFT bins
+        scale : `numpy.ndarray`
+            scale factor that turns ``conj(X) * Y`` into a one-sided
+            cross spectral density
+        """
+        key = self.key(trace, fftlength, overlap=overlap, window=window,
+                       frequencies=frequencies)
+
+        def compute():
+            if frequencies is None:
+                return windowed_ffts(trace.value, trace.sample_rate.value,
+                                     fftlength, overlap=overlap,
+                                     window=window)
+            return narrowband_ffts(trace.value, trace.sample_rate.value,
+                                   fftlength, frequencies, overlap=overlap,
+                                   window=window)
+        return self.cached(key, compute)
+
+    def psd(self, trace, fftlength, overlap=0, window='hann'):
+        """
+        one-sided power spectral density from cached FFTs
+
+        Returns
+        -------
+        psd : `numpy.ndarray`
+            power spectral density
+        frequencies : `numpy.ndarray`
+            frequencies
+        """
+        ffts, frequencies, scale = self(trace, fftlength, overlap=overlap,
+                                        window=window)
+        return np.mean(np.abs(ffts)**2, axis=0) * scale, frequencies
+
+    def cached(self, key, compute):
+        """
+        get `key` from the cache, or call `compute` and cache its
+        result (a tuple of arrays)
+        """
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = tuple(compute())
+        self.put(key, result)
+        return result
+
+    def get(self, key):
+        """
+        get arrays from memory, then disk. Returns None if they
+        aren't cached.
+        """
+        try:
+            result = self._cache.pop(key)
+            # re-insert to mark as most recently used
+            self._cache[key] = result
+            return result
+        except KeyError:
+            pass
+        result = self._read(key)
+        if result is not None:
+            self._store(key, result)
+        return result
+
+    def put(self, key, result):
+        """
+        add arrays to cache
+        """
+        for arr in result:
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+        self._store(key, result)
+
+    def clear(self):
+        """
+        empty in-memory cache. Spilled files are left alone.
+        """
+        self._cache.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    @staticmethod
+    def _nbytes(result):
+        # memmapped arrays don't take up memory
+        return sum([arr.nbytes for arr in result if isinstance(arr,
+                    np.ndarray) and not isinstance(arr, np.memmap)])
+
+    def _store(self, key, result):
+        nbytes = self._nbytes(result)
+        if nbytes > self.max_bytes:
+            self._spill(key, result)
+            return
+        self._cache[key] = result
+        self.nbytes += nbytes
+        # evict least recently used
+        while self.nbytes > self.max_bytes:
+            old_key, old = self._cache.popitem(last=False)
+            self.nbytes -= self._nbytes(old)
+            self._spill(old_key, old)
+
+    def _fname(self, key, ii):
+        return os.path.join(self.spill_dir, '%s_%d.npy' % (key, ii))
+
+    def _spill(self, key, result):
+        if self.spill_dir is None:
+            return
+        if os.path.isfile(self._fname(key, 0)):
+            return
+        for ii, arr in enumerate(result):
+            # write to temporary file and move it so that
+            # nobody sees a partial file
+            fd, tmpname = tempfile.mkstemp(dir=self.spill_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(arr))
+            os.rename(tmpname, self._fname(key, ii))
+
+    def _read(self, key):
+        if self.spill_dir is None:
+            return None
+        nfiles = len(glob.glob(os.path.join(self.spill_dir, key + '_*.npy')))
+        if nfiles == 0:
+            return None
+        return tuple(np.load(self._fname(key, ii), mmap_mode='r') for ii in
+                     range(nfiles))
@@ -62,10 +62,112 @@ def calc_travel_time(delta_vec, OMEGA, v):
     if not(delta_vec.size == omg_shape[1]):
         raise ValueError('Delta vec should have same dimension as columns of\
         Omega vec')
-    dt = np.array([_calc_travel_time(delta_vec, OMEGA[ii],v) for ii in
-        range(omg_shape[0])])
+    dt = np.dot(OMEGA, delta_vec.ravel()) / v
     return dt
 
+def sky_directions(thetas, phis):
+    """
+    Unit vectors for every direction on a theta/phi grid.
+
+    Parameters
+    ----------
+    thetas : `numpy.ndarray`
+        polar angles (from north pole) in radians
+    phis : `numpy.ndarray`
+        azimuthal angles in radians
+
+    Returns
+    -------
+    OMEGA : `numpy.ndarray`
+        (n_phi * n_theta) x 3 matrix of sky direction unit vectors,
+        flattened from a ``np.meshgrid(thetas, phis)`` grid
+    omg_shape : `tuple`
+        (n_phi, n_theta) shape of the grid
+    """
+    THETAS, PHIS = np.meshgrid(thetas, phis)
+    OMEGA = np.vstack(((np.sin(THETAS)*np.cos(PHIS)).flatten(),
+        (np.sin(THETAS)*np.sin(PHIS)).flatten(),
+        np.cos(THETAS).flatten())).T
+    return OMEGA, THETAS.shape
+
+def station_pairs(stations):
+    """
+    every pair of stations (including a station with itself),
+    without double counting
+
+    Parameters
+    ----------
+    stations : `list`
+        station names
+
+    Returns
+    -------
+    pairs : `list`
+        list of (station1, station2) tuples
+    """
+    stations = list(stations)
+    return [(station1, station2) for ii, station1 in enumerate(stations)
+            for station2 in stations[ii:]]
+
+def baseline_vectors(station_locs, pairs=None):
+    """
+    separation vectors (first station minus second station)
+    for pairs of stations.
+
+    Parameters
+    ----------
+    station_locs : `dict`
+        station locations
+    pairs : `list`, optional
+        list of (station1, station2) tuples. Defaults to
+        :func:`station_pairs` of all stations.
+
+    Returns
+    -------
+    baselines : `numpy.ndarray`
+        n_pairs x 3 matrix of separation vectors
+    pairs : `list`
+        list of (station1, station2) tuples, one for each row
+    """
+    if pairs is None:
+        pairs = station_pairs(station_locs.keys())
+    locs = dict((key, np.asarray(station_locs[key], dtype=float)) for key in
+            station_locs.keys())
+    baselines = np.array([locs[s1] - locs[s2] for s1, s2 in pairs])
+    return baselines.reshape((len(pairs), 3)), pairs
+
+def travel_time_tensor(station_locs, OMEGA, v, pairs=None):
+    """
+    Travel time across every baseline for every sky direction,
+    computed with a single matrix product.
+
+    ``dt[ii]`` is what :func:`calc_travel_time` returns for
+    the separation vector of ``pairs[ii]``, so the directional
+    orfs can take slices of this through their `dt` argument.
+
+    Parameters
+    ----------
+    station_locs : `dict`
+        station locations
+    OMEGA : `numpy.ndarray`
+        m x 3 matrix of sky direction unit vectors
+    v : `float`
+        velocity of seismic wave
+    pairs : `list`, optional
+        list of (station1, station2) tuples. Defaults to
+        :func:`station_pairs` of all stations.
+
+    Returns
+    -------
+    dt : `numpy.ndarray`
+        [baseline, direction] array of travel times
+    pairs : `list`
+        list of (station1, station2) tuples, one for each baseline
+    """
+    baselines, pairs = baseline_vectors(station_locs, pairs=pairs)
+    dt = np.dot(baselines, np.asarray(OMEGA).T) / v
+    return dt, pairs
+
 
 def get_pdf_from_map(M):
     """